@@ -0,0 +1,112 @@
+"""
+点の描画方式の比較(Canvasに点を1つずつ追加 vs 1枚の画像に描画)
+
+使い方:
+    python benchmarks/bench_render.py 1000 10000 50000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from PIL import Image
+
+from colors import get_colors
+from overlay import render_points
+
+
+def rss() -> Optional[int]:
+    """
+    Returns:
+        Optional[int]: 現在の常駐メモリ量(バイト、取得できない環境ではNone)
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def make_points(n: int, size: int, teams: int=16) -> List[Tuple[float, float, int]]:
+    """
+    ランダムな降下地点(表示座標とチームID)
+    """
+    rng = random.Random(0)
+    return [(rng.uniform(0, size), rng.uniform(0, size), rng.randrange(teams)) for _ in range(n)]
+
+
+def bench_raster(points: List[Tuple[float, float, int]], size: int, team_colors: Dict[int, str]) -> dict:
+    """
+    画像への描画とマップ画像への合成
+    """
+    base = Image.new('RGBA', (size, size), (128, 128, 128, 255))
+    before = rss()
+    start = time.perf_counter()
+    overlay = render_points(points, (size, size), team_colors)
+    composed = Image.alpha_composite(base, overlay)
+    seconds = time.perf_counter() - start
+    after = rss()
+    return {
+        'seconds': seconds,
+        'items': 1,
+        'image_bytes': len(overlay.getbands()) * size * size + len(composed.getbands()) * size * size,
+        'rss_delta': None if before is None else after - before,
+    }
+
+
+def bench_canvas(points: List[Tuple[float, float, int]], size: int, team_colors: Dict[int, str], r: int=5) -> Optional[dict]:
+    """
+    Canvasへのcreate_ovalによる描画(画面がない環境ではNone)
+    """
+    import tkinter as tk
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        return None
+    canvas = tk.Canvas(root, width=size, height=size)
+    canvas.pack()
+    root.update()
+    before = rss()
+    start = time.perf_counter()
+    for x, y, team_id in points:
+        canvas.create_oval(x-r, y-r, x+r, y+r, fill=team_colors[team_id])
+    root.update()
+    seconds = time.perf_counter() - start
+    after = rss()
+    items = len(canvas.find_all())
+    root.destroy()
+    return {
+        'seconds': seconds,
+        'items': items,
+        'image_bytes': 0,
+        'rss_delta': None if before is None else after - before,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='点の描画方式の比較')
+    parser.add_argument('counts', nargs='*', type=int, default=[1000, 10000, 50000], help='点の数')
+    parser.add_argument('--size', type=int, default=900, help='表示サイズ(正方形の一辺)')
+    args = parser.parse_args()
+
+    team_colors = {i: c for i, c in enumerate(get_colors())}
+    print(f'{"points":>8} {"renderer":>8} {"seconds":>10} {"items":>8} {"image MB":>9} {"rss MB":>8}')
+    for n in args.counts:
+        points = make_points(n, args.size)
+        for name, bench in (('raster', bench_raster), ('canvas', bench_canvas)):
+            result = bench(points, args.size, team_colors)
+            if result is None:
+                print(f'{n:>8} {name:>8} {"(no display)":>10}')
+                continue
+            rss_mb = '-' if result['rss_delta'] is None else f'{result["rss_delta"] / 2**20:.1f}'
+            print(f'{n:>8} {name:>8} {result["seconds"]:>10.4f} {result["items"]:>8} '
+                  f'{result["image_bytes"] / 2**20:>9.1f} {rss_mb:>8}')
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,77 @@
+"""
+試合データの読み込み速度の比較(旧形式のpickle vs .lmk)
+
+使い方:
+    python benchmarks/bench_storage.py --matches 5000
+"""
+import argparse
+import datetime
+import pickle
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from match import Match
+from recordio import EXT, load_legacy_match, load_match, read_matches, save_match, write_matches
+
+
+def make_matches(n: int) -> list:
+    """
+    ランダムな試合データ
+    """
+    rng = random.Random(0)
+    return [Match(f'team{i % 16}',
+                  'scrim',
+                  'Erangel',
+                  datetime.date(2023, 1, 1) + datetime.timedelta(days=i // 64),
+                  i % 47 + 1,
+                  [{'x': rng.randrange(900), 'y': rng.randrange(900), 'w': 900, 'h': 900} for _ in range(4)])
+            for i in range(n)]
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='試合データの読み込み速度の比較')
+    parser.add_argument('--matches', type=int, default=5000, help='試合数')
+    args = parser.parse_args()
+
+    matches = make_matches(args.matches)
+    with tempfile.TemporaryDirectory() as d:
+        d = Path(d)
+        pkl_paths = []
+        lmk_paths = []
+        for i, m in enumerate(matches):
+            pkl_paths.append(d / f'{i}.pkl')
+            with open(pkl_paths[-1], 'wb') as f:
+                pickle.dump(m, f)
+            lmk_paths.append(d / f'{i}{EXT}')
+            save_match(lmk_paths[-1], m)
+        stream = d / f'all{EXT}'
+        with open(stream, 'wb') as f:
+            write_matches(f, matches)
+
+        def read_stream() -> None:
+            with open(stream, 'rb') as f:
+                for _ in read_matches(f):
+                    pass
+
+        results = {
+            'pickle (1ファイル1試合)': timed(lambda: [load_legacy_match(p) for p in pkl_paths]),
+            f'{EXT} (1ファイル1試合)': timed(lambda: [load_match(p) for p in lmk_paths]),
+            f'{EXT} (1ファイルに全試合)': timed(read_stream),
+        }
+        for name, seconds in results.items():
+            print(f'{name}: {seconds:.3f}秒 ({args.matches / seconds:,.0f}試合/秒)')
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
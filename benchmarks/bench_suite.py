@@ -0,0 +1,150 @@
+"""
+合成データでの保存・検索・描画の処理時間の計測(画面なし)
+
+結果はJSONに書き出し、--baselineで以前の結果を指定すると比(今回/前回)も表示する
+
+使い方:
+    python benchmarks/bench_suite.py --teams 16 --scrims 4 --out results.json [--baseline old.json]
+"""
+import argparse
+import datetime
+import json
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from catalog import Catalog
+from colors import get_colors
+from heatmap import render_heatmap
+from make_dataset import SIZE, make_dataset
+from overlay import render_points
+from pointstore import PointStore
+from query import QueryEngine, latest_per_team
+from recordio import load_match
+
+
+def timed(func: Callable[[], object], repeat: int=1) -> dict:
+    """
+    Args:
+        func (Callable[[], object]): 計測する処理
+        repeat (int): 繰り返す回数(最小値を採る)
+
+    Returns:
+        dict: {'seconds': 処理時間}
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return {'seconds': best}
+
+
+def run(data: Path, cache: Path, map_name: str, repeat: int) -> Dict[str, dict]:
+    """
+    Args:
+        data (Path): 合成データ(teams/を含むディレクトリ)
+        cache (Path): 索引等の生成データ保存用ディレクトリ(空のもの)
+        map_name (str): 検索・描画に使うマップ名
+        repeat (int): 繰り返す回数
+
+    Returns:
+        Dict[str, dict]: 計測項目名 -> 結果
+    """
+    teams = data / 'teams'
+    cache.mkdir()
+    results = {}
+
+    # 索引の作成(全チームディレクトリの走査)と、変更がない場合の確認
+    catalog = Catalog(teams, cache / 'catalog.sqlite3')
+    results['catalog_scan_cold'] = timed(catalog.sync)
+    results['catalog_scan_warm'] = timed(catalog.sync, repeat)
+
+    # 絞り込み(マップ全体とチーム・期間・ラウンド指定)
+    records = catalog.find(map_name)
+    team_names = catalog.team_names()[:4]
+    start = min(record.date for record in records)
+    results['filter_map'] = dict(timed(lambda: catalog.find(map_name), repeat), matches=len(records))
+    results['filter_teams_dates'] = timed(lambda: catalog.find(map_name,
+                                                               teams=team_names,
+                                                               start=start,
+                                                               end=start + datetime.timedelta(days=30),
+                                                               rcount=1), repeat)
+
+    # 各チームの最新の試合の選択
+    results['latest_per_team_last5'] = timed(lambda: latest_per_team(records, 5, 'last'), repeat)
+    results['latest_per_team_window7'] = timed(lambda: latest_per_team(records, 7, 'window'), repeat)
+    results['latest_per_team_round3'] = timed(lambda: latest_per_team(records, 3, 'round'), repeat)
+
+    # 試合ファイルの読み込み
+    results['load_matches'] = dict(timed(lambda: [load_match(record.path) for record in records], repeat),
+                                   matches=len(records))
+    catalog.close()
+
+    # 列データの作成と、作成済みの列データからの検索
+    points = PointStore(cache / 'points')
+    results['pointstore_build'] = timed(lambda: points.update(map_name, records))
+    points.close()
+    engine = QueryEngine.open(teams, cache)
+    result = engine.run(map_name, mode='last', num=10)
+    results['query_last10'] = dict(timed(lambda: engine.run(map_name, mode='last', num=10), repeat), points=len(result))
+    results['query_all'] = timed(lambda: engine.run(map_name), repeat)
+    engine.close()
+
+    # 点の描画(画像)・ヒートマップ
+    pixels = result.pixels(SIZE, SIZE)
+    colors = {team_id: get_colors()[team_id % len(get_colors())] for team_id in range(len(result.teams))}
+    results['render_points'] = dict(timed(lambda: render_points(pixels, (SIZE, SIZE), colors), repeat), points=len(pixels))
+    results['render_heatmap'] = timed(lambda: render_heatmap(pixels, (SIZE, SIZE)), repeat)
+    results['render_team_heatmap'] = timed(lambda: render_heatmap(pixels, (SIZE, SIZE), colors), repeat)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='合成データでの処理時間の計測')
+    parser.add_argument('--teams', type=int, default=16, help='チーム数')
+    parser.add_argument('--scrims', type=int, default=4, help='スクリム数')
+    parser.add_argument('--maps', nargs='+', default=['Erangel', 'Miramar'], help='マップ名')
+    parser.add_argument('--repeat', type=int, default=3, help='繰り返す回数(最小値を採る)')
+    parser.add_argument('--data', type=Path, help='作成済みの合成データ(省略した場合は一時ディレクトリに作成)')
+    parser.add_argument('--out', type=Path, default=Path('bench_results.json'), help='結果の書き出し先')
+    parser.add_argument('--baseline', type=Path, help='比較する以前の結果')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data = args.data
+        if data is None:
+            data = Path(tmp) / 'data'
+            start = time.perf_counter()
+            n = make_dataset(data, args.teams, args.scrims, args.maps)
+            print(f'{n}試合を作成しました({time.perf_counter() - start:.1f}秒)')
+        # 前回の索引・列データを使わないよう、生成データは毎回一時ディレクトリに作る
+        results = run(data, Path(tmp) / 'cache', args.maps[0], args.repeat)
+
+    report = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'dataset': {'teams': args.teams, 'scrims': args.scrims, 'maps': args.maps, 'data': None if args.data is None else str(args.data)},
+        'results': results,
+    }
+    args.out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    baseline = {}
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text(encoding='utf-8'))['results']
+    for name, result in results.items():
+        line = f'{name:<28} {result["seconds"]:>10.4f}秒'
+        if name in baseline:
+            line += f'  x{result["seconds"] / baseline[name]["seconds"]:.2f}'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
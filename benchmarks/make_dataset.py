@@ -0,0 +1,83 @@
+"""
+ベンチマーク用の合成データ(teams/ と同じファイル構成)の作成
+
+チーム数 × スクリム数 × マップ数 × 47ラウンド の試合ファイルを作る。
+各チームにはマップごとによく降りる場所をいくつか決めておき、その周辺に4点ずつ降ろす
+
+使い方:
+    python benchmarks/make_dataset.py out_dir --teams 16 --scrims 4 --maps Erangel Miramar
+"""
+import argparse
+import datetime
+import random
+import sys
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from match import Match
+from recordio import EXT, save_match
+
+# 記録画面と同じラウンド数・表示サイズ
+ROUNDS = 47
+SIZE = 900
+
+
+def make_dataset(out: Path,
+                 teams: int=16,
+                 scrims: int=4,
+                 maps: List[str]=('Erangel', 'Miramar'),
+                 start: datetime.date=datetime.date(2023, 1, 1),
+                 seed: int=0) -> int:
+    """
+    Args:
+        out (Path): 作成先(この下にteams/を作る)
+        teams (int): チーム数
+        scrims (int): スクリム数
+        maps (List[str]): マップ名一覧
+        start (datetime.date): 最初の試合の日付
+        seed (int): 乱数のシード
+
+    Returns:
+        int: 作成した試合ファイル数
+    """
+    rng = random.Random(seed)
+    n = 0
+    for t in range(teams):
+        team = f'team{t:03d}'
+        team_dir = out / 'teams' / team
+        team_dir.mkdir(parents=True, exist_ok=True)
+        for map_name in maps:
+            # よく降りる場所
+            spots = [(rng.uniform(0.1, 0.9), rng.uniform(0.1, 0.9)) for _ in range(rng.randint(2, 4))]
+            for s in range(scrims):
+                match_name = f'scrim{s:03d}'
+                for rcount in range(1, ROUNDS + 1):
+                    date = start + datetime.timedelta(days=(s * ROUNDS + rcount - 1) // 4)
+                    sx, sy = rng.choice(spots)
+                    pts = [{'x': min(max(rng.gauss(sx, 0.01), 0), 1) * SIZE,
+                            'y': min(max(rng.gauss(sy, 0.01), 0), 1) * SIZE,
+                            'w': SIZE,
+                            'h': SIZE} for _ in range(4)]
+                    m = Match(team, match_name, map_name, date, rcount, pts)
+                    save_match(team_dir / f'{team}_{match_name}_{map_name}_{date}_R{rcount}{EXT}', m, fsync=False)
+                    n += 1
+    return n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='ベンチマーク用の合成データの作成')
+    parser.add_argument('out', type=Path, help='作成先')
+    parser.add_argument('--teams', type=int, default=16, help='チーム数')
+    parser.add_argument('--scrims', type=int, default=4, help='スクリム数')
+    parser.add_argument('--maps', nargs='+', default=['Erangel', 'Miramar'], help='マップ名')
+    parser.add_argument('--seed', type=int, default=0, help='乱数のシード')
+    args = parser.parse_args()
+
+    n = make_dataset(args.out, args.teams, args.scrims, args.maps, seed=args.seed)
+    print(f'{n}試合を作成しました')
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
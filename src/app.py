@@ -1,25 +1,44 @@
+import time
+# 起動時間の計測の開始時刻(他のモジュールを読み込む前)
+STARTED = time.perf_counter()
 import datetime
-import pickle
+from array import array
 import shutil
+import threading
 import tkinter as tk
 from tkinter import Tk
 from tkinter import ttk
 from tkinter import messagebox
 from typing import List, Literal
 from pathlib import Path
-from PIL import Image, ImageTk
 
-from match import Match
+from match import Match, NGCHARAS
 from colors import get_colors
-
-# チーム名等に含められない文字
-NGCHARAS = ["_", ".", "/", "\\", '"', "'"]
+from catalog import Catalog, MatchRecord, parse_match_path
+from recordio import EXT, VERSION
+from migrate import find_legacy, migrate, upgrade
+from pointstore import PointStore
+from loader import ContestWorker, InspectWorker, LandmarkWorker, QueryWorker
+from landmarks import landmark_name
+from regionstats import RegionStatsStore
+from drift import WINDOW, DriftStore
+from profiler import Action, Profiler
+from journal import BatchCommit
+from staging import StagingArea
+from calibration import map_images
+
+# 閲覧画面の試合の選び方
+SELECT_MODES = {'最新N試合': 'last', '最新N日間': 'window', 'ラウンドごとの最新N試合': 'round', '全試合': 'all'}
+
+# 閲覧画面の表示形式
+VIEW_STYLES = {'点': 'point', '点(画像)': 'raster', 'ヒートマップ': 'heatmap', 'ヒートマップ(チーム別)': 'team_heatmap', 'ランドマーク': 'landmark'}
 
 
 class Application(tk.Frame):
     teams = Path('teams')  # チームデータ保存用ディレクトリ
     maps = Path('maps')  # マップ画像ディレクトリ
     tmp = Path('tmp')  # ランドマークデータ一時保存用ディレクトリ
+    cache = Path('cache')  # 索引等の生成データ保存用ディレクトリ
 
     def __init__(self, root: Tk, w: int, h: int) -> None:
         super().__init__(root, width=w, height=h)
@@ -30,9 +49,70 @@ class Application(tk.Frame):
             exit(1)
         self.teams.mkdir(exist_ok=True)
         self.tmp.mkdir(exist_ok=True)
+        self.cache.mkdir(exist_ok=True)
+
+        # 画面操作ごとの処理時間の計測(環境変数LMK_PROFILE=1で有効)
+        self.profiler = Profiler(self.cache / 'profile.log')
+        # 起動にかかった時間(モジュールの読み込みから起動画面の表示まで)
+        startup = self.profiler.begin('startup', STARTED)
+        startup.lap('imports')
+
+        # 旧形式(pickle)の試合データが残っていれば変換し、古い版の試合ファイルを書き直す(確認済みなら探さない)
+        format_file = self.cache / 'format'
+        if not format_file.exists() or format_file.read_text() != str(VERSION):
+            done = True
+            if next(find_legacy([self.teams, self.tmp]), None) is not None:
+                ret = messagebox.askyesno('確認', '旧形式の試合データがあります\n新しい形式に変換しますか？\n(変換しない場合は表示されません)')
+                if ret:
+                    migrate([self.teams, self.tmp])
+                    shutil.rmtree(self.cache / 'points', ignore_errors=True)
+                else:
+                    done = False
+            if upgrade([self.teams]):
+                # mtimeが変わるので列データは作り直す
+                shutil.rmtree(self.cache / 'points', ignore_errors=True)
+            if done:
+                format_file.write_text(str(VERSION))
+        startup.lap('format')
+
+        # 試合ファイルの索引
+        self.catalog = Catalog(self.teams, self.cache / 'catalog.sqlite3')
+        # マップごとの降下地点の列データ
+        self.points = PointStore(self.cache / 'points')
+        # 閲覧画面の検索(バックグラウンド実行)
+        self.view_worker = QueryWorker(self.teams, self.cache)
+        self.view_poll = None
+        # マップ画像のデコード・リサイズ結果(PILの読み込みを起動後に回すため初めて使うときに作る)
+        self._map_cache = None
+        # マップ画像のファイル名一覧(maps/の更新時刻が変わるまで使い回す)
+        self._map_names = None
+        self._maps_mtime = None
+        # チーム・マップごとのよく降りる場所(バックグラウンドで求める)
+        self.landmark_worker = LandmarkWorker(self.teams, self.cache)
+        self.landmark_poll = None
+        # マップごとの降下被りの表(バックグラウンドで作る)
+        self.contest_worker = ContestWorker(self.teams, self.cache)
+        self.contest_poll = None
+        # チーム・マップごとの区画別の集計
+        self.region_stats = RegionStatsStore(self.cache / 'stats')
+        # チーム・マップごとの降下地点の推移
+        self.drift = DriftStore(self.cache / 'drift')
+        # 閲覧画面でクリックした位置の試合の検索(バックグラウンド実行)
+        self.inspect_worker = InspectWorker(self.teams, self.cache)
+        self.inspect_poll = None
+        startup.lap('stores')
+        # 仮記録(メモリ上に持ち、tmp/staging.journalに追記していく)
+        self.staging = StagingArea(self.tmp)
+        # 仮記録の確定保存(前回途中で止まっていればやり直す)
+        self.committer = BatchCommit(self.teams, self.cache / 'commit.journal', self.staging)
+        self.committer.recover(self.add_saved_matches)
+        startup.lap('staging')
 
         # 設定関連
         self.r = 5  # 描画する点の半径
+        self.poll_ms = 30  # バックグラウンド検索の結果を受け取る間隔(ミリ秒)
+        self.num_landmarks = 5  # チームごとに表示するランドマークの数
+        self.inspect_r = 15  # 閲覧画面でクリックした位置から検索する半径(ピクセル)
         self.font = ("", 15)
         self.default_map = 'Erangel.jpg'
 
@@ -43,6 +123,73 @@ class Application(tk.Frame):
         self.pack()
         self.pack_propagate(0)
         self.create_main_widgets()
+        startup.lap('widgets')
+
+        # 起動画面が表示されてから計測を終え、次の画面で使うものを読み込んでおく
+        self.after_idle(lambda: self.finish_startup(startup))
+
+
+    @property
+    def map_cache(self):
+        """
+        マップ画像のデコード・リサイズ結果(MapImageCache)
+        """
+        if self._map_cache is None:
+            from mapcache import MapImageCache
+            self._map_cache = MapImageCache(self.cache / 'maps')
+        return self._map_cache
+
+
+    def finish_startup(self, startup: Action) -> None:
+        """
+        起動画面を表示した後の処理(起動時間の記録と、マップ一覧・既定のマップのタイルの読み込み)
+
+        Args:
+            startup (Action): 起動時間の計測結果
+        """
+        startup.lap('first_frame')
+        self.profiler.end(startup)
+
+        action = self.profiler.begin('warm_up')
+        map_names = self.get_map_names()
+        action.lap('maps')
+        if not map_names:
+            self.profiler.end(action)
+            return
+        # タイルの作成・読み込みは画面を止めないようバックグラウンドで行う
+        # (map_cacheはここで作っておき、スレッドからは作らない)
+        threading.Thread(target=self.warm_up,
+                         args=(self.map_cache, self.maps / self.resolve_map_name(), self.map_side(), action),
+                         daemon=True).start()
+
+
+    def warm_up(self, map_cache, path: Path, side: int, action: Action) -> None:
+        """
+        既定のマップのタイルを読み込んでおく(バックグラウンドで実行)
+
+        Args:
+            map_cache (MapImageCache): マップ画像のキャッシュ
+            path (Path): マップ画像のパス
+            side (int): 拡大率1のときのマップの一辺
+            action (Action): 計測結果(読み込みを終えたときに記録する)
+        """
+        map_cache.warm(path, side)
+        action.lap('tiles')
+        self.profiler.end(action)
+
+
+    def get_map_names(self) -> List[str]:
+        """
+        マップ画像のファイル名一覧
+
+        Returns:
+            List[str]: ファイル名一覧(maps/の更新時刻が変わっていなければ前回の結果)
+        """
+        mtime_ns = self.maps.stat().st_mtime_ns
+        if self._map_names is None or mtime_ns != self._maps_mtime:
+            self._map_names = [m.name for m in map_images(self.maps)]
+            self._maps_mtime = mtime_ns
+        return self._map_names
 
 
     def create_main_widgets(self, frame: tk.Frame=None) -> None:
@@ -78,6 +225,14 @@ class Application(tk.Frame):
                                   command=self.root.destroy)
         edit_mode_btn.pack(side='left')
 
+        # 処理時間の計測結果
+        if self.profiler.enabled:
+            profile_btn = tk.Button(self.main_frame,
+                                    text='計測',
+                                    font=self.font,
+                                    command=self.show_profile)
+            profile_btn.pack(side='left')
+
         self.main_frame.pack()
 
 
@@ -91,8 +246,8 @@ class Application(tk.Frame):
             map_name (str): 表示するマップ名
             frame (tk.Frame): 消したいフレーム
         """
-        global map_img
-
+        action = self.profiler.begin('create_view_widgets')
+        opened = self.map_cache.opened
         if frame is not None:
             frame.destroy()
         view = tk.Frame(self)
@@ -102,12 +257,14 @@ class Application(tk.Frame):
 
         # マップ一覧
         map_list = tk.Listbox(left, exportselection=False, font=self.font)
-        for m in self.maps.iterdir():
-            if m.is_file():
-                map_list.insert(0, m.name)
+        for name in self.get_map_names():
+            map_list.insert(0, name)
         map_list.pack()
+        action.lap('maps')
 
         # 表示可能なスクリム一覧
+        self.catalog.sync()
+        action.lap('catalog')
         matches = self.get_match_names()
         match_list = tk.Listbox(left, selectmode="multiple", exportselection=False, font=self.font)
         if len(matches):
@@ -124,6 +281,7 @@ class Application(tk.Frame):
         team_list.pack()
 
         left.pack(side='left')
+        action.lap('lists')
 
         # 画面右側
         self.right = tk.Frame(view)
@@ -147,6 +305,14 @@ class Application(tk.Frame):
 
         self.show_team_list.pack()
 
+        # クリックした地点に降りた試合一覧
+        inspect_lbl = tk.Label(self.right_top,
+                               text="クリックした地点の試合",
+                               font=self.font)
+        inspect_lbl.pack()
+        self.inspect_list = tk.Listbox(self.right_top, font=self.font, height=6)
+        self.inspect_list.pack()
+
         self.right_top.pack()
 
         # 画面右下
@@ -197,14 +363,30 @@ class Application(tk.Frame):
         r_com.current(0)
         r_com.pack()
 
+        # 試合の選び方
+        select_mode_lbl = tk.Label(self.right_bottom,
+                                   text='試合の選び方')
+        select_mode_lbl.pack()
+        select_mode_com = ttk.Combobox(self.right_bottom, state='readonly', values=list(SELECT_MODES), font=self.font)
+        select_mode_com.current(0)
+        select_mode_com.pack()
+
         num_match_lbl = tk.Label(self.right_bottom,
-                                 text='表示する試合数:')
+                                 text='表示する試合数(日数):')
         num_match_lbl.pack()
 
         # 表示する試合数
         num_match = tk.Entry(self.right_bottom, font=self.font)
         num_match.pack()
 
+        # 表示形式
+        style_lbl = tk.Label(self.right_bottom,
+                             text='表示形式')
+        style_lbl.pack()
+        style_com = ttk.Combobox(self.right_bottom, state='readonly', values=list(VIEW_STYLES), font=self.font)
+        style_com.current(0)
+        style_com.pack()
+
         # 表示ボタン
         view_btn = tk.Button(self.right_bottom,
                              text='表示',
@@ -217,49 +399,98 @@ class Application(tk.Frame):
                                 datetime.datetime.date(datetime.datetime.strptime(f'{end_y_com.get()[:-1]}{end_m_com.get()[:-1]}{end_d_com.get()[:-1]}', '%Y%m%d')),
                                 r_com.get(),
                                 view,
-                                mode='last',
-                                num=num_match.get()))
+                                mode=SELECT_MODES[select_mode_com.get()],
+                                num=num_match.get(),
+                                style=VIEW_STYLES[style_com.get()]))
         view_btn.pack()
 
+        # 降下被りの表
+        contest_btn = tk.Button(self.right_bottom,
+                                text='降下被り',
+                                font=self.font,
+                                command=lambda: self.show_contests(self.get_select(map_list),
+                                                                   self.get_selects(team_list)))
+        contest_btn.pack()
+
+        # 区画別の集計
+        stats_btn = tk.Button(self.right_bottom,
+                              text='区画統計',
+                              font=self.font,
+                              command=lambda: self.show_region_stats(self.get_select(map_list),
+                                                                     self.get_selects(team_list),
+                                                                     None if r_com.get() == 'all' else int(r_com.get()[1:])))
+        stats_btn.pack()
+
+        # 降下地点の推移
+        drift_btn = tk.Button(self.right_bottom,
+                              text='推移',
+                              font=self.font,
+                              command=lambda: self.show_drift(self.get_select(map_list),
+                                                              self.get_selects(team_list)))
+        drift_btn.pack()
+
         # 閲覧モード終了
         end_btn = tk.Button(self.right_bottom,
                             text='終了',
                             font=self.font,
-                            command=lambda: self.create_main_widgets(view))
+                            command=lambda: self.close_view(view))
         end_btn.pack()
 
+        # 検索の進み具合
+        self.progress_lbl = tk.Label(self.right_bottom, text='', font=self.font)
+        self.progress_lbl.pack()
+
         self.right_bottom.pack()
 
         self.right.pack(side='right')
+        action.lap('widgets')
 
         # 画面中央
+        from mapview import MapView
         self.center = tk.Frame(view)
-        # マップの表示
-        if map_name is None:
-            if self.default_map in [m.name for m in self.maps.iterdir() if m.is_file()]:
-                map_img = Image.open(self.maps / self.default_map)
-            else:
-                map_img = Image.open(list(self.maps.iterdir())[0])
-        else:
-            map_img = Image.open(self.maps / map_name)
-        # 表示マップを最大化
-        center_width = self.winfo_width()
-        center_height = self.winfo_height()
-        canvas = tk.Canvas(self.center, width=center_width, height=center_height)
-        if center_width > center_height:
-            map_img = map_img.resize((center_height, center_height))
-        else:
-            map_img = map_img.resize((center_width, center_width))
-        map_img = ImageTk.PhotoImage(image=map_img)
-        canvas.create_image(0,
-                            0,
-                            image=map_img,
-                            tag='map',
-                            anchor=tk.NW)
-        canvas.pack(fill='both')
+        # マップの表示(表示領域に合わせて最大化、ホイールで拡大・右ドラッグで移動)
+        map_name = self.resolve_map_name(map_name)
+        side = self.map_side()
+        self.view_map = MapView(self.center, self.map_cache, self.winfo_width(), self.winfo_height())
+        self.view_map.set_map(self.maps / map_name, side)
+        self.view_map.pack(fill='both')
+        self.view_map.bind('<ButtonPress-1>', self.inspect_point)
+        # 表示の更新時はこのCanvasを使い回し、前回との差分だけ描き直す
+        self.view_canvas = self.view_map.canvas
+        self.view_state = {'map': map_name, 'size': (side, side), 'style': 'point', 'drawn': {}, 'colors': {}, 'pending': set()}
         self.center.pack(fill='both')
 
         view.pack()
+        action.lap('map')
+        action.count('map_files_opened', self.map_cache.opened - opened)
+        action.count('canvas_items', self.view_map.created)
+        self.profiler.end(action)
+
+
+    def resolve_map_name(self, map_name: str=None) -> str:
+        """
+        表示するマップ名を決める
+
+        Args:
+            map_name (str): 選択されたマップ名(未選択の場合はNone)
+
+        Returns:
+            str: マップ名(未選択の場合は既定のマップ、なければ先頭のマップ)
+        """
+        if map_name is not None:
+            return map_name
+        map_names = self.get_map_names()
+        if self.default_map in map_names:
+            return self.default_map
+        return map_names[0]
+
+
+    def map_side(self) -> int:
+        """
+        Returns:
+            int: 拡大率1のときのマップの一辺(表示領域に収まる正方形)
+        """
+        return min(self.winfo_width(), self.winfo_height())
 
 
     def get_selects(self, listbox: tk.Listbox) -> List[str]:
@@ -292,8 +523,9 @@ class Application(tk.Frame):
                   end: datetime.date,
                   rcount: str,
                   view: tk.Frame=None,
-                  mode: Literal['all', 'last']='all',
-                  num: str=None) -> None:
+                  mode: Literal['all', 'last', 'window', 'round']='all',
+                  num: str=None,
+                  style: Literal['point', 'raster', 'heatmap', 'team_heatmap', 'landmark']='point') -> None:
         """
         ランドマーク表示
 
@@ -305,134 +537,509 @@ class Application(tk.Frame):
             end (datetime.date): 終了日
             rcount (str): ラウンド数(R1, R2, ..., all)
             view (tk.Frame): 画像を載せるフレーム
-            mode (Literal['all', 'last']): 表示モード
-            num (str): 表示する試合数
+            mode (Literal['all', 'last', 'window', 'round']): 試合の選び方
+            num (str): 表示する試合数(modeが'window'の場合は日数、未入力の場合は全試合)
+            style (Literal['point', 'raster', 'heatmap', 'team_heatmap', 'landmark']): 表示形式
         """
-        global map_img
-
+        action = self.profiler.begin('show_data')
         try:
-            if num is not None:
+            if num:
                 num = int(num)
             else:
                 num = None
-        except:
+        except ValueError:
             messagebox.showerror("エラー", "半角数字で入力してください")
             return
+        if num is not None and num < 1:
+            messagebox.showerror("エラー", "1以上の数を入力してください")
+            return
 
-        # 表示一覧を空にする
-        if self.show_team_list is not None:
-            self.show_team_list.delete(0, tk.END)
+        map_name = self.resolve_map_name(map_name)
+        if teams == None:
+            teams = self.get_team_names()
+
+        # 表示したいスクリムかつチームかつ日付かつマップかつラウンドの試合と降下地点をバックグラウンドで検索し、
+        # 届いたものから描画する(前回の検索は取り消す)
+        self.view_job = {'map': map_name,
+                         'size': (self.map_side(), self.map_side()),
+                         'teams': teams,
+                         'style': style,
+                         'pixels': [],
+                         'action': action,
+                         'created': self.view_map.created,
+                         'opened': self.map_cache.opened}
+        action.lap('request')
+        self.view_worker.start(map_name=map_name,
+                               match_names=matches,
+                               teams=teams,
+                               start=start,
+                               end=end,
+                               rcount=None if rcount == "all" else int(rcount[1:]),
+                               mode=mode,
+                               num=num,
+                               action=action)
+        self.progress_lbl['text'] = '検索中...'
+        if self.view_poll is not None:
+            self.after_cancel(self.view_poll)
+        self.view_poll = self.after(self.poll_ms, self.poll_view)
 
-        if self.center is not None:
-            self.center.destroy()
+        view.pack()
 
-        self.center = tk.Frame(view)
 
-        if map_name is None:
-            if self.default_map in [m.name for m in self.maps.iterdir() if m.is_file()]:
-                map_name = self.default_map
-                map_img = Image.open(self.maps / self.default_map)
-            else:
-                map_name = list(self.maps.iterdir())[0]
-                map_img = Image.open(list(self.maps.iterdir())[0])
-        else:
-            map_img = Image.open(self.maps / map_name)
-        # 表示マップを最大化
-        center_width = self.winfo_width()
-        center_height = self.winfo_height()
-        canvas = tk.Canvas(self.center, width=center_width, height=center_height)
-        if center_width > center_height:
-            map_img = map_img.resize((center_height, center_height))
-        else:
-            map_img = map_img.resize((center_width, center_width))
-        map_img = ImageTk.PhotoImage(image=map_img)
-        canvas.create_image(0,
-                            0,
-                            image=map_img,
-                            tag='map',
-                            anchor=tk.NW)
-
-        # 表示する試合一覧を用意
-        if matches == None:
-            matches = self.get_match_names()
-        if teams == None:
-            teams = [t.name for t in self.teams.iterdir()]
-        view_matches = []
-        show_teams = []
-        for team in self.teams.iterdir():
-            # 表示したいチームの場合
-            if team.name in teams:
-                team_color = get_colors()[teams.index(team.name)%len(get_colors())]
-                for match in team.iterdir():
-                    # 表示したいスクリムかつ日付かつマップかつラウンドの場合
-                    if match.stem.split('_')[1] in matches and \
-                        (start <= datetime.datetime.date(datetime.datetime.strptime(match.stem.split('_')[3], '%Y-%m-%d')) <= end) and \
-                        Path(map_name).stem == match.stem.split('_')[2] and \
-                        (rcount == "all" or rcount == match.stem.split('_')[4]):
-                        view_matches.append({'name': match, 'c': team_color})
-                        if team.name not in show_teams:
-                            show_teams.append(team.name)
-
-        # 最新のみ表示の場合
-        if mode == 'last':
-            view_matches = self.get_last_match(view_matches, teams, num)
-
-        # 1試合ごとにプロット
-        for view_match in view_matches:
-            with open(view_match['name'], 'rb') as f:
-                m: Match = pickle.load(f)
-                for pt in m.pts:
-                    canvas.create_oval(pt["x"]*map_img.width()//pt["w"]-self.r, 
-                                       pt['y']*map_img.height()//pt["h"]-self.r,
-                                       pt["x"]*map_img.width()//pt["w"]+self.r,
-                                       pt['y']*map_img.height()//pt["h"]+self.r,
-                                       fill=view_match['c'])
-        canvas.pack(fill='both')
-        self.center.pack(fill='both')
+    def poll_view(self) -> None:
+        """
+        バックグラウンド検索の結果を受け取って描画
+        """
+        self.view_poll = None
+        job = self.view_job
+        for message in self.view_worker.poll():
+            kind = message[0]
+            if kind == 'progress':
+                self.progress_lbl['text'] = f'読み込み中 {message[1]}/{message[2]}'
+            elif kind == 'result':
+                with job['action'].phase('draw'):
+                    self.begin_view_update(job, *message[1:])
+            elif kind == 'points':
+                with job['action'].phase('draw'):
+                    self.draw_view_points(job, *message[1:])
+            elif kind == 'done':
+                with job['action'].phase('finish'):
+                    self.finish_view_update(job)
+                self.end_view_action(job)
+                return
+            elif kind == 'error':
+                self.end_view_action(job)
+                self.progress_lbl['text'] = ''
+                messagebox.showerror("エラー", f"検索に失敗しました\n{message[1]}")
+                return
+        self.view_poll = self.after(self.poll_ms, self.poll_view)
+
+
+    def begin_view_update(self,
+                          job: dict,
+                          records: List[MatchRecord],
+                          team_names: List[str],
+                          files: List[str],
+                          mtimes: List[int]) -> None:
+        """
+        検索結果の試合一覧を受け取り、表示チーム一覧と前回の表示との差分を反映
+
+        Args:
+            job (dict): 表示中の検索
+            records (List[MatchRecord]): 選択された試合一覧
+            team_names (List[str]): チームID -> チーム名
+            files (List[str]): 試合ファイルID -> パス
+            mtimes (List[int]): 試合ファイルID -> 読み込んだ時点の更新日時(ns)
+        """
+        teams = job['teams']
+        size = job['size']
+        job['colors'] = {team_id: get_colors()[teams.index(name)%len(get_colors())]
+                         for team_id, name in enumerate(team_names) if name in teams}
 
         # 表示チーム一覧を作成
-        for i, team_name in enumerate(show_teams):
+        job['shown'] = list(dict.fromkeys(record.team for record in records))
+        self.show_team_list.delete(0, tk.END)
+        for i, team_name in enumerate(job['shown']):
             self.show_team_list.insert(i, team_name)
             self.show_team_list.itemconfig(i, {'fg': get_colors()[teams.index(team_name)%len(get_colors())]})
 
-        view.pack()
+        # 1枚の画像として描く表示形式は全ての点が届いてから描く
+        if job['style'] != 'point':
+            return
 
+        canvas = self.view_canvas
+        state = self.view_state
+        # マップ・表示サイズ・表示形式が変わった場合は全て描き直す
+        if state['map'] != job['map'] or state['size'] != size or state['style'] != 'point':
+            self.view_map.clear()
+            self.view_map.set_map(self.maps / job['map'], size[0])
+            state.update({'map': job['map'], 'size': size, 'style': 'point', 'drawn': {}, 'colors': {}})
+
+        # 選択から外れた試合・上書きされた試合(IDは変わらず更新日時が変わる)の点と、
+        # 取り消した検索で描きかけだった試合の点を消す
+        file_ids = {f: i for i, f in enumerate(files)}
+        selected = {file_ids[str(record.path)] for record in records if str(record.path) in file_ids}
+        drawn = state['drawn']
+        for file_id in state.get('pending', set()):
+            canvas.delete(f'f{file_id}')
+            drawn.pop(file_id, None)
+        state['pending'] = set()
+        for file_id, mtime in list(drawn.items()):
+            if file_id not in selected or mtimes[file_id] != mtime:
+                canvas.delete(f'f{file_id}')
+                del drawn[file_id]
+        # チームの並びが変わって色が変わったチームは塗り直す
+        for team_id, color in job['colors'].items():
+            if state['colors'].get(team_id, color) != color:
+                canvas.itemconfig(f't{team_id}', fill=color)
+        state['colors'] = job['colors']
+        # 前回から表示済みで更新されていない試合の点は描かない
+        job['skip'] = set(drawn)
+        job['mtimes'] = mtimes
+
+
+    def draw_view_points(self, job: dict, xs: array, ys: array, team_ids: array, file_ids: array) -> None:
+        """
+        検索結果の座標の一部を受け取って描画
 
-    def get_last_match(self, matches: List[dict[Path, str]], teams: List[str], num: int=None) -> List[dict[Path, str]]:
+        Args:
+            job (dict): 表示中の検索
+            xs (array): 正規化したx座標
+            ys (array): 正規化したy座標
+            team_ids (array): チームID
+            file_ids (array): 試合ファイルID
         """
-        表示する試合リストの各チームの最新マッチのみを返す
+        w, h = job['size']
+        if job['style'] != 'point':
+            job['pixels'].extend((x * w, y * h, team_id) for x, y, team_id in zip(xs, ys, team_ids))
+            return
+
+        drawn = self.view_state['drawn']
+        for x, y, team_id, file_id in zip(xs, ys, team_ids, file_ids):
+            if file_id in job['skip']:
+                continue
+            self.view_map.create_oval(x*w,
+                                      y*h,
+                                      self.r,
+                                      fill=job['colors'][team_id],
+                                      tags=('pt', f'f{file_id}', f't{team_id}'))
+            drawn[file_id] = job['mtimes'][file_id]
+            self.view_state['pending'].add(file_id)
+
+
+    def finish_view_update(self, job: dict) -> None:
+        """
+        全ての座標を受け取った後の描画
 
         Args:
-            matches (List[dict[Path, str]]): 表示対象の試合一覧
-            teams (List[str]): 表示対象のチーム一覧
-            num (int): 表示する試合数
+            job (dict): 表示中の検索
+        """
+        self.progress_lbl['text'] = ''
+        if job['style'] == 'point':
+            self.view_state['pending'] = set()
+            return
 
-        Returns:
-            List[dict[Path, str]]: 表示対象の試合の最新一覧
+        # 点(画像)・ヒートマップは1枚の画像としてマップに重ねて表示
+        size = job['size']
+        if job['style'] == 'landmark':
+            self.draw_landmarks(job)
+            return
+        # PILを使う描画は起動時に読み込まない
+        from heatmap import render_heatmap
+        from overlay import render_points
+        if job['style'] == 'raster':
+            overlay = render_points(job['pixels'], size, job['colors'], self.r)
+        else:
+            overlay = render_heatmap(job['pixels'], size, job['colors'] if job['style'] == 'team_heatmap' else None)
+        self.view_map.clear()
+        self.view_map.set_map(self.maps / job['map'], size[0])
+        self.view_map.set_overlay(overlay)
+        self.view_state.update({'map': job['map'], 'size': size, 'style': job['style'], 'drawn': {}, 'colors': {}})
+
+
+    def end_view_action(self, job: dict) -> None:
+        """
+        表示の更新の計測を終える
+
+        Args:
+            job (dict): 表示中の検索
+        """
+        action = job['action']
+        action.count('canvas_items', self.view_map.created - job['created'])
+        action.count('map_files_opened', self.map_cache.opened - job['opened'])
+        self.profiler.end(action)
+
+
+    def draw_landmarks(self, job: dict) -> None:
+        """
+        表示中のチームのよく降りる場所を描画(期間等の絞り込みに関係なく各チームの全記録から求める)
+
+        Args:
+            job (dict): 表示中の検索
+        """
+        size = job['size']
+        self.view_map.clear()
+        self.view_map.set_map(self.maps / job['map'], size[0])
+        self.view_state.update({'map': job['map'], 'size': size, 'style': job['style'], 'drawn': {}, 'colors': {}})
+        shown = job.get('shown', [])
+        if not shown:
+            return
+        # 全記録の取り込みとクラスタリングに時間がかかるのでバックグラウンドで求める
+        self.landmark_worker.start(map_name=Path(job['map']).stem, teams=shown)
+        self.progress_lbl['text'] = 'ランドマークを計算中...'
+        if self.landmark_poll is not None:
+            self.after_cancel(self.landmark_poll)
+        self.landmark_poll = self.after(self.poll_ms, lambda: self.poll_landmarks(job))
+
+
+    def poll_landmarks(self, job: dict) -> None:
+        """
+        ランドマークを受け取って描画
+
+        Args:
+            job (dict): 表示中の検索
+        """
+        self.landmark_poll = None
+        # 別の表示に切り替わっていれば捨てる
+        if job is not self.view_job:
+            self.landmark_worker.cancel()
+            return
+        message = self.landmark_worker.poll()
+        if message is None or message[0] == 'progress':
+            if message is not None:
+                self.progress_lbl['text'] = f'読み込み中 {message[1]}/{message[2]}'
+            self.landmark_poll = self.after(self.poll_ms, lambda: self.poll_landmarks(job))
+            return
+        self.progress_lbl['text'] = ''
+        if message[0] == 'error':
+            messagebox.showerror("エラー", f"ランドマークを求められませんでした\n{message[1]}")
+            return
+        landmarks = message[1]
+        w, h = job['size']
+        teams = job['teams']
+        for team_name in job['shown']:
+            color = get_colors()[teams.index(team_name)%len(get_colors())]
+            for lm in landmarks.get(team_name, [])[:self.num_landmarks]:
+                self.view_map.create_oval(lm.x*w,
+                                          lm.y*h,
+                                          max(lm.spread * w, self.r * 2),
+                                          outline=color,
+                                          width=3)
+                self.view_map.create_text(lm.x*w,
+                                          lm.y*h,
+                                          text=f'{lm.name} {lm.matches}試合\n最終 {lm.last}',
+                                          fill=color,
+                                          font=("", 10))
+
+
+    def inspect_point(self, event: tk.Event) -> None:
+        """
+        クリックした位置の近くに降りた試合を一覧表示(絞り込みに関係なく表示中のマップの全記録から探す)
+
+        Args:
+            event (tk.Event): マウスイベント(ワンクリック)
+        """
+        state = self.view_state
+        w, h = state['size']
+        x, y = self.view_map.to_image(event.x, event.y)
+        if not (0 <= x < w and 0 <= y < h):
+            return
+        # 未読み込みの試合の取り込みと索引の作成に時間がかかるのでバックグラウンドで探す
+        self.inspect_worker.start(map_name=Path(state['map']).stem,
+                                  x=x / w,
+                                  y=y / h,
+                                  r=self.inspect_r / self.view_map.zoom / w)
+        self.inspect_list.delete(0, tk.END)
+        self.inspect_list.insert(tk.END, '検索中...')
+        if self.inspect_poll is None:
+            self.inspect_poll = self.after(self.poll_ms, self.poll_inspect)
+
+
+    def poll_inspect(self) -> None:
+        """
+        クリックした位置の試合の検索結果を受け取って一覧表示
         """
-        view_matches = []
-        # 各チームごとに処理
+        self.inspect_poll = None
+        message = self.inspect_worker.poll()
+        if message is None or message[0] == 'progress':
+            if message is not None:
+                self.inspect_list.delete(0, tk.END)
+                self.inspect_list.insert(tk.END, f'読み込み中 {message[1]}/{message[2]}')
+            self.inspect_poll = self.after(self.poll_ms, self.poll_inspect)
+            return
+        self.inspect_list.delete(0, tk.END)
+        if message[0] == 'error':
+            messagebox.showerror("エラー", f"検索に失敗しました\n{message[1]}")
+            return
+        for date, rcount, team_name, match_name in message[1]:
+            self.inspect_list.insert(tk.END, f'{team_name} {match_name} {datetime.date.fromordinal(date)} R{rcount}')
+        if not message[1]:
+            self.inspect_list.insert(tk.END, 'なし')
+
+
+    def show_contests(self, map_name: str, teams: List[str]=None) -> None:
+        """
+        マップの降下被りの表を別ウィンドウで表示(未作成の場合や、作成後に試合が増減した場合はバックグラウンドで作成してから表示する)
+
+        Args:
+            map_name (str): マップ名
+            teams (List[str]): 表示するチーム名一覧(Noneの場合は全チーム)
+        """
+        map_name = Path(self.resolve_map_name(map_name)).stem
+        self.contest_worker.start(map_name=map_name)
+        self.progress_lbl['text'] = '降下被りの表を作成中...'
+        if self.contest_poll is not None:
+            self.after_cancel(self.contest_poll)
+        self.contest_poll = self.after(self.poll_ms, lambda: self.poll_contests(map_name, teams))
+
+
+    def poll_contests(self, map_name: str, teams: List[str]=None) -> None:
+        """
+        降下被りの表を受け取って表示
+
+        Args:
+            map_name (str): マップ名(拡張子なし)
+            teams (List[str]): 表示するチーム名一覧(Noneの場合は全チーム)
+        """
+        self.contest_poll = None
+        message = self.contest_worker.poll()
+        if message is None or message[0] == 'progress':
+            if message is not None:
+                self.progress_lbl['text'] = f'読み込み中 {message[1]}/{message[2]}'
+            self.contest_poll = self.after(self.poll_ms, lambda: self.poll_contests(map_name, teams))
+            return
+        self.progress_lbl['text'] = ''
+        if message[0] == 'error':
+            messagebox.showerror("エラー", f"降下被りの表を作成できませんでした\n{message[1]}")
+            return
+        result = message[1]
+        names = [name for name in result['teams'] if teams is None or name in teams]
+        if not names:
+            messagebox.showerror("エラー", "表示できる試合がありません")
+            return
+
+        window = tk.Toplevel(self)
+        window.title(f'降下被り({map_name}) 回数/同じ試合にいた回数')
+        table = ttk.Treeview(window, columns=names, height=min(len(names), 30))
+        table.heading('#0', text='チーム')
+        for name in names:
+            table.heading(name, text=name)
+            table.column(name, width=80, anchor=tk.CENTER)
+        index = {name: i for i, name in enumerate(result['teams'])}
+        for a in names:
+            cells = []
+            for b in names:
+                i, j = index[a], index[b]
+                cells.append('-' if a == b else f"{result['contested'][i][j]}/{result['together'][i][j]}")
+            table.insert('', tk.END, text=a, values=cells)
+        xbar = tk.Scrollbar(window, orient=tk.HORIZONTAL, command=table.xview)
+        table['xscrollcommand'] = xbar.set
+        xbar.pack(fill='x', side='bottom')
+        table.pack(fill='both', expand=True)
+
+
+    def show_region_stats(self, map_name: str, teams: List[str]=None, rcount: int=None) -> None:
+        """
+        チームごとのよく降りる区画を別ウィンドウで表示
+
+        Args:
+            map_name (str): マップ名
+            teams (List[str]): 表示するチーム名一覧(Noneの場合は全チーム)
+            rcount (int): ラウンド数(Noneの場合は全ラウンド)
+        """
+        map_name = Path(self.resolve_map_name(map_name)).stem
+        if teams is None:
+            teams = self.get_team_names()
+        # まだ集計していないチーム(集計を始める前の記録等)は記録済みの試合から集計する
+        self.catalog.sync()
+        self.region_stats.ensure(self.catalog, map_name, teams)
+        window = tk.Toplevel(self)
+        window.title(f'区画統計({map_name}) 区画:その区画に降りた試合の割合')
+        table = ttk.Treeview(window, columns=['matches', 'regions'], height=min(max(len(teams), 1), 30))
+        table.heading('#0', text='チーム')
+        table.heading('matches', text='試合数')
+        table.heading('regions', text='よく降りる区画')
+        table.column('matches', width=80, anchor=tk.CENTER)
+        table.column('regions', width=480)
+        for team in teams:
+            stats = self.region_stats.get(map_name, team)
+            if not stats.matches(rcount=rcount):
+                continue
+            regions = ' '.join(f'{name}:{share:.0%}' for name, _, share in stats.top(rcount=rcount))
+            table.insert('', tk.END, text=team, values=[stats.matches(rcount=rcount), regions])
+        table.pack(fill='both', expand=True)
+
+
+    def show_drift(self, map_name: str, teams: List[str]=None) -> None:
+        """
+        チームごとの降下地点の推移を別ウィンドウで表示(行を開くと日ごとの推移を表示)
+
+        Args:
+            map_name (str): マップ名
+            teams (List[str]): 表示するチーム名一覧(Noneの場合は全チーム)
+        """
+        map_name = Path(self.resolve_map_name(map_name)).stem
+        if teams is None:
+            teams = self.get_team_names()
+        # まだ集計していないチーム(集計を始める前の記録等)は記録済みの試合から集計する
+        self.catalog.sync()
+        self.drift.ensure(self.catalog, map_name, teams)
+        window = tk.Toplevel(self)
+        window.title(f'降下地点の推移({map_name}) 直近{WINDOW}日間の中心と広がり')
+        table = ttk.Treeview(window, columns=['matches', 'center', 'spread', 'shift'], height=min(max(len(teams), 1), 30))
+        table.heading('#0', text='チーム/日付')
+        table.heading('matches', text='試合数')
+        table.heading('center', text='中心')
+        table.heading('spread', text='広がり')
+        table.heading('shift', text='降下地点の変更')
+        table.column('matches', width=80, anchor=tk.CENTER)
+        table.column('center', width=80, anchor=tk.CENTER)
+        table.column('spread', width=80, anchor=tk.CENTER)
+        table.column('shift', width=320)
         for team in teams:
-            _matches = []
-            # 全試合を見て、チーム名が一致したら一時保存リストに加える
-            for match in matches:
-                if match['name'].name.split('/')[-1].split('_')[0] == team:
-                    _matches.append(match)
-
-            # 日付でソート
-            if len(_matches) > 0:
-                _matches.sort(key=lambda x: (x['name'].name.split('/')[-1].split('_')[3], x['name'].name.split('/')[-1].split('_')[4]))
-                
-                # 表示する試合数が記録済みの試合数を超えていた場合や入力されていない場合は調整
-                tmp = num
-                if num > len(_matches) or num is None:
-                    num = len(_matches)
-                
-                for n in range(num):
-                    view_matches.append(_matches[-(n+1)])
-                num = tmp
-
-        return view_matches
+            drift = self.drift.get(map_name, team)
+            trend = drift.trend()
+            if not trend:
+                continue
+            shifts = {s.date: s for s in drift.shifts()}
+            latest = trend[-1]
+            recent = ' '.join(f'{s.date:%m/%d} {landmark_name(*s.before)}→{landmark_name(*s.after)}'
+                              for s in list(shifts.values())[-3:])
+            parent = table.insert('', tk.END, text=team,
+                                  values=[latest.matches, landmark_name(latest.x, latest.y), f'{latest.spread:.3f}', recent])
+            for p in reversed(trend):
+                s = shifts.get(p.date)
+                table.insert(parent, tk.END, text=str(p.date),
+                             values=[p.matches, landmark_name(p.x, p.y), f'{p.spread:.3f}',
+                                     '' if s is None else f'{landmark_name(*s.before)}→{landmark_name(*s.after)} ({s.distance:.3f})'])
+        table.pack(fill='both', expand=True)
+
+
+    def show_profile(self) -> None:
+        """
+        直近の画面操作の処理時間を別ウィンドウで表示(新しい順、時間はミリ秒)
+        """
+        window = tk.Toplevel(self)
+        window.title(f'処理時間(ログ: {self.cache / "profile.log"})')
+        table = ttk.Treeview(window, columns=['total', 'phases', 'counts'], height=20)
+        table.heading('#0', text='操作')
+        table.heading('total', text='合計')
+        table.heading('phases', text='段階別')
+        table.heading('counts', text='件数')
+        table.column('total', width=80, anchor=tk.E)
+        table.column('phases', width=480)
+        table.column('counts', width=320)
+        for record in self.profiler.summary():
+            phases = ' '.join(f'{name}:{seconds * 1000:.0f}' for name, seconds in record['phases'].items())
+            counts = ' '.join(f'{name}:{n}' for name, n in record['counts'].items())
+            table.insert('', tk.END,
+                         text=f"{record['time'][11:]} {record['action']}",
+                         values=[f"{record['total'] * 1000:.0f}", phases, counts])
+        table.pack(fill='both', expand=True)
+
+
+    def close_view(self, view: tk.Frame) -> None:
+        """
+        閲覧画面を閉じる(実行中の検索は取り消す)
+
+        Args:
+            view (tk.Frame): 閲覧画面のフレーム
+        """
+        self.view_worker.cancel()
+        self.inspect_worker.cancel()
+        self.landmark_worker.cancel()
+        self.contest_worker.cancel()
+        for poll in (self.landmark_poll, self.contest_poll):
+            if poll is not None:
+                self.after_cancel(poll)
+        self.landmark_poll = self.contest_poll = None
+        if self.view_poll is not None:
+            self.after_cancel(self.view_poll)
+            self.view_poll = None
+        if self.inspect_poll is not None:
+            self.after_cancel(self.inspect_poll)
+            self.inspect_poll = None
+        self.create_main_widgets(view)
 
 
     def get_team_names(self) -> List[str]:
@@ -442,11 +1049,7 @@ class Application(tk.Frame):
         Returns:
             List[str]: チーム名一覧
         """
-        teams = []
-        for team in self.teams.iterdir():
-            if team.is_dir():
-                teams.append(team.name)
-        return teams
+        return self.catalog.team_names()
 
 
     def get_match_names(self) -> List[str]:
@@ -456,15 +1059,7 @@ class Application(tk.Frame):
         Returns:
             List[str]: 試合名一覧
         """
-        matches = []
-        for team in self.teams.iterdir():
-            if team.is_dir():
-                for m in (self.teams / team.name).iterdir():
-                    if m.is_file():
-                        match_name = m.name.split('_')[1]
-                        if match_name not in matches:
-                            matches.append(match_name)
-        return matches
+        return self.catalog.match_names()
 
 
     def create_record_widgets(self,
@@ -486,8 +1081,8 @@ class Application(tk.Frame):
             rcount (int): ラウンド数
             match_name (str): 試合名
         """
-        global map_img
-
+        action = self.profiler.begin('create_record_widgets')
+        opened = self.map_cache.opened
         if frame is not None:
             frame.destroy()
         self.pts = []
@@ -519,23 +1114,15 @@ class Application(tk.Frame):
 
         # マップ一覧
         map_list = tk.Listbox(left, font=self.font)
-        for m in self.maps.iterdir():
-            if m.is_file():
-                map_list.insert(0, m.name)
+        for name in self.get_map_names():
+            map_list.insert(0, name)
         map_list.pack()
 
         # 表示マップの変更
         change_map_btn = tk.Button(left,
                                    text='マップ変更',
                                    font=self.font,
-                                   command=lambda: self.change_map(map_list,
-                                                                   team_entry.get(),
-                                                                   match_entry.get(),
-                                                                   int(r_com.get()[1:]),
-                                                                   record,
-                                                                   y_com.get(),
-                                                                   m_com.get(),
-                                                                   d_com.get()))
+                                   command=lambda: self.change_map(map_list))
         change_map_btn.pack()
 
         # 日付の選択
@@ -573,6 +1160,7 @@ class Application(tk.Frame):
 
 
         left.pack(side='left')
+        action.lap('widgets')
 
         # 画面右側
         right = tk.Frame(record)
@@ -586,9 +1174,8 @@ class Application(tk.Frame):
                                   font=self.font)
         match_list_lbl.pack()
         match_list = tk.Listbox(right_top, font=self.font)
-        for m in self.tmp.iterdir():
-            if m.is_file():
-                match_list.insert(0, m.name)
+        for name in self.staging.names():
+            match_list.insert(0, name)
         ybar = tk.Scrollbar(right_top, orient=tk.VERTICAL, command=match_list.yview)
         match_list['yscrollcommand'] = ybar.set
         ybar.pack(fill='y', side='right')
@@ -598,6 +1185,7 @@ class Application(tk.Frame):
         match_list.pack(fill='both')
 
         right_top.pack()
+        action.lap('tmp_list')
 
         # 画面右下
         right_bottom = tk.Frame(right)
@@ -606,15 +1194,7 @@ class Application(tk.Frame):
         del_btn = tk.Button(right_bottom,
                             text='仮記録削除',
                             font=self.font,
-                            command=lambda: self.delete_tmp_match(team_entry.get(),
-                                                                  match_list,
-                                                                  map_name,
-                                                                  match_entry.get(),
-                                                                  int(r_com.get()[1:]),
-                                                                  record,
-                                                                  y_com.get(),
-                                                                  m_com.get(),
-                                                                  d_com.get()))
+                            command=lambda: self.delete_tmp_match(match_list))
         del_btn.pack()
 
         # 仮記録データ保存ボタン
@@ -623,28 +1203,20 @@ class Application(tk.Frame):
                                  font=self.font,
                                  command=lambda: self.tmp_save(team_entry.get(),
                                                                match_entry.get(),
-                                                               map_name,
+                                                               self.record_state['map'],
                                                                y_com.get(),
                                                                m_com.get(),
                                                                d_com.get(),
                                                                r_com.get()[1:],
                                                                map_img_w,
-                                                               map_img_h,
-                                                               record))
+                                                               map_img_h))
         tmp_save_btn.pack()
 
         # 仮記録データを確定保存
         save_btn = tk.Button(right_bottom,
                              text='記録',
                              font=self.font,
-                             command=lambda: self.save(list(self.tmp.iterdir()),
-                                                       record,
-                                                       map_name,
-                                                       int(r_com.get()[1:]),
-                                                       match_entry.get(),
-                                                       y_com.get(),
-                                                       m_com.get(),
-                                                       d_com.get()))
+                             command=lambda: self.save(self.staging.names()))
         save_btn.pack()
 
         # 記録モード終了
@@ -657,80 +1229,81 @@ class Application(tk.Frame):
         right_bottom.pack()
 
         right.pack(side='right')
+        action.lap('widgets')
 
         # 画面中央(マップ表示部分)
+        from mapview import MapView
         center = tk.Frame(record)
 
-        # マップの表示
-        if map_name is None:
-            if self.default_map in [m.name for m in self.maps.iterdir() if m.is_file()]:
-                map_img = Image.open(self.maps / self.default_map)
-            else:
-                map_img = Image.open(list(self.maps.iterdir())[0])
-        else:
-            map_img = Image.open(self.maps / map_name)
-        # 表示マップを最大化
-        center_width = self.winfo_width()
-        center_height = self.winfo_height()
-        canvas = tk.Canvas(center, width=center_width, height=center_height)
-        if center_width > center_height:
-            map_img = map_img.resize((center_height, center_height))
-        else:
-            map_img = map_img.resize((center_width, center_width))
-        map_img = ImageTk.PhotoImage(image=map_img)
-        map_img_w = map_img.width()
-        map_img_h = map_img.height()
-        canvas.create_image(0,
-                            0,
-                            image=map_img,
-                            tag='map',
-                            anchor=tk.NW)
-        canvas.pack(fill='both')
-        canvas.bind('<ButtonPress-1>', self.plot)
-        canvas.bind('<ButtonPress-1>', self.set_pt, '+')
+        # マップの表示(表示領域に合わせて最大化、ホイールで拡大・右ドラッグで移動)
+        map_img_w = map_img_h = self.map_side()
+        self.record_map = MapView(center, self.map_cache, self.winfo_width(), self.winfo_height())
+        self.record_map.set_map(self.maps / self.resolve_map_name(map_name), map_img_w)
+        self.record_map.pack(fill='both')
+        self.record_map.bind('<ButtonPress-1>', self.plot)
+        self.record_map.bind('<ButtonPress-1>', self.set_pt, '+')
         center.pack(fill='both')
+        # 仮記録・削除・マップ変更ではこの画面を作り直さず、一覧と点だけ更新する
+        self.record_state = {'map': map_name, 'tmp_list': match_list}
 
         record.pack()
+        action.lap('map')
+        action.count('map_files_opened', self.map_cache.opened - opened)
+        action.count('canvas_items', self.record_map.created)
+        self.profiler.end(action)
 
 
-    def save(self,
-             matches: List[Path],
-             frame: tk.Frame=None,
-             map_name: str=None,
-             rcount: int=1,
-             match_name: str=None,
-             year: str=None,
-             month: str=None,
-             day: str=None) -> None:
+    def save(self, matches: List[str]) -> None:
         """
         記録
 
         Args:
-            matches (List[Path]): 記録対象の仮記録データ一覧
-            frame (tk.Frame): 消したいフレーム
-            map_name (str): マップ名
-            rcount (int): ラウンド数
-            match_name (str): 試合名
-            year (str): 年
-            month (str): 月
-            day (str): 日
+            matches (List[str]): 記録対象の仮記録のファイル名一覧
         """
         if not len(matches):
             messagebox.showerror("エラー", '仮記録されたデータがありません')
             return
 
-        for match in matches:
-            team_name = str(match.name).split('_')[0]
-            if (self.teams / team_name / match.name).exists():
-                ret = messagebox.askyesno("そのデータ名は既に存在します。上書きしてよろしいですか？")
-                if not ret:
-                    return
-            shutil.move(match, self.teams / team_name)
+        staged = self.committer.stage(matches)
 
-        self.create_record_widgets(team_name, frame, map_name, rcount, match_name, year, month, day)
+        # 上書きになるものはまとめて確認し、1つでも断られたら何も保存しない
+        conflicts = self.committer.conflicts(staged)
+        if conflicts:
+            names = [f'{path.parent.name}/{path.name}' for path in conflicts]
+            if len(names) > 20:
+                names = names[:20] + [f'他{len(names) - 20}件']
+            ret = messagebox.askyesno("確認", "次のデータは既に存在します。上書きしてよろしいですか？\n" + '\n'.join(names))
+            if not ret:
+                return
+        try:
+            self.committer.commit(staged, self.add_saved_matches)
+        except OSError as e:
+            messagebox.showerror("エラー", f"保存を終えられませんでした\n{e}\n(次回起動時に保存し直します)")
+
+        self.refresh_tmp_list()
+        self.clear_record_points()
 
 
 
+    def add_saved_matches(self, paths: List[Path]) -> None:
+        """
+        記録した試合を索引と列データに反映
+
+        Args:
+            paths (List[Path]): teamsディレクトリに記録した試合ファイル一覧
+        """
+        self.catalog.add(paths)
+        records = list(filter(None, map(parse_match_path, paths)))
+        self.region_stats.add(records)
+        self.drift.add(records)
+        by_map = {}
+        for record in records:
+            by_map.setdefault(record.map_name, []).append(record)
+        for map_name, records in by_map.items():
+            # ランドマークは次に表示したときに、新しい点の近くのものだけバックグラウンドで求め直す
+            self.points.update(map_name, records)
+
+
     def tmp_save(self,
                  team_name: str,
                  match_name: str,
@@ -740,8 +1313,7 @@ class Application(tk.Frame):
                  day: str,
                  rcount: str,
                  img_w: int,
-                 img_h: int,
-                 frame: tk.Frame=None) -> None:
+                 img_h: int) -> None:
         """
         仮記録
 
@@ -755,7 +1327,6 @@ class Application(tk.Frame):
             rcount (str): ラウンド数
             img_w (int): マップ画像幅
             img_h (int): マップ画像高さ
-            frame (tk.Frame): 消したいフレーム
         """
         # チーム名が入力されているか
         if team_name is None:
@@ -809,7 +1380,7 @@ class Application(tk.Frame):
 
         if len(self.pts) > 4:
             messagebox.showerror("エラー", "点の数が多すぎます\n一試合一チームずつ仮記録してください")
-            self.create_record_widgets(team_name, frame, map_name, int(rcount), match_name, year, month, day)
+            self.clear_record_points()
             return
 
         pts = []
@@ -826,17 +1397,35 @@ class Application(tk.Frame):
         data = Match(team_name, match_name, map_name, date, int(rcount), pts)
 
         # 仮記録
-        filename = f'{team_name}_{match_name}_{Path(map_name).stem}_{str(date)}_R{rcount}.pkl'
-        if (self.tmp / filename).exists():
+        filename = f'{team_name}_{match_name}_{Path(map_name).stem}_{str(date)}_R{rcount}{EXT}'
+        if filename in self.staging:
             ret = messagebox.askyesno("重複", "その試合のデータは仮記録内に存在します。上書きしてよろしいですか？")
             if not ret:
-                self.create_record_widgets(team_name, frame, map_name, int(rcount), match_name, year, month, day)
+                self.clear_record_points()
                 return
-        tmp_file = self.tmp / filename
+        self.staging.put(filename, data)
+        tmp_list = self.record_state['tmp_list']
+        if filename not in tmp_list.get(0, tk.END):
+            tmp_list.insert(0, filename)
+        self.clear_record_points()
 
-        with open(tmp_file, 'wb') as f:
-            pickle.dump(data, f)
-        self.create_record_widgets(team_name, frame, map_name, int(rcount), match_name, year, month, day)
+
+    def refresh_tmp_list(self) -> None:
+        """
+        記録画面の仮記録一覧を読み直す
+        """
+        tmp_list = self.record_state['tmp_list']
+        tmp_list.delete(0, tk.END)
+        for name in self.staging.names():
+            tmp_list.insert(0, name)
+
+
+    def clear_record_points(self) -> None:
+        """
+        記録画面でクリックした点を消す
+        """
+        self.pts = []
+        self.record_map.clear()
 
 
     def plot(self, event: tk.Event) -> None:
@@ -846,8 +1435,8 @@ class Application(tk.Frame):
         Args:
             event (tk.Event): マウスイベント(ワンクリック)
         """
-        canvas: tk.Canvas = event.widget
-        canvas.create_oval(event.x-self.r, event.y-self.r, event.x+self.r, event.y+self.r, fill='Red')
+        x, y = self.record_map.to_image(event.x, event.y)
+        self.record_map.create_oval(x, y, self.r, fill='Red')
 
 
     def set_pt(self, event: tk.Event) -> None:
@@ -857,7 +1446,8 @@ class Application(tk.Frame):
         Args:
             event (tk.Event): マウスイベント(ワンクリック)
         """
-        self.pts.append([event.x, event.y])
+        # 拡大・移動していても拡大率1のときのマップ上の座標で記録する
+        self.pts.append(list(self.record_map.to_image(event.x, event.y)))
 
 
     def get_select(self, listbox: tk.Listbox) -> str:
@@ -880,73 +1470,41 @@ class Application(tk.Frame):
         return name
 
 
-    def change_map(self,
-                   listbox: tk.Listbox,
-                   team_name: str,
-                   match_name: str,
-                   rcount: int,
-                   frame: tk.Frame=None,
-                   year: str=None,
-                   month: str=None,
-                   day: str=None) -> None:
+    def change_map(self, listbox: tk.Listbox) -> None:
         """
         データ記録用表示マップを変更
 
         Args:
             listbox (tk.Listbox): マップ一覧のリストボックス
-            team_name (str): チーム名
-            match_name (str): 試合名
-            rcount (int): ラウンド数
-            frame (tk.Frame): 消したいフレーム
-            year (str): 年
-            month (str): 月
-            day (str): 日
         """
         map_name = self.get_select(listbox)
 
-        self.create_record_widgets(team_name, frame, map_name, rcount, match_name, year, month, day)
+        self.clear_record_points()
+        self.record_map.set_map(self.maps / self.resolve_map_name(map_name), self.record_map.side)
+        self.record_state['map'] = map_name
 
 
-    def delete_tmp_match(self,
-                         team_name: str,
-                         listbox: tk.Listbox,
-                         map_name: str,
-                         match_name: str,
-                         rcount: int,
-                         frame: tk.Frame=None,
-                         year: str=None,
-                         month: str=None,
-                         day: str=None) -> None:
+    def delete_tmp_match(self, listbox: tk.Listbox) -> None:
         """
         選択した仮記録データを削除
 
         Args:
-            team_name (str): チーム名
             listbox (tk.Listbox): 仮記録一覧
-            map_name (str): マップ名
-            match_name (str): 試合名
-            rcount (int): ラウンド数
-            frame (tk.Frame): 消したいフレーム
-            year (str): 年
-            month (str): 月
-            day (str): 日
         """
         indices = listbox.curselection()
 
         # ２つ以上選択されているor１つも選択されていない
         if len(indices) != 1:
             messagebox.showerror("エラー", "一つずつ選択して消しましょう")
-            self.create_record_widgets(team_name, frame, map_name, rcount, match_name, year, month, day) 
+            return
 
         # 項目を取得
         index = indices[0]
         del_match = listbox.get(index)
 
         # 削除
-        del_path: Path = self.tmp / del_match
-        del_path.unlink(missing_ok=False)
-
-        self.create_record_widgets(team_name, frame, map_name, rcount, match_name, year, month, day)
+        self.staging.remove([del_match])
+        listbox.delete(index)
 
 
 def main():
@@ -955,6 +1513,8 @@ def main():
     root.state('zoomed')
     app = Application(root, root.winfo_screenwidth(), root.winfo_screenheight())
     app.mainloop()
+    # 書き込み待ちの仮記録をジャーナルに書いてから終わる
+    app.staging.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,333 @@
+"""
+生成データ等の保存の共通部分
+
+ファイルは一時ファイルに書いてから置き換え、途中で止まっても書きかけのファイルが残らないようにする。
+チーム・マップごとの集計(cache/<種類>/<マップ名>/<チーム名>.json)は記録した試合の分だけ足し引きする。
+試合ごとの内訳は試合数に比例して大きくなるので別のファイル(<チーム名>.files.json)に置き、
+集計を表示するときは読まない
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List
+
+from catalog import Catalog, MatchRecord
+from recordio import RecordFormatError
+
+logger = logging.getLogger(__name__)
+
+# 生成データのディレクトリ -> そのディレクトリを使う全ての保存先で共有するロック
+_locks: Dict[Path, threading.RLock] = {}
+_locks_guard = threading.Lock()
+
+
+def shared_lock(root: Path) -> threading.RLock:
+    """
+    Args:
+        root (Path): 生成データのディレクトリ
+
+    Returns:
+        threading.RLock: 同じディレクトリ(パスの表記によらない)に対して常に同じロック
+    """
+    with _locks_guard:
+        return _locks.setdefault(root.resolve(), threading.RLock())
+
+
+@contextmanager
+def replace_file(path: Path, fsync: bool=False) -> Iterator[BinaryIO]:
+    """
+    一時ファイルに書き、閉じた後にpathと置き換える(失敗した場合は一時ファイルを消す)
+
+    Args:
+        path (Path): 保存先
+        fsync (bool): Trueの場合は置き換える前にディスクに書き込む
+
+    Yields:
+        BinaryIO: 一時ファイル
+    """
+    tmp = path.with_name(path.name + '.tmp')
+    try:
+        with open(tmp, 'wb') as f:
+            yield f
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        tmp.replace(path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def fsync_dir(path: Path) -> None:
+    """
+    ディレクトリへのファイルの追加・置き換えをディスクに書き込む(Windowsではディレクトリを開けないので何もしない)
+
+    Args:
+        path (Path): ディレクトリ
+    """
+    if os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_json(path: Path, data: Any) -> None:
+    """
+    Args:
+        path (Path): 保存先(親ディレクトリがなければ作る)
+        data (Any): 保存する内容
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with replace_file(path) as f:
+        f.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+
+def read_json(path: Path, default: Any=None) -> Any:
+    """
+    Args:
+        path (Path): 読み込むファイル
+        default (Any): ファイルがない場合の値
+
+    Returns:
+        Any: 保存されている内容
+    """
+    if not path.exists():
+        return default
+    return json.loads(path.read_text(encoding='utf-8'))
+
+
+def cli_parser(description: str) -> argparse.ArgumentParser:
+    """
+    Args:
+        description (str): コマンドの説明
+
+    Returns:
+        argparse.ArgumentParser: チームデータ・生成データのディレクトリを指定できるパーサ
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--teams-dir', type=Path, default=Path('teams'), help='チームデータ保存用ディレクトリ')
+    parser.add_argument('--cache', type=Path, default=Path('cache'), help='索引等の生成データ保存用ディレクトリ')
+    return parser
+
+
+def open_catalog(args: argparse.Namespace) -> Catalog:
+    """
+    Args:
+        args (argparse.Namespace): cli_parserで解析した引数
+
+    Returns:
+        Catalog: 更新済みの試合ファイルの索引
+    """
+    args.cache.mkdir(parents=True, exist_ok=True)
+    catalog = Catalog(args.teams_dir, args.cache / 'catalog.sqlite3')
+    catalog.sync()
+    return catalog
+
+
+class TeamMapStore:
+    """
+    チーム・マップごとの集計の保存先
+
+    派生クラスはVERSION(保存形式、変わった場合は作り直す)、result(集計を包むクラス)、
+    _empty・_entry・_applyを定義する
+
+    内訳のファイルは集計を消してから書き、集計を最後に書く。途中で止まった場合は集計がないので、
+    ensureで記録済みの試合から作り直す(集計がない場合は内訳のファイルを使わない)
+    """
+    VERSION = 1
+    result: Callable[[dict], Any] = dict
+
+    def __init__(self, root: Path) -> None:
+        """
+        Args:
+            root (Path): 集計の保存用ディレクトリ
+        """
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def get(self, map_name: str, team: str) -> Any:
+        """
+        Args:
+            map_name (str): マップ名(拡張子なし)
+            team (str): チーム名
+
+        Returns:
+            Any: 集計(記録がない場合は空)
+        """
+        return self.result(self._read(self._path(map_name, team)))
+
+    def add(self, records: Iterable[MatchRecord]) -> None:
+        """
+        記録した試合を集計に反映する(反映済みの試合が上書きされていれば差し替え、されていなければ何もしない)
+
+        集計がまだない(または保存形式が古い)チームは、渡された試合だけで作ると以前の記録が抜けるので作らない
+        (ensureで記録済みの全試合から作る)。
+        読み込めない試合ファイル(壊れている等)は集計せず、次に渡されたときに読み込み直す
+
+        Args:
+            records (Iterable[MatchRecord]): teamsディレクトリに記録した試合一覧
+        """
+        self._add(records, build=False)
+
+    def _add(self, records: Iterable[MatchRecord], build: bool) -> None:
+        """
+        Args:
+            records (Iterable[MatchRecord]): teamsディレクトリに記録した試合一覧
+            build (bool): Trueの場合は集計がないチームの集計を作る(recordsはそのチームの全試合であること)
+        """
+        groups: Dict[tuple, List[MatchRecord]] = {}
+        for record in records:
+            groups.setdefault((record.map_name, record.team), []).append(record)
+        for (map_name, team), group in groups.items():
+            path = self._path(map_name, team)
+            data = read_json(path)
+            if data is None or data.get('version') != self.VERSION:
+                if not build:
+                    continue
+                data, files = self._empty(), {}
+            else:
+                # 以前の版は内訳を集計と同じファイルに持っていた
+                files = data.pop('files', None)
+                if files is None:
+                    files = read_json(self._files_path(map_name, team), {})
+            changed = False
+            for record in group:
+                key = str(record.path)
+                try:
+                    mtime_ns = record.path.stat().st_mtime_ns
+                    if key in files and files[key][0] == mtime_ns:
+                        continue
+                    entry = self._entry(record)
+                except (RecordFormatError, OSError) as e:
+                    logger.warning('%s: %s', record.path, e)
+                    continue
+                if key in files:
+                    self._apply(data, files.pop(key), -1)
+                self._apply(data, entry, 1)
+                files[key] = entry
+                changed = True
+            if changed or not path.exists():
+                self._write(map_name, team, data, files)
+
+    def ensure(self, catalog: Catalog, map_name: str, teams: Iterable[str]) -> None:
+        """
+        集計がない(または保存形式が古い)チームは記録済みの試合から作る
+
+        Args:
+            catalog (Catalog): 試合ファイルの索引(更新済みのもの)
+            map_name (str): マップ名(拡張子なし)
+            teams (Iterable[str]): チーム名一覧
+        """
+        missing = []
+        for team in teams:
+            data = read_json(self._path(map_name, team))
+            if data is None or data.get('version') != self.VERSION:
+                missing.append(team)
+            elif 'files' in data:
+                # 以前の版の集計は内訳を別のファイルに移す
+                self._write(map_name, team, data, data.pop('files'))
+        if not missing:
+            return
+        self._add(catalog.find(map_name, teams=missing), build=True)
+        # 試合がないチームも空の集計を置き、次回から探さない
+        for team in missing:
+            path = self._path(map_name, team)
+            if read_json(path, {}).get('version') != self.VERSION:
+                self._write(map_name, team, self._empty(), {})
+
+    def rebuild(self, catalog: Catalog) -> int:
+        """
+        記録済みの全試合から集計を作り直す
+
+        Args:
+            catalog (Catalog): 試合ファイルの索引
+
+        Returns:
+            int: 集計した試合数
+        """
+        # 集計と内訳のファイルを消す
+        for path in self.root.glob('*/*.json'):
+            path.unlink()
+        catalog.sync()
+        n = 0
+        for map_name in catalog.map_names():
+            records = catalog.find(map_name)
+            self._add(records, build=True)
+            n += len(records)
+        return n
+
+    def _path(self, map_name: str, team: str) -> Path:
+        return self.root / map_name / f'{team}.json'
+
+    def _files_path(self, map_name: str, team: str) -> Path:
+        # チーム名には'.'を使えないので他のチームの集計と重ならない
+        return self.root / map_name / f'{team}.files.json'
+
+    def _read(self, path: Path) -> dict:
+        data = read_json(path)
+        if data is None or data.get('version') != self.VERSION:
+            return self._empty()
+        return data
+
+    def _write(self, map_name: str, team: str, data: dict, files: dict) -> None:
+        """
+        集計と内訳を保存する(集計を消してから内訳を書き、最後に集計を書く)
+        """
+        path = self._path(map_name, team)
+        path.unlink(missing_ok=True)
+        write_json(self._files_path(map_name, team), files)
+        write_json(path, data)
+
+    def _empty(self) -> dict:
+        """
+        空の集計({'version': VERSION, ...})
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _entry(record: MatchRecord) -> list:
+        """
+        試合ごとの内訳(先頭は試合ファイルのmtime、{試合ファイル: 内訳}を別のファイルに保存する)
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _apply(data: dict, entry: list, sign: int) -> None:
+        """
+        内訳を集計に足す(signが-1の場合は引く)
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def main(cls, parser: argparse.ArgumentParser, subdir: str, show: Callable[[Any, str, argparse.Namespace], None]) -> None:
+        """
+        集計の作り直しと表示を行うコマンド
+
+        Args:
+            parser (argparse.ArgumentParser): cli_parserで作り、表示用の引数を加えたパーサ
+            subdir (str): 生成データのディレクトリ内の保存先
+            show (Callable[[Any, str, argparse.Namespace], None]): (集計, チーム名, 引数)で1チーム分を表示する
+        """
+        parser.add_argument('map_name', nargs='?', help='マップ名')
+        parser.add_argument('--teams', nargs='+', help='チーム名')
+        parser.add_argument('--rebuild', action='store_true', help='記録済みの全試合から作り直す')
+        args = parser.parse_args()
+
+        store = cls(args.cache / subdir)
+        catalog = open_catalog(args)
+        if args.rebuild:
+            print(f'{store.rebuild(catalog)}試合を集計しました')
+        if args.map_name is not None:
+            map_name = Path(args.map_name).stem
+            teams = args.teams or catalog.team_names()
+            store.ensure(catalog, map_name, teams)
+            for team in teams:
+                show(store.get(map_name, team), team, args)
+        catalog.close()
\ No newline at end of file
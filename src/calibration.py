@@ -0,0 +1,74 @@
+"""
+マップごとの縮尺(マップ画像の一辺がゲーム内で何メートルか)
+
+maps/calibration.json({"Erangel": 8000, ...})で上書きでき、書かれていないマップはDEFAULT_SIZESを使う
+"""
+import json
+from pathlib import Path
+from typing import Dict, List
+
+# マップの一辺(メートル)
+DEFAULT_SIZES = {
+    'Erangel': 8000,
+    'Miramar': 8000,
+    'Taego': 8000,
+    'Deston': 8000,
+    'Rondo': 8000,
+    'Vikendi': 8000,
+    'Sanhok': 4000,
+    'Paramo': 3000,
+    'Karakin': 2000,
+    'Haven': 1000,
+}
+# DEFAULT_SIZESにないマップの一辺(メートル)
+DEFAULT_SIZE = 8000
+# マップ画像ディレクトリ
+MAPS = Path('maps')
+CALIBRATION_FILE = 'calibration.json'
+# マップ画像として扱う拡張子
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.gif', '.tif', '.tiff')
+
+_loaded: Dict[Path, tuple] = {}  # calibration.jsonのパス -> (mtime, 内容)
+
+
+def load_calibration(maps: Path=MAPS) -> Dict[str, float]:
+    """
+    Args:
+        maps (Path): マップ画像ディレクトリ
+
+    Returns:
+        Dict[str, float]: マップ名(拡張子なし) -> 一辺(メートル)
+    """
+    path = maps / CALIBRATION_FILE
+    sizes = dict(DEFAULT_SIZES)
+    if not path.exists():
+        return sizes
+    mtime_ns = path.stat().st_mtime_ns
+    cached = _loaded.get(path)
+    if cached is None or cached[0] != mtime_ns:
+        cached = _loaded[path] = (mtime_ns, json.loads(path.read_text(encoding='utf-8')))
+    sizes.update({name: float(size) for name, size in cached[1].items()})
+    return sizes
+
+
+def map_images(maps: Path=MAPS) -> List[Path]:
+    """
+    Args:
+        maps (Path): マップ画像ディレクトリ
+
+    Returns:
+        List[Path]: マップ画像のパス一覧(calibration.jsonなど画像以外のファイルは除く)
+    """
+    return [m for m in maps.iterdir() if m.is_file() and m.suffix.lower() in IMAGE_SUFFIXES]
+
+
+def world_size(map_name: str, maps: Path=MAPS) -> float:
+    """
+    Args:
+        map_name (str): マップ名(拡張子の有無は問わない)
+        maps (Path): マップ画像ディレクトリ
+
+    Returns:
+        float: マップの一辺(メートル)
+    """
+    return float(load_calibration(maps).get(Path(map_name).stem, DEFAULT_SIZE))
\ No newline at end of file
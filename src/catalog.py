@@ -0,0 +1,215 @@
+import datetime
+import sqlite3
+from pathlib import Path
+from typing import Iterable, List, NamedTuple, Optional
+
+from recordio import EXT
+
+# 索引の形式(変わった場合は作り直す)
+SCHEMA_VERSION = 2
+
+
+class MatchRecord(NamedTuple):
+    """
+    記録済み試合ファイル1件分の情報(ファイル名から復元できる項目のみ)
+    """
+    team: str  # チーム名
+    match_name: str  # スクリム(orリーグ)名
+    map_name: str  # マップ名(拡張子なし)
+    date: datetime.date  # 試合の日付
+    rcount: int  # ラウンド数
+    path: Path  # 試合ファイルのパス
+
+
+def parse_match_path(path: Path) -> Optional[MatchRecord]:
+    """
+    <team>_<match>_<map>_<date>_R<n>.lmk 形式のファイル名を分解する
+
+    Args:
+        path (Path): 試合ファイルのパス
+
+    Returns:
+        Optional[MatchRecord]: 分解結果(形式が不正な場合はNone)
+    """
+    parts = path.stem.split('_')
+    if path.suffix != EXT or len(parts) != 5 or not parts[4].startswith('R'):
+        return None
+    try:
+        date = datetime.date.fromisoformat(parts[3])
+        rcount = int(parts[4][1:])
+    except ValueError:
+        return None
+    return MatchRecord(parts[0], parts[1], parts[2], date, rcount, path)
+
+
+class Catalog:
+    """
+    teamsディレクトリ内の試合ファイルの索引(SQLite)
+
+    ディレクトリのmtimeを記録しておき、変更のあったチームのディレクトリだけを再走査する
+    """
+
+    def __init__(self, teams: Path, db_path: Path) -> None:
+        """
+        Args:
+            teams (Path): チームデータ保存用ディレクトリ
+            db_path (Path): 索引ファイルのパス
+        """
+        self.teams = teams
+        self.db = sqlite3.connect(str(db_path))
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            self.db.executescript('DROP TABLE IF EXISTS matches; DROP TABLE IF EXISTS dirs;')
+            self.db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS matches (
+                path TEXT PRIMARY KEY,
+                team TEXT NOT NULL,
+                match_name TEXT NOT NULL,
+                map_name TEXT NOT NULL,
+                date TEXT NOT NULL,
+                rcount INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS matches_map_date ON matches (map_name, date);
+            CREATE INDEX IF NOT EXISTS matches_team ON matches (team);
+            CREATE INDEX IF NOT EXISTS matches_match_name ON matches (match_name);
+            CREATE TABLE IF NOT EXISTS dirs (
+                team TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL
+            );
+        """)
+
+    def sync(self) -> None:
+        """
+        mtimeが変わったチームディレクトリだけを再走査して索引を更新する
+        """
+        known = dict(self.db.execute('SELECT team, mtime_ns FROM dirs'))
+        found = set()
+        with self.db:
+            for team in self.teams.iterdir():
+                if not team.is_dir():
+                    continue
+                found.add(team.name)
+                mtime_ns = team.stat().st_mtime_ns
+                if known.get(team.name) == mtime_ns:
+                    continue
+                self.db.execute('DELETE FROM matches WHERE team = ?', (team.name,))
+                self._insert(m for m in team.iterdir() if m.is_file())
+                self.db.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?)', (team.name, mtime_ns))
+
+            # 削除されたチーム
+            for team in known.keys() - found:
+                self.db.execute('DELETE FROM matches WHERE team = ?', (team,))
+                self.db.execute('DELETE FROM dirs WHERE team = ?', (team,))
+
+    def add(self, paths: Iterable[Path]) -> None:
+        """
+        保存した試合ファイルを索引に追加する
+
+        Args:
+            paths (Iterable[Path]): teamsディレクトリ内に保存した試合ファイル一覧
+        """
+        with self.db:
+            teams = self._insert(paths)
+            self._touch(teams)
+
+    def remove(self, paths: Iterable[Path]) -> None:
+        """
+        削除した試合ファイルを索引から取り除く
+
+        Args:
+            paths (Iterable[Path]): teamsディレクトリから削除した試合ファイル一覧
+        """
+        with self.db:
+            teams = set()
+            for path in paths:
+                self.db.execute('DELETE FROM matches WHERE path = ?', (str(path),))
+                teams.add(path.parent.name)
+            self._touch(teams)
+
+    def team_names(self) -> List[str]:
+        """
+        Returns:
+            List[str]: 記録されているチーム名一覧
+        """
+        return [row[0] for row in self.db.execute('SELECT team FROM dirs ORDER BY team')]
+
+    def map_names(self) -> List[str]:
+        """
+        Returns:
+            List[str]: 記録されているマップ名一覧(拡張子なし)
+        """
+        return [row[0] for row in self.db.execute('SELECT DISTINCT map_name FROM matches ORDER BY map_name')]
+
+    def match_names(self) -> List[str]:
+        """
+        Returns:
+            List[str]: 記録されている試合名一覧
+        """
+        return [row[0] for row in self.db.execute('SELECT DISTINCT match_name FROM matches ORDER BY match_name')]
+
+    def find(self,
+             map_name: str,
+             match_names: List[str]=None,
+             teams: List[str]=None,
+             start: datetime.date=None,
+             end: datetime.date=None,
+             rcount: int=None) -> List[MatchRecord]:
+        """
+        条件に一致する試合を返す(Noneの条件は絞り込まない)
+
+        Args:
+            map_name (str): マップ名(拡張子なし)
+            match_names (List[str]): 試合名一覧
+            teams (List[str]): チーム名一覧
+            start (datetime.date): 開始日
+            end (datetime.date): 終了日
+            rcount (int): ラウンド数
+
+        Returns:
+            List[MatchRecord]: 条件に一致する試合一覧
+        """
+        sql = 'SELECT team, match_name, map_name, date, rcount, path FROM matches WHERE map_name = ?'
+        params = [map_name]
+        if start is not None:
+            sql += ' AND date >= ?'
+            params.append(start.isoformat())
+        if end is not None:
+            sql += ' AND date <= ?'
+            params.append(end.isoformat())
+        if rcount is not None:
+            sql += ' AND rcount = ?'
+            params.append(rcount)
+        for column, values in (('match_name', match_names), ('team', teams)):
+            if values is not None:
+                sql += f' AND {column} IN ({",".join("?" * len(values))})'
+                params.extend(values)
+
+        return [MatchRecord(team, match_name, map_name, datetime.date.fromisoformat(date), rcount, Path(path))
+                for team, match_name, map_name, date, rcount, path in self.db.execute(sql, params)]
+
+    def close(self) -> None:
+        self.db.close()
+
+    def _insert(self, paths: Iterable[Path]) -> set:
+        """
+        試合ファイルを索引に書き込み、対象のチーム名一覧を返す
+        """
+        teams = set()
+        for path in paths:
+            record = parse_match_path(path)
+            if record is None:
+                continue
+            self.db.execute('INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?, ?)',
+                            (str(path), record.team, record.match_name, record.map_name,
+                             record.date.isoformat(), record.rcount))
+            teams.add(path.parent.name)
+        return teams
+
+    def _touch(self, teams: Iterable[str]) -> None:
+        """
+        索引を更新済みのチームディレクトリのmtimeを記録し直す
+        """
+        for team in teams:
+            team_dir = self.teams / team
+            if team_dir.is_dir():
+                self.db.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?)', (team, team_dir.stat().st_mtime_ns))
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""
+同じ試合・ラウンドで降下地点が近いチーム同士(降下被り)を数え、マップごとのチーム対チームの表を作る
+
+降下被りとみなす距離はゲーム内の距離(メートル)で指定し、マップの縮尺(calibration参照)で正規化座標に変換する。
+結果はマップごとに cache/contests/<マップ名>.json に保存し、閲覧画面の「降下被り」から表示する
+
+使い方:
+    python src/contest.py [--maps Erangel Miramar] [--threshold 250]
+"""
+from itertools import combinations
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from calibration import world_size
+from cachestore import cli_parser, open_catalog, read_json, write_json
+from catalog import Catalog
+from pointstore import MapPoints, PointStore
+
+# 降下被りとみなす距離(メートル)
+THRESHOLD = 250.0
+
+
+def contest_matrix(points: MapPoints, rows: Iterable[int], threshold: float) -> dict:
+    """
+    (試合名, 日付, ラウンド)ごとに全チームの組の最短距離を求め、降下被りの回数を数える
+
+    Args:
+        points (MapPoints): マップの列データ
+        rows (Iterable[int]): 対象の行番号一覧
+        threshold (float): 降下被りとみなす距離(正規化座標)
+
+    Returns:
+        dict: {'teams': チーム名一覧,
+               'contested': [i][j] = チームiとjの降下被りの回数,
+               'together': [i][j] = チームiとjが同じ試合にいた回数(i == jの場合はチームiの試合数)}
+    """
+    # 試合ごと・チームごとの点
+    games: Dict[tuple, Dict[int, list]] = {}
+    for i in rows:
+        game = (points.match[i], points.date[i], points.rcount[i])
+        games.setdefault(game, {}).setdefault(points.team[i], []).append((points.x[i], points.y[i]))
+
+    team_ids = sorted({team_id for teams in games.values() for team_id in teams}, key=lambda t: points.teams[t])
+    pos = {team_id: n for n, team_id in enumerate(team_ids)}
+    contested = [[0] * len(team_ids) for _ in team_ids]
+    together = [[0] * len(team_ids) for _ in team_ids]
+    t2 = threshold * threshold
+    for teams in games.values():
+        for team_id in teams:
+            together[pos[team_id]][pos[team_id]] += 1
+        for a, b in combinations(teams, 2):
+            i, j = pos[a], pos[b]
+            together[i][j] += 1
+            together[j][i] += 1
+            # 1チームの点は高々4つなので総当たりで十分
+            if any((ax - bx) ** 2 + (ay - by) ** 2 <= t2 for ax, ay in teams[a] for bx, by in teams[b]):
+                contested[i][j] += 1
+                contested[j][i] += 1
+    return {'teams': [points.teams[t] for t in team_ids], 'contested': contested, 'together': together}
+
+
+def build_contests(catalog: Catalog,
+                   points: PointStore,
+                   root: Path,
+                   map_name: str,
+                   threshold: float=THRESHOLD,
+                   force: bool=False,
+                   progress: Callable[[int, int], bool]=None) -> Optional[dict]:
+    """
+    マップの降下被りの表を作成して保存する(前回から試合が増減していなければ保存済みのものを返す)
+
+    Args:
+        catalog (Catalog): 試合ファイルの索引
+        points (PointStore): マップごとの降下地点の列データ
+        root (Path): 降下被りの表の保存用ディレクトリ
+        map_name (str): マップ名(拡張子なし)
+        threshold (float): 降下被りとみなす距離(メートル)
+        force (bool): Trueの場合は必ず作り直す
+        progress (Callable[[int, int], bool]): 未登録の試合ファイルの読み込み状況の通知先(PointStore.update参照)
+
+    Returns:
+        Optional[dict]: 降下被りの表(contest_matrix参照、progressで読み込みを打ち切った場合はNone)
+    """
+    records = catalog.find(map_name)
+    cancelled = False
+
+    def loaded(done: int, total: int) -> bool:
+        nonlocal cancelled
+        cancelled = progress is not None and not progress(done, total)
+        return not cancelled
+
+    # 読み込みの途中で作ると表が欠けるので、打ち切った場合は作らない
+    points.update(map_name, records, loaded)
+    if cancelled:
+        return None
+    size = world_size(map_name)
+    with points.lock:
+        map_points = points.open(map_name)
+        try:
+            # マップの縮尺が変わった場合も作り直す
+            source = [map_points.rows, map_points.generation, len(records), size]
+            saved = load_contests(root, map_name)
+            if not force and saved is not None and saved['source'] == source and saved['threshold'] == threshold:
+                return saved
+            result = contest_matrix(map_points,
+                                    map_points.where(paths=[record.path for record in records]),
+                                    threshold / size)
+        finally:
+            points.close()
+
+    result.update({'threshold': threshold, 'source': source})
+    write_json(root / f'{map_name}.json', result)
+    return result
+
+
+def load_contests(root: Path, map_name: str) -> Optional[dict]:
+    """
+    Args:
+        root (Path): 降下被りの表の保存用ディレクトリ
+        map_name (str): マップ名(拡張子なし)
+
+    Returns:
+        Optional[dict]: 保存済みの降下被りの表(未作成の場合はNone)
+    """
+    return read_json(root / f'{map_name}.json')
+
+
+def top_pairs(result: dict, teams: List[str]=None) -> List[tuple]:
+    """
+    Args:
+        result (dict): 降下被りの表
+        teams (List[str]): 対象のチーム名一覧(Noneの場合は全チーム)
+
+    Returns:
+        List[tuple]: 降下被りの回数が多い順の(チーム名, チーム名, 降下被りの回数, 同じ試合にいた回数)一覧
+    """
+    names = result['teams']
+    pairs = []
+    for i, j in combinations(range(len(names)), 2):
+        if teams is not None and names[i] not in teams and names[j] not in teams:
+            continue
+        if result['contested'][i][j]:
+            pairs.append((names[i], names[j], result['contested'][i][j], result['together'][i][j]))
+    return sorted(pairs, key=lambda p: (-p[2], -p[2] / p[3]))
+
+
+def main() -> None:
+    parser = cli_parser('マップごとの降下被りの表を作成')
+    parser.add_argument('--maps', nargs='+', help='マップ名(省略した場合は全マップ)')
+    parser.add_argument('--teams', nargs='+', help='表示するチーム名')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='降下被りとみなす距離(メートル)')
+    parser.add_argument('--force', action='store_true', help='試合が増減していなくても作り直す')
+    args = parser.parse_args()
+
+    catalog = open_catalog(args)
+    points = PointStore(args.cache / 'points')
+    for map_name in args.maps or catalog.map_names():
+        result = build_contests(catalog, points, args.cache / 'contests', Path(map_name).stem, args.threshold, args.force)
+        print(f'## {map_name}')
+        for a, b, n, total in top_pairs(result, args.teams)[:20]:
+            print(f'{a}\t{b}\t{n}/{total}')
+    catalog.close()
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
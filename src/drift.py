@@ -0,0 +1,204 @@
+"""
+チーム・マップごとの降下地点の推移(期間ごとの中心と広がり、降下地点を変えた時期)
+
+日ごとに点の数・座標の和・二乗和だけを cache/drift/<マップ名>/<チーム名>.json に持ち、
+試合を記録するごとにその試合の分だけ足し引きする(試合ごとの内訳は<チーム名>.files.jsonに持つ)。
+直近window日間の中心と広がりはこの日ごとの和から求めるので、全履歴を読み直さない
+
+降下地点を変えた時期は、ある日までのwindow日間とその前のwindow日間の中心の距離が
+MIN_SHIFT以上かつ、ばらつきに対してZ倍以上離れているときの後の期間の始まり(続く場合は最も離れているもの)とする
+
+使い方:
+    python src/drift.py Miramar [--teams チームA] [--window 14]
+    python src/drift.py --rebuild
+"""
+import argparse
+import bisect
+import datetime
+import math
+from typing import List, NamedTuple, Tuple
+
+from cachestore import TeamMapStore, cli_parser
+from catalog import MatchRecord
+from landmarks import landmark_name
+from recordio import load_match
+
+# 保存形式(変わった場合は作り直す)
+DRIFT_VERSION = 1
+# 中心と広がりを求める期間(日数)
+WINDOW = 14
+# 比べる2つの期間それぞれに必要な試合数
+MIN_MATCHES = 5
+# 降下地点を変えたとみなす中心の距離(正規化座標)
+MIN_SHIFT = 0.05
+# 降下地点を変えたとみなす、中心の距離とそのばらつき(標準誤差)の比
+Z = 3.0
+
+
+class TrendPoint(NamedTuple):
+    """
+    ある日までのwindow日間の降下地点
+    """
+    date: datetime.date
+    matches: int  # 試合数
+    points: int  # 点の数
+    x: float  # 中心(正規化座標)
+    y: float
+    spread: float  # 中心からの距離の二乗平均平方根(正規化座標)
+
+
+class Shift(NamedTuple):
+    """
+    降下地点を変えた時期
+    """
+    date: datetime.date  # 後の期間の最初の記録日(降下地点を変えた時期の目安)
+    before: Tuple[float, float]  # 前の期間の中心
+    after: Tuple[float, float]  # 後の期間の中心
+    distance: float  # 中心の距離(正規化座標)
+    score: float  # 中心の距離 / 標準誤差
+
+
+class Drift:
+    """
+    1チーム・1マップ分の日ごとの降下地点の集計
+    """
+
+    def __init__(self, data: dict) -> None:
+        """
+        Args:
+            data (dict): 集計({'days': {日付(序数): [試合数, 点の数, xの和, yの和, xの二乗和, yの二乗和]}, ...})
+        """
+        self.days = sorted(int(day) for day in data['days'])
+        # 日付順の累積和(prefix[k]は先頭k日分)
+        self.prefix = [[0.0] * 6]
+        for day in self.days:
+            self.prefix.append([a + b for a, b in zip(self.prefix[-1], data['days'][str(day)])])
+
+    def _window(self, first: int, last: int) -> List[float]:
+        """
+        first日の翌日からlast日まで(序数)の合計
+        """
+        hi = self.prefix[bisect.bisect_right(self.days, last)]
+        lo = self.prefix[bisect.bisect_right(self.days, first)]
+        return [a - b for a, b in zip(hi, lo)]
+
+    @staticmethod
+    def _summary(sums: List[float]) -> Tuple[float, float, float]:
+        """
+        合計から(中心x, 中心y, 分散)を求める
+        """
+        _, n, sx, sy, sxx, syy = sums
+        x, y = sx / n, sy / n
+        return x, y, max(sxx / n - x * x + syy / n - y * y, 0.0)
+
+    def trend(self, window: int=WINDOW) -> List[TrendPoint]:
+        """
+        Args:
+            window (int): 期間(日数)
+
+        Returns:
+            List[TrendPoint]: 記録がある日ごとの、その日までのwindow日間の降下地点(日付順)
+        """
+        trend = []
+        for day in self.days:
+            sums = self._window(day - window, day)
+            if sums[1] < 1:
+                continue
+            x, y, var = self._summary(sums)
+            trend.append(TrendPoint(datetime.date.fromordinal(day), round(sums[0]), round(sums[1]), x, y, math.sqrt(var)))
+        return trend
+
+    def shifts(self,
+               window: int=WINDOW,
+               min_matches: int=MIN_MATCHES,
+               min_shift: float=MIN_SHIFT,
+               z: float=Z) -> List[Shift]:
+        """
+        Args:
+            window (int): 比べる期間(日数)
+            min_matches (int): 比べる2つの期間それぞれに必要な試合数
+            min_shift (float): 降下地点を変えたとみなす中心の距離(正規化座標)
+            z (float): 降下地点を変えたとみなす、中心の距離と標準誤差の比
+
+        Returns:
+            List[Shift]: 降下地点を変えた時期(日付順)
+        """
+        found = []
+        for day in self.days:
+            after = self._window(day - window, day)
+            before = self._window(day - 2 * window, day - window)
+            if after[0] < min_matches or before[0] < min_matches:
+                continue
+            bx, by, bvar = self._summary(before)
+            ax, ay, avar = self._summary(after)
+            distance = math.hypot(ax - bx, ay - by)
+            # 1試合の点は同じ場所に固まるので、試合数を標本数として標準誤差を求める
+            se = math.sqrt(bvar / before[0] + avar / after[0])
+            score = distance / se if se > 0 else math.inf
+            if distance < min_shift or score < z:
+                continue
+            first = self.days[bisect.bisect_right(self.days, day - window)]
+            shift = Shift(datetime.date.fromordinal(first), (bx, by), (ax, ay), distance, score)
+            # window日以内に続く場合は最も離れている時期だけ残す
+            if found and (shift.date - found[-1].date).days <= window:
+                if shift.score > found[-1].score:
+                    found[-1] = shift
+            else:
+                found.append(shift)
+        return found
+
+
+class DriftStore(TeamMapStore):
+    """
+    チーム・マップごとの日ごとの降下地点の集計の保存先
+    """
+    VERSION = DRIFT_VERSION
+    result = Drift
+
+    def _empty(self) -> dict:
+        return {'version': DRIFT_VERSION, 'days': {}}
+
+    @staticmethod
+    def _entry(record: MatchRecord) -> list:
+        """
+        試合ごとの内訳([mtime, 日付(序数), 点の数, xの和, yの和, xの二乗和, yの二乗和])
+        """
+        m = load_match(record.path)
+        xs = [pt['x'] / pt['w'] for pt in m.pts]
+        ys = [pt['y'] / pt['h'] for pt in m.pts]
+        return [record.path.stat().st_mtime_ns, record.date.toordinal(), len(xs),
+                sum(xs), sum(ys), sum(x * x for x in xs), sum(y * y for y in ys)]
+
+    @staticmethod
+    def _apply(data: dict, entry: list, sign: int) -> None:
+        _, day, *sums = entry
+        # 点のない試合は数えない
+        values = [sign if sums[0] else 0] + [sign * v for v in sums]
+        days = data['days']
+        totals = [a + b for a, b in zip(days.get(str(day), [0] * 6), values)]
+        if totals[0] > 0:
+            days[str(day)] = totals
+        else:
+            days.pop(str(day), None)
+
+
+def show(drift: Drift, team: str, args: argparse.Namespace) -> None:
+    trend = drift.trend(args.window)
+    if not trend:
+        return
+    print(f'## {team}')
+    for p in trend:
+        print(f'{p.date}\t{p.matches}試合\t{landmark_name(p.x, p.y)} ({p.x:.3f}, {p.y:.3f})\t広がり {p.spread:.3f}')
+    for s in drift.shifts(args.window):
+        print(f'{s.date}\t移動 {landmark_name(*s.before)} -> {landmark_name(*s.after)}'
+              f'\t距離 {s.distance:.3f} ({s.score:.1f})')
+
+
+def main() -> None:
+    parser = cli_parser('チーム・マップごとの降下地点の推移')
+    parser.add_argument('--window', type=int, default=WINDOW, help='中心と広がりを求める期間(日数)')
+    DriftStore.main(parser, 'drift', show)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,110 @@
+import math
+from array import array
+from typing import Dict, List, Sequence, Tuple
+
+from PIL import Image, ImageColor, ImageFilter
+
+
+def _gradient_lut() -> Tuple[List[int], List[int], List[int], List[int]]:
+    """
+    全体表示用の配色(透明 -> 青 -> 緑 -> 黄 -> 赤)
+
+    Returns:
+        Tuple[List[int], List[int], List[int], List[int]]: R, G, B, Aのルックアップテーブル
+    """
+    stops = [(0, (0, 0, 255)), (96, (0, 255, 0)), (176, (255, 255, 0)), (255, (255, 0, 0))]
+    r, g, b, a = [], [], [], []
+    for v in range(256):
+        for (v0, c0), (v1, c1) in zip(stops, stops[1:]):
+            if v0 <= v <= v1:
+                t = (v - v0) / (v1 - v0)
+                r.append(round(c0[0] + (c1[0] - c0[0]) * t))
+                g.append(round(c0[1] + (c1[1] - c0[1]) * t))
+                b.append(round(c0[2] + (c1[2] - c0[2]) * t))
+                break
+        a.append(min(255, v * 3))
+    return r, g, b, a
+
+
+GRADIENT_LUT = _gradient_lut()
+
+
+def density(points: Sequence[Tuple[float, float]],
+            size: Tuple[int, int],
+            cell: int=4,
+            sigma: float=3.0) -> Image.Image:
+    """
+    降下地点の密度画像(0~255)
+
+    表示サイズをcell四方のマス目に区切って点を数え、対数で0~255に圧縮してから
+    ガウスぼかしをかける
+
+    Args:
+        points (Sequence[Tuple[float, float]]): 表示座標(x, y)の一覧
+        size (Tuple[int, int]): 表示サイズ(幅, 高さ)
+        cell (int): マス目の一辺(ピクセル)
+        sigma (float): ぼかしの強さ(マス目数)
+
+    Returns:
+        Image.Image: マス目単位の密度画像(Lモード)
+    """
+    gw, gh = max(1, size[0] // cell), max(1, size[1] // cell)
+    counts = array('I', bytes(4 * gw * gh))
+    for x, y in points:
+        gx, gy = int(x) // cell, int(y) // cell
+        if 0 <= gx < gw and 0 <= gy < gh:
+            counts[gy * gw + gx] += 1
+
+    peak = max(counts) if counts else 0
+    if peak == 0:
+        return Image.new('L', (gw, gh), 0)
+    scale = 255 / math.log1p(peak)
+    lut = [int(math.log1p(c) * scale) for c in range(peak + 1)]
+    grid = Image.frombytes('L', (gw, gh), bytes(map(lut.__getitem__, counts)))
+    grid = grid.filter(ImageFilter.GaussianBlur(sigma))
+    # ぼかしで下がったピークを255に戻す
+    top = grid.getextrema()[1]
+    if 0 < top < 255:
+        grid = grid.point([min(255, v * 255 // top) for v in range(256)])
+    return grid
+
+
+def render_heatmap(points: Sequence[Tuple[float, float, int]],
+                   size: Tuple[int, int],
+                   team_colors: Dict[int, str]=None,
+                   cell: int=4,
+                   sigma: float=3.0) -> Image.Image:
+    """
+    降下地点のヒートマップを1枚の半透明画像として描画
+
+    Args:
+        points (Sequence[Tuple[float, float, int]]): 表示座標とチームID(x, y, チームID)の一覧
+        size (Tuple[int, int]): 表示サイズ(幅, 高さ)
+        team_colors (Dict[int, str]): チームID -> 色名(Noneの場合は全チームまとめて配色)
+        cell (int): マス目の一辺(ピクセル)
+        sigma (float): ぼかしの強さ(マス目数)
+
+    Returns:
+        Image.Image: マップに重ねる画像(RGBAモード)
+    """
+    if team_colors is None:
+        heat = density([(x, y) for x, y, _ in points], size, cell, sigma)
+        overlay = Image.merge('RGBA', [heat.point(lut) for lut in GRADIENT_LUT])
+        return overlay.resize(size, Image.BILINEAR)
+
+    by_team: Dict[int, List[Tuple[float, float]]] = {}
+    for x, y, team_id in points:
+        by_team.setdefault(team_id, []).append((x, y))
+
+    # チームごとの色をマス目単位で重ねてから最後に一度だけ拡大する
+    overlay = None
+    for team_id, team_points in by_team.items():
+        heat = density(team_points, size, cell, sigma)
+        if overlay is None:
+            overlay = Image.new('RGBA', heat.size, (0, 0, 0, 0))
+        layer = Image.new('RGBA', heat.size, ImageColor.getrgb(team_colors[team_id]) + (0,))
+        layer.putalpha(heat.point([min(200, v * 2) for v in range(256)]))
+        overlay = Image.alpha_composite(overlay, layer)
+    if overlay is None:
+        return Image.new('RGBA', size, (0, 0, 0, 0))
+    return overlay.resize(size, Image.BILINEAR)
\ No newline at end of file
@@ -0,0 +1,278 @@
+"""
+CSV・JSON Linesの降下地点データをまとめて取り込む
+
+1行に1点(team, match, map, date, round, x, y[, w, h])、またはJSON Linesの場合は
+1行に1試合(team, match, map, date, round, pts: [[x, y], ...] または [{x, y, w, h}, ...])を書く。
+w, hを省略した場合はx, yを0~1に正規化された座標として扱う。
+
+使い方:
+    python src/importer.py scrim1.csv scrim2.jsonl [--overwrite]
+"""
+import csv
+import datetime
+import json
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from cachestore import cli_parser, open_catalog
+from catalog import Catalog, parse_match_path
+from match import Match, NGCHARAS
+from pointstore import PointStore
+from recordio import EXT, load_match, save_match
+from regionstats import RegionStatsStore
+from drift import DriftStore
+
+# 1試合あたりの点の数の上限(記録画面と同じ)
+MAX_POINTS = 4
+# ラウンド数の上限
+MAX_ROUND = 47
+
+
+class RowError(ValueError):
+    """
+    取り込めない行
+    """
+
+
+def read_rows(path: Path) -> Iterator[Tuple[str, dict]]:
+    """
+    ファイルを1行ずつ読み込む(拡張子が.csvならCSV、それ以外はJSON Lines)
+
+    Args:
+        path (Path): 取り込むファイル
+
+    Yields:
+        Tuple[str, dict]: (ファイル名:行番号, 行の内容)
+    """
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if path.suffix.lower() == '.csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield f'{path}:{reader.line_num}', row
+        else:
+            for n, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    row = e
+                yield f'{path}:{n}', row
+
+
+def parse_name(row: dict, key: str, label: str) -> str:
+    """
+    チーム名等を取り出して使用可能な文字かチェックする
+    """
+    name = str(row.get(key) or '').strip()
+    if key == 'map':
+        # マップ画像のファイル名でもよい
+        name = Path(name).stem
+    if not name:
+        raise RowError(f'{label}がありません')
+    for char in NGCHARAS:
+        if char in name:
+            raise RowError(f'"{char}"を{label}に含めないでください: {name}')
+    return name
+
+
+def parse_row(row: dict) -> Tuple[tuple, List[Dict[str, float]]]:
+    """
+    1行分の内容を検証し、試合のキーと点の一覧に変換する
+
+    Args:
+        row (dict): 行の内容
+
+    Returns:
+        Tuple[tuple, List[Dict[str, float]]]: ((チーム名, 試合名, マップ名, 日付, ラウンド数), 点の一覧)
+    """
+    if not isinstance(row, dict):
+        raise RowError(f'行を読み込めません: {row}')
+    team = parse_name(row, 'team', 'チーム名')
+    match_name = parse_name(row, 'match', 'スクリム名')
+    map_name = parse_name(row, 'map', 'マップ名')
+
+    try:
+        date = datetime.datetime.strptime(str(row.get('date', '')).strip().replace('/', '-'), '%Y-%m-%d').date()
+    except ValueError:
+        raise RowError(f'日付の形式が無効です: {row.get("date")}')
+    try:
+        rcount = int(str(row.get('round', '')).strip().lstrip('Rr'))
+    except ValueError:
+        raise RowError(f'ラウンド数が無効です: {row.get("round")}')
+    if not 1 <= rcount <= MAX_ROUND:
+        raise RowError(f'ラウンド数が無効です: {rcount}')
+
+    raw_pts = row['pts'] if 'pts' in row else [row]
+    if not isinstance(raw_pts, list):
+        raise RowError(f'座標の一覧が無効です: {raw_pts}')
+    pts = []
+    for raw in raw_pts:
+        if not isinstance(raw, (dict, list, tuple)):
+            raise RowError(f'座標が無効です: {raw}')
+        try:
+            if isinstance(raw, dict):
+                x, y = float(raw['x']), float(raw['y'])
+                w, h = raw.get('w') or None, raw.get('h') or None
+            else:
+                x, y = float(raw[0]), float(raw[1])
+                w = h = None
+            # 表示サイズがない場合は正規化座標
+            w, h = (1, 1) if w is None or h is None else (int(float(w)), int(float(h)))
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise RowError(f'座標が無効です: {raw}')
+        if not (0 <= x <= w and 0 <= y <= h):
+            raise RowError(f'座標がマップの外です: {raw}')
+        pts.append({'x': x, 'y': y, 'w': w, 'h': h})
+    return (team, match_name, map_name, date, rcount), pts
+
+
+class Importer:
+    """
+    検証済みの行を試合ごとにまとめ、一定数たまったらまとめて保存する
+
+    1試合の行が複数のまとまりに分かれる場合があるので、先にcountで試合ごとの点の数を数えておき、
+    点の数が上限を超える試合は最初のまとまりから保存しない
+    """
+
+    def __init__(self,
+                 teams: Path,
+                 catalog: Catalog,
+                 points: PointStore,
+                 region_stats: RegionStatsStore,
+                 drift: DriftStore=None,
+                 overwrite: bool=False,
+                 batch: int=5000) -> None:
+        """
+        Args:
+            teams (Path): チームデータ保存用ディレクトリ
+            catalog (Catalog): 試合ファイルの索引
+            points (PointStore): マップごとの降下地点の列データ
+            region_stats (RegionStatsStore): チーム・マップごとの区画別の集計
+            drift (DriftStore): チーム・マップごとの降下地点の推移(Noneの場合は更新しない)
+            overwrite (bool): Trueの場合は記録済みの試合を上書きする
+            batch (int): まとめて保存する試合数
+        """
+        self.teams = teams
+        self.catalog = catalog
+        self.points = points
+        self.region_stats = region_stats
+        self.drift = drift
+        self.overwrite = overwrite
+        self.batch = batch
+        self.pending: Dict[tuple, List[Dict[str, float]]] = {}
+        self.totals: Dict[tuple, int] = {}  # 試合ごとの取り込む点の数(countで数えたもの)
+        self.written = set()  # この取り込みで保存した試合
+        self.skipped = set()  # 記録済みのため取り込まなかった試合
+        self.rejected = set()  # 点の数が多すぎるため取り込まなかった試合
+        self.stats = {'matches': 0, 'points': 0, 'skipped': 0, 'errors': 0}
+
+    def count(self, rows: Iterable[Tuple[str, dict]]) -> None:
+        """
+        取り込む前に試合ごとの点の数を数える(取り込めない行はfeedで報告するので数えない)
+
+        Args:
+            rows (Iterable[Tuple[str, dict]]): (行の位置, 行の内容)の一覧
+        """
+        for _, row in rows:
+            try:
+                key, pts = parse_row(row)
+            except RowError:
+                continue
+            self.totals[key] = self.totals.get(key, 0) + len(pts)
+
+    def feed(self, rows: Iterable[Tuple[str, dict]]) -> None:
+        """
+        Args:
+            rows (Iterable[Tuple[str, dict]]): (行の位置, 行の内容)の一覧
+        """
+        for where, row in rows:
+            try:
+                key, pts = parse_row(row)
+            except RowError as e:
+                self.error(where, e)
+                continue
+            self.pending.setdefault(key, []).extend(pts)
+            if len(self.pending) >= self.batch:
+                self.flush()
+
+    def flush(self) -> None:
+        """
+        たまっている試合を保存し、索引と列データに反映する
+        """
+        paths = []
+        for key, pts in self.pending.items():
+            team, match_name, map_name, date, rcount = key
+            path = self.teams / team / f'{team}_{match_name}_{map_name}_{date}_R{rcount}{EXT}'
+            if key in self.skipped or key in self.rejected:
+                continue
+            if key in self.written:
+                # 前のまとまりで保存した試合の続き
+                pts = load_match(path).pts + pts
+            elif path.exists() and not self.overwrite:
+                self.skipped.add(key)
+                self.stats['skipped'] += 1
+                continue
+            # 後のまとまりで上限を超える試合も、最初に保存する前に除く
+            total = max(self.totals.get(key, 0), len(pts))
+            if total > MAX_POINTS:
+                self.rejected.add(key)
+                self.error(path.name, RowError(f'点の数が多すぎます({total}点)'))
+                continue
+
+            path.parent.mkdir(exist_ok=True)
+            save_match(path, Match(team, match_name, map_name, date, rcount, pts))
+            if key not in self.written:
+                self.written.add(key)
+                self.stats['matches'] += 1
+            self.stats['points'] += len(self.pending[key])
+            paths.append(path)
+        self.pending = {}
+
+        self.catalog.add(paths)
+        records = [parse_match_path(path) for path in paths]
+        self.region_stats.add(records)
+        if self.drift is not None:
+            self.drift.add(records)
+        by_map: Dict[str, list] = {}
+        for record in records:
+            by_map.setdefault(record.map_name, []).append(record)
+        for map_name, records in by_map.items():
+            self.points.update(map_name, records)
+
+    def error(self, where: str, e: Exception) -> None:
+        self.stats['errors'] += 1
+        print(f'{where}: {e}', file=sys.stderr)
+
+
+def main() -> None:
+    parser = cli_parser('CSV・JSON Linesの降下地点データを取り込む')
+    parser.add_argument('files', nargs='+', type=Path, help='取り込むファイル(.csv / .jsonl)')
+    parser.add_argument('--overwrite', action='store_true', help='記録済みの試合を上書きする')
+    parser.add_argument('--batch', type=int, default=5000, help='まとめて保存する試合数')
+    args = parser.parse_args()
+
+    args.teams_dir.mkdir(parents=True, exist_ok=True)
+    catalog = open_catalog(args)
+    points = PointStore(args.cache / 'points')
+    region_stats = RegionStatsStore(args.cache / 'stats')
+    drift = DriftStore(args.cache / 'drift')
+    importer = Importer(args.teams_dir, catalog, points, region_stats, drift, overwrite=args.overwrite, batch=args.batch)
+    for path in args.files:
+        importer.count(read_rows(path))
+    for path in args.files:
+        importer.feed(read_rows(path))
+    importer.flush()
+    points.close()
+    catalog.close()
+
+    stats = importer.stats
+    print(f'{stats["matches"]}試合({stats["points"]}点)を取り込みました '
+          f'(記録済みのため除外: {stats["skipped"]}試合, エラー: {stats["errors"]}件)')
+    if stats['errors']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
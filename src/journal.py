@@ -0,0 +1,157 @@
+"""
+仮記録の確定保存(全ての試合を保存するか、1つも保存しないか)
+
+確定する試合ファイルの中身をまず1つのジャーナル(cache/commit.journal)に書いて1度だけfsyncし、
+それからteamsディレクトリに書き出して索引等を更新し、最後にジャーナルを消す。
+途中で止まった場合は、次回起動時にジャーナルが最後まで書けていれば書き出しからやり直し、
+書けていなければ捨てる(仮記録はジャーナルを消すまで取り除かない)
+"""
+import os
+import struct
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+from cachestore import fsync_dir, replace_file
+from recordio import RecordFormatError
+from staging import StagingArea
+
+MAGIC = b'LMKJ'
+_HEADER = struct.Struct('<4sI')  # MAGIC, 試合数
+_ENTRY = struct.Struct('<HHI')  # 保存先のバイト数, 仮記録のバイト数, 中身のバイト数(続けてそれぞれの中身)
+_END = b'DONE'  # ジャーナルを最後まで書けた印
+
+
+class BatchCommit:
+    """
+    仮記録をまとめてteamsディレクトリに確定保存する
+    """
+
+    def __init__(self, teams: Path, journal: Path, staging: StagingArea) -> None:
+        """
+        Args:
+            teams (Path): チームデータ保存用ディレクトリ
+            journal (Path): ジャーナルのパス
+            staging (StagingArea): 仮記録の置き場所
+        """
+        self.teams = teams
+        self.journal = journal
+        self.staging = staging
+
+    def stage(self, names: List[str]) -> List[Tuple[str, Path, bytes]]:
+        """
+        仮記録の保存先を決める
+
+        Args:
+            names (List[str]): 仮記録のファイル名一覧
+
+        Returns:
+            List[Tuple[str, Path, bytes]]: (仮記録のファイル名, 保存先, 中身)の一覧
+        """
+        staged = []
+        for name in names:
+            team_name = name.split('_')[0]
+            staged.append((name, self.teams / team_name / name, self.staging.body(name)))
+        return staged
+
+    @staticmethod
+    def conflicts(staged: List[Tuple[str, Path, bytes]]) -> List[Path]:
+        """
+        Args:
+            staged (List[Tuple[str, Path, bytes]]): stageの結果
+
+        Returns:
+            List[Path]: 既に存在する(上書きになる)保存先一覧
+        """
+        return [dest for _, dest, _ in staged if dest.exists()]
+
+    def commit(self, staged: List[Tuple[str, Path, bytes]], index: Callable[[List[Path]], None]=None) -> List[Path]:
+        """
+        まとめて確定保存する
+
+        試合の中身が確定するのはジャーナルの1度のfsyncで、それ以降に止まっても次回起動時にやり直せる。
+        ただしジャーナルを消した後はやり直せないので、書き出した試合ファイルとディレクトリも消す前にfsyncする(_apply参照)
+
+        Args:
+            staged (List[Tuple[str, Path, bytes]]): stageの結果
+            index (Callable[[List[Path]], None]): 保存した試合ファイル一覧を索引等に反映する処理
+                (ジャーナルを消す前に呼ぶので、途中で止まっても次回起動時にもう一度呼ばれる)
+
+        Returns:
+            List[Path]: 保存した試合ファイル一覧
+        """
+        entries = [(Path(name), dest, body) for name, dest, body in staged]
+        with open(self.journal, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, len(entries)))
+            for src, dest, body in entries:
+                d, s = str(dest).encode('utf-8'), str(src).encode('utf-8')
+                f.write(_ENTRY.pack(len(d), len(s), len(body)) + d + s + body)
+            f.write(_END)
+            f.flush()
+            os.fsync(f.fileno())
+        fsync_dir(self.journal.parent)
+        return self._apply(entries, index)
+
+    def recover(self, index: Callable[[List[Path]], None]=None) -> List[Path]:
+        """
+        前回途中で止まった確定保存をやり直す
+
+        Args:
+            index (Callable[[List[Path]], None]): 保存した試合ファイル一覧を索引等に反映する処理
+
+        Returns:
+            List[Path]: 保存し直した試合ファイル一覧(ジャーナルがない・書きかけの場合は空)
+        """
+        if not self.journal.exists():
+            return []
+        try:
+            entries = self._read()
+        except (RecordFormatError, struct.error):
+            # 書きかけのジャーナルは捨てる(teamsディレクトリには何も書いていない)
+            self.journal.unlink()
+            return []
+        return self._apply(entries, index)
+
+    def _apply(self, entries: List[Tuple[Path, Path, bytes]], index: Callable[[List[Path]], None]) -> List[Path]:
+        saved = []
+        dirs = set()
+        for _, dest, body in entries:
+            if not dest.parent.is_dir():
+                dest.parent.mkdir(parents=True)
+                dirs.add(dest.parent.parent)
+            with replace_file(dest, fsync=True) as f:
+                f.write(body)
+            saved.append(dest)
+            dirs.add(dest.parent)
+        # ジャーナルを消すと書き出しをやり直せなくなるので、消す前に試合ファイル(replace_fileのfsync)と
+        # その置き換え(ディレクトリのfsync)をディスクに書き込む。ジャーナルだけfsyncして消すと、電源が落ちたときに
+        # ジャーナルの削除だけがディスクに残り、試合ファイルが空や置き換え前のまま失われることがある
+        for d in dirs:
+            fsync_dir(d)
+        if index is not None:
+            index(saved)
+        # 仮記録を取り除いたことがジャーナルに書かれてから確定保存を終える
+        self.staging.remove(src.name for src, _, _ in entries)
+        self.staging.flush()
+        self.journal.unlink()
+        return saved
+
+    def _read(self) -> List[Tuple[Path, Path, bytes]]:
+        data = self.journal.read_bytes()
+        if len(data) < _HEADER.size + len(_END) or not data.endswith(_END):
+            raise RecordFormatError('ジャーナルが途中で切れています')
+        magic, n = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise RecordFormatError('ジャーナルではありません')
+        entries = []
+        pos = _HEADER.size
+        for _ in range(n):
+            d, s, b = _ENTRY.unpack_from(data, pos)
+            pos += _ENTRY.size
+            dest = Path(data[pos:pos+d].decode('utf-8'))
+            src = Path(data[pos+d:pos+d+s].decode('utf-8'))
+            pos += d + s
+            entries.append((src, dest, data[pos:pos+b]))
+            pos += b
+        if pos != len(data) - len(_END):
+            raise RecordFormatError('ジャーナルが途中で切れています')
+        return entries
\ No newline at end of file
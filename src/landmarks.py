@@ -0,0 +1,330 @@
+"""
+各チームの降下地点をマップごとにクラスタリングし、よく降りる場所(ランドマーク)を求める
+
+結果はチーム・マップごとに cache/landmarks/<マップ名>/<チーム名>.json に保存し、
+新しく記録された試合の点の近くにあるランドマークだけを求め直す
+
+使い方:
+    python src/landmarks.py Erangel [--teams チームA チームB]
+"""
+import datetime
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Set, Tuple
+
+from cachestore import cli_parser, open_catalog, read_json, shared_lock, write_json
+from pointstore import PointStore
+
+# 近傍とみなす距離(正規化座標)
+EPS = 0.02
+# ランドマークとみなすのに必要な近傍の点の数(自身を含む)
+MIN_PTS = 3
+# ランドマーク名に使うマップの区画数(縦横)
+NAME_GRID = 8
+# ランドマークに属さない点のラベル
+NOISE = -1
+# 保存形式(変わった場合は求め直す)
+CACHE_VERSION = 1
+
+
+class Landmark(NamedTuple):
+    """
+    1チームがよく降りる場所
+    """
+    name: str  # 区画名(例: 'C4'、同じ区画に複数ある場合は'C4-2'等)
+    x: float  # 中心のx座標(正規化座標)
+    y: float  # 中心のy座標(正規化座標)
+    spread: float  # 中心からの距離の二乗平均平方根(正規化座標)
+    count: int  # 点の数
+    matches: int  # 試合数
+    first: datetime.date  # 最初に降りた日
+    last: datetime.date  # 最後に降りた日
+
+
+class Grid:
+    """
+    点の近傍探索用の一様グリッド(1マスの大きさはeps)
+    """
+
+    def __init__(self, xs: List[float], ys: List[float], eps: float) -> None:
+        """
+        Args:
+            xs (List[float]): x座標一覧
+            ys (List[float]): y座標一覧
+            eps (float): 近傍とみなす距離
+        """
+        self.xs = xs
+        self.ys = ys
+        self.eps = eps
+        self.cells: Dict[tuple, List[int]] = {}
+        for i in range(len(xs)):
+            self.add(i)
+
+    def add(self, i: int) -> None:
+        self.cells.setdefault(self._cell(self.xs[i], self.ys[i]), []).append(i)
+
+    def near(self, x: float, y: float, r: float) -> Iterator[int]:
+        """
+        Args:
+            x (float): x座標
+            y (float): y座標
+            r (float): 距離(epsの整数倍を想定)
+
+        Yields:
+            int: (x, y)から距離r以内にある点の番号
+        """
+        n = int(-(-r // self.eps))
+        cx, cy = self._cell(x, y)
+        r2 = r * r
+        for gx in range(cx - n, cx + n + 1):
+            for gy in range(cy - n, cy + n + 1):
+                for i in self.cells.get((gx, gy), ()):
+                    dx = self.xs[i] - x
+                    dy = self.ys[i] - y
+                    if dx * dx + dy * dy <= r2:
+                        yield i
+
+    def _cell(self, x: float, y: float) -> tuple:
+        return int(x // self.eps), int(y // self.eps)
+
+
+def cluster(grid: Grid, labels: List[int], region: Iterable[int], next_label: int, min_pts: int=MIN_PTS) -> int:
+    """
+    region内の点にラベルを付け直す(グリッドで近傍を探すDBSCAN)
+
+    regionは、region内のコア点(近傍の点がmin_pts以上)と同じクラスタの点を全て含んでいる必要がある。
+    region外の点のラベルは変えない
+
+    Args:
+        grid (Grid): 全ての点のグリッド
+        labels (List[int]): 点ごとのラベル(書き換える)
+        region (Iterable[int]): ラベルを付け直す点の番号一覧
+        next_label (int): 次に使うラベル
+        min_pts (int): コア点とみなす近傍の点の数
+
+    Returns:
+        int: 次に使うラベル
+    """
+    region = list(region)
+    for i in region:
+        labels[i] = None
+    for i in region:
+        if labels[i] is not None:
+            continue
+        neighbors = list(grid.near(grid.xs[i], grid.ys[i], grid.eps))
+        if len(neighbors) < min_pts:
+            labels[i] = NOISE
+            continue
+        label = next_label
+        next_label += 1
+        labels[i] = label
+        queue = deque(neighbors)
+        while queue:
+            j = queue.popleft()
+            if labels[j] == NOISE:
+                # 境界点
+                labels[j] = label
+            if labels[j] is not None:
+                continue
+            labels[j] = label
+            neighbors = list(grid.near(grid.xs[j], grid.ys[j], grid.eps))
+            if len(neighbors) >= min_pts:
+                queue.extend(neighbors)
+    return next_label
+
+
+def landmark_name(x: float, y: float) -> str:
+    """
+    Args:
+        x (float): x座標(正規化座標)
+        y (float): y座標(正規化座標)
+
+    Returns:
+        str: 区画名(列はA~、行は1~)
+    """
+    col = min(int(x * NAME_GRID), NAME_GRID - 1)
+    row = min(int(y * NAME_GRID), NAME_GRID - 1)
+    return f'{chr(ord("A") + max(col, 0))}{max(row, 0) + 1}'
+
+
+class LandmarkStore:
+    """
+    チーム・マップごとのランドマークの保存先
+    """
+
+    def __init__(self, root: Path, points: PointStore, eps: float=EPS, min_pts: int=MIN_PTS) -> None:
+        """
+        Args:
+            root (Path): ランドマーク保存用ディレクトリ
+            points (PointStore): マップごとの降下地点の列データ
+            eps (float): 近傍とみなす距離(正規化座標)
+            min_pts (int): ランドマークとみなすのに必要な近傍の点の数
+        """
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.points = points
+        self.eps = eps
+        self.min_pts = min_pts
+        # 同じチームのランドマークを複数のスレッドが同時に求め直さないためのロック
+        # (同じディレクトリを使うLandmarkStore同士で共有する)
+        self.lock = shared_lock(root)
+
+    def get(self, map_name: str, team: str) -> List[Landmark]:
+        """
+        Args:
+            map_name (str): マップ名(拡張子なし)
+            team (str): チーム名
+
+        Returns:
+            List[Landmark]: 点の数が多い順のランドマーク一覧
+        """
+        return self.update(map_name, [team]).get(team, [])
+
+    def update(self, map_name: str, teams: Iterable[str]=None) -> Dict[str, List[Landmark]]:
+        """
+        列データに追加された試合を反映する
+
+        列データのロックは対象のチームの点を写し取る間だけ持ち、求め直している間は他のスレッドが列データを使える
+
+        Args:
+            map_name (str): マップ名(拡張子なし)
+            teams (Iterable[str]): 対象のチーム名一覧(Noneの場合は全チーム)
+
+        Returns:
+            Dict[str, List[Landmark]]: チーム名 -> 点の数が多い順のランドマーク一覧
+        """
+        # チーム名 -> 点の一覧((x, y, 日付, 試合ファイル)) と 試合ファイル -> 更新日時(ns)
+        rows_by_team: Dict[str, List[Tuple[float, float, int, str]]] = {}
+        mtimes: Dict[str, int] = {}
+        with self.points.lock:
+            points = self.points.open(map_name)
+            try:
+                names = {team_id: team for team_id, team in enumerate(points.teams)
+                         if teams is None or team in teams}
+                for name in names.values():
+                    rows_by_team[name] = []
+                for i in range(points.rows):
+                    team = names.get(points.team[i])
+                    if team is not None:
+                        f = points.files[points.file[i]]
+                        rows_by_team[team].append((points.x[i], points.y[i], points.date[i], f))
+                        mtimes[f] = points.mtimes[points.file[i]]
+            finally:
+                # 他のスレッドが列データに追記できるよう開いたままにしない
+                self.points.close()
+
+        with self.lock:
+            return {team: self._landmarks(self._update_team(map_name, team, rows, mtimes))
+                    for team, rows in rows_by_team.items()}
+
+    def _update_team(self,
+                     map_name: str,
+                     team: str,
+                     rows: List[Tuple[float, float, int, str]],
+                     mtimes: Dict[str, int]) -> dict:
+        path = self.root / map_name / f'{team}.json'
+        state = self._read(path)
+
+        # 削除・上書きされた試合がある場合は全て求め直す
+        if any(mtimes.get(f) != mtime for f, mtime in state['files'].items()):
+            state = self._empty()
+        new_rows = [row for row in rows if row[3] not in state['files']]
+        if not new_rows:
+            return state
+
+        files = list(state['files'])
+        file_ids = {f: n for n, f in enumerate(files)}
+        start = len(state['x'])
+        for x, y, date, f in new_rows:
+            if f not in file_ids:
+                file_ids[f] = len(files)
+                files.append(f)
+            state['x'].append(x)
+            state['y'].append(y)
+            state['date'].append(date)
+            state['file'].append(file_ids[f])
+            state['labels'].append(NOISE)
+        state['files'] = {f: mtimes[f] for f in files}
+
+        labels = state['labels']
+        grid = Grid(state['x'], state['y'], self.eps)
+        if start == 0:
+            region: Set[int] = set(range(len(labels)))
+        else:
+            # 追加した点から2eps以内の点と、そのランドマークに属する点だけを求め直す
+            # (コア点かどうかが変わりうるのは追加した点からeps以内の点で、それらとつながりうるのはさらにeps以内の点)
+            region = set()
+            for i in range(start, len(labels)):
+                region.update(grid.near(state['x'][i], state['y'][i], 2 * self.eps))
+            touched = {labels[i] for i in region if labels[i] != NOISE}
+            region.update(i for i, label in enumerate(labels) if label in touched)
+            for label in touched:
+                state['landmarks'].pop(str(label), None)
+        state['next'] = cluster(grid, labels, region, state['next'], self.min_pts)
+
+        # 求め直したランドマークの集計
+        members: Dict[int, List[int]] = {}
+        for i in region:
+            if labels[i] != NOISE:
+                members.setdefault(labels[i], []).append(i)
+        for label, idx in members.items():
+            state['landmarks'][str(label)] = self._summarize(state, idx)
+
+        write_json(path, state)
+        return state
+
+    def _empty(self) -> dict:
+        return {'version': CACHE_VERSION, 'eps': self.eps, 'min_pts': self.min_pts,
+                'files': {}, 'x': [], 'y': [], 'date': [], 'file': [], 'labels': [], 'next': 0, 'landmarks': {}}
+
+    def _read(self, path: Path) -> dict:
+        state = read_json(path, {})
+        if (state.get('version'), state.get('eps'), state.get('min_pts')) == (CACHE_VERSION, self.eps, self.min_pts):
+            return state
+        return self._empty()
+
+    @staticmethod
+    def _summarize(state: dict, idx: List[int]) -> dict:
+        n = len(idx)
+        cx = sum(state['x'][i] for i in idx) / n
+        cy = sum(state['y'][i] for i in idx) / n
+        var = sum((state['x'][i] - cx) ** 2 + (state['y'][i] - cy) ** 2 for i in idx) / n
+        dates = [state['date'][i] for i in idx]
+        return {'x': cx, 'y': cy, 'spread': var ** 0.5, 'count': n,
+                'matches': len({state['file'][i] for i in idx}), 'first': min(dates), 'last': max(dates)}
+
+    @staticmethod
+    def _landmarks(state: dict) -> List[Landmark]:
+        items = sorted(state['landmarks'].values(), key=lambda s: (-s['count'], -s['last']))
+        landmarks = []
+        names: Dict[str, int] = {}
+        for s in items:
+            name = landmark_name(s['x'], s['y'])
+            names[name] = names.get(name, 0) + 1
+            if names[name] > 1:
+                name = f'{name}-{names[name]}'
+            landmarks.append(Landmark(name, s['x'], s['y'], s['spread'], s['count'], s['matches'],
+                                      datetime.date.fromordinal(s['first']), datetime.date.fromordinal(s['last'])))
+        return landmarks
+
+
+def main() -> None:
+    parser = cli_parser('各チームのよく降りる場所(ランドマーク)')
+    parser.add_argument('map_name', help='マップ名')
+    parser.add_argument('--teams', nargs='+', help='チーム名')
+    args = parser.parse_args()
+
+    map_name = Path(args.map_name).stem
+    catalog = open_catalog(args)
+    points = PointStore(args.cache / 'points')
+    points.update(map_name, catalog.find(map_name))
+    catalog.close()
+
+    store = LandmarkStore(args.cache / 'landmarks', points)
+    for team, landmarks in store.update(map_name, args.teams).items():
+        for lm in landmarks:
+            print(f'{team}\t{lm.name}\t{lm.x:.4f}\t{lm.y:.4f}\t{lm.count}点\t{lm.matches}試合\t{lm.first}~{lm.last}')
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,270 @@
+import queue
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from catalog import Catalog
+from contest import build_contests
+from landmarks import LandmarkStore
+from pointstore import PointStore
+from query import QueryEngine
+from spatial import PointIndex
+
+
+class QueryWorker:
+    """
+    閲覧画面の検索をバックグラウンドのスレッドで実行する
+
+    結果はメッセージとしてキューに少しずつ流し、画面側はafter()で定期的にpoll()して受け取る
+
+    メッセージ:
+        ('progress', 読み込んだ数, 全体の数): 未登録の試合ファイルの読み込み状況
+        ('result', 試合一覧, チームID -> チーム名, 試合ファイルID -> パス, 試合ファイルID -> 更新日時(ns)): 選択された試合
+        ('points', x, y, チームID, 試合ファイルID): 座標の一部
+        ('done',): 全ての座標を送り終えた
+        ('error', 例外): 検索に失敗した
+    """
+
+    def __init__(self, teams: Path, cache: Path, chunk: int=2000) -> None:
+        """
+        Args:
+            teams (Path): チームデータ保存用ディレクトリ
+            cache (Path): 索引等の生成データ保存用ディレクトリ
+            chunk (int): 一度に送る点の数
+        """
+        self.teams = teams
+        self.cache = cache
+        self.chunk = chunk
+        self.job = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._cancel = threading.Event()
+
+    def start(self, **kwargs) -> int:
+        """
+        実行中の検索を取り消して新しい検索を始める
+
+        Args:
+            kwargs: QueryEngine.runの引数
+
+        Returns:
+            int: 検索の番号
+        """
+        self.cancel()
+        self.job += 1
+        self._cancel = threading.Event()
+        thread = threading.Thread(target=self._run, args=(self.job, self._cancel, kwargs), daemon=True)
+        thread.start()
+        return self.job
+
+    def cancel(self) -> None:
+        """
+        実行中の検索を取り消す
+        """
+        self._cancel.set()
+
+    def poll(self) -> List[tuple]:
+        """
+        Returns:
+            List[tuple]: 現在の検索から届いているメッセージ一覧(取り消した検索のものは捨てる)
+        """
+        messages = []
+        while True:
+            try:
+                job, message = self._queue.get_nowait()
+            except queue.Empty:
+                return messages
+            if job == self.job and not self._cancel.is_set():
+                messages.append(message)
+
+    def _run(self, job: int, cancel: threading.Event, kwargs: dict) -> None:
+        def send(*message) -> bool:
+            self._queue.put((job, message))
+            return not cancel.is_set()
+
+        # SQLiteの接続はスレッドをまたげないので検索ごとに開く
+        engine = QueryEngine.open(self.teams, self.cache)
+        try:
+            result = engine.run(progress=lambda done, total: send('progress', done, total), cancel=cancel, **kwargs)
+            if result is None or not send('result', result.records, result.teams, result.files, result.mtimes):
+                return
+            for i in range(0, len(result), self.chunk):
+                if not send('points',
+                            result.x[i:i+self.chunk],
+                            result.y[i:i+self.chunk],
+                            result.team[i:i+self.chunk],
+                            result.file[i:i+self.chunk]):
+                    return
+            send('done')
+        except Exception as e:
+            send('error', e)
+        finally:
+            engine.close()
+
+
+class LatestWorker:
+    """
+    閲覧画面の操作ごとの処理をバックグラウンドのスレッドで実行し、最後に始めた処理の結果だけを返す
+
+    結果はキューに入れ、画面側はafter()で定期的にpoll()して受け取る(前に始めた処理は取り消す)。
+    派生クラスは_workで処理を行い、send(*メッセージ)で結果等を送る
+    """
+
+    def __init__(self, teams: Path, cache: Path) -> None:
+        """
+        Args:
+            teams (Path): チームデータ保存用ディレクトリ
+            cache (Path): 索引等の生成データ保存用ディレクトリ
+        """
+        self.teams = teams
+        self.cache = cache
+        self.job = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._cancel = threading.Event()
+
+    def start(self, **kwargs) -> int:
+        """
+        実行中の処理を取り消して新しい処理を始める
+
+        Args:
+            kwargs: _workの引数
+
+        Returns:
+            int: 処理の番号
+        """
+        self.cancel()
+        self.job += 1
+        self._cancel = threading.Event()
+        thread = threading.Thread(target=self._run, args=(self.job, self._cancel, kwargs), daemon=True)
+        thread.start()
+        return self.job
+
+    def cancel(self) -> None:
+        """
+        実行中の処理を取り消す
+        """
+        self._cancel.set()
+
+    def poll(self) -> Optional[tuple]:
+        """
+        Returns:
+            Optional[tuple]: 最後に始めた処理から最後に届いたメッセージ(まだ届いていない・取り消した場合はNone)
+        """
+        message = None
+        while True:
+            try:
+                job, received = self._queue.get_nowait()
+            except queue.Empty:
+                return message
+            if job == self.job and not self._cancel.is_set():
+                message = received
+
+    def _run(self, job: int, cancel: threading.Event, kwargs: dict) -> None:
+        def send(*message) -> bool:
+            self._queue.put((job, message))
+            return not cancel.is_set()
+
+        try:
+            self._work(send, cancel, **kwargs)
+        except Exception as e:
+            send('error', e)
+
+    def _work(self, send: Callable[..., bool], cancel: threading.Event, **kwargs) -> None:
+        raise NotImplementedError
+
+
+class InspectWorker(LatestWorker):
+    """
+    閲覧画面でクリックした位置の試合をバックグラウンドのスレッドで探す
+
+    メッセージ:
+        ('progress', 読み込んだ数, 全体の数): 未登録の試合ファイルの読み込み状況
+        ('found', 試合一覧): 検索結果(QueryEngine.inspect参照)
+        ('error', 例外): 検索に失敗した
+    """
+
+    def __init__(self, teams: Path, cache: Path) -> None:
+        """
+        Args:
+            teams (Path): チームデータ保存用ディレクトリ
+            cache (Path): 索引等の生成データ保存用ディレクトリ
+        """
+        super().__init__(teams, cache)
+        self.indexes: Dict[str, PointIndex] = {}  # マップ名 -> 索引(検索をまたいで使い回す)
+
+    def _work(self, send: Callable[..., bool], cancel: threading.Event, **kwargs) -> None:
+        """
+        Args:
+            kwargs: QueryEngine.inspectの引数
+        """
+        # SQLiteの接続はスレッドをまたげないので検索ごとに開く
+        engine = QueryEngine.open(self.teams, self.cache)
+        try:
+            found = engine.inspect(indexes=self.indexes,
+                                   progress=lambda done, total: send('progress', done, total),
+                                   cancel=cancel,
+                                   **kwargs)
+            if found is not None:
+                send('found', found)
+        finally:
+            engine.close()
+
+
+class LandmarkWorker(LatestWorker):
+    """
+    表示中のチームの全記録を列データに取り込み、ランドマークをバックグラウンドのスレッドで求める
+
+    メッセージ:
+        ('progress', 読み込んだ数, 全体の数): 未登録の試合ファイルの読み込み状況
+        ('landmarks', チーム名 -> ランドマーク一覧): LandmarkStore.updateの結果
+        ('error', 例外): 求められなかった
+    """
+
+    def _work(self, send: Callable[..., bool], cancel: threading.Event, map_name: str, teams: List[str]) -> None:
+        """
+        Args:
+            map_name (str): マップ名(拡張子なし)
+            teams (List[str]): チーム名一覧
+        """
+        # SQLiteの接続はスレッドをまたげないので処理ごとに開く
+        catalog = Catalog(self.teams, self.cache / 'catalog.sqlite3')
+        points = PointStore(self.cache / 'points')
+        try:
+            catalog.sync()
+            # 検索で読み込んだ試合は絞り込まれているので、チームの全記録を取り込んでから求める
+            points.update(map_name, catalog.find(map_name, teams=teams), lambda done, total: send('progress', done, total))
+            if cancel.is_set():
+                return
+            send('landmarks', LandmarkStore(self.cache / 'landmarks', points).update(map_name, teams))
+        finally:
+            points.close()
+            catalog.close()
+
+
+class ContestWorker(LatestWorker):
+    """
+    マップの降下被りの表をバックグラウンドのスレッドで作成する(作成済みで試合が増減していなければ保存済みのもの)
+
+    メッセージ:
+        ('progress', 読み込んだ数, 全体の数): 未登録の試合ファイルの読み込み状況
+        ('contests', 降下被りの表): build_contestsの結果
+        ('error', 例外): 作成できなかった
+    """
+
+    def _work(self, send: Callable[..., bool], cancel: threading.Event, map_name: str) -> None:
+        """
+        Args:
+            map_name (str): マップ名(拡張子なし)
+        """
+        # SQLiteの接続はスレッドをまたげないので処理ごとに開く
+        catalog = Catalog(self.teams, self.cache / 'catalog.sqlite3')
+        points = PointStore(self.cache / 'points')
+        try:
+            catalog.sync()
+            result = build_contests(catalog, points, self.cache / 'contests', map_name,
+                                    progress=lambda done, total: send('progress', done, total))
+            if result is not None:
+                send('contests', result)
+        finally:
+            points.close()
+            catalog.close()
+
@@ -0,0 +1,267 @@
+import math
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Tuple
+
+from PIL import Image
+
+# ディスクに保存する縮小版マップの一辺の長さ
+PYRAMID_LEVELS = (512, 1024, 2048)
+# 拡大表示用のタイルの一辺の長さ
+TILE = 256
+
+
+def tile_level(size: float, max_level: int) -> int:
+    """
+    Args:
+        size (float): マップの表示サイズ(一辺)
+        max_level (int): タイルの段階の上限(MapImageCache.max_level)
+
+    Returns:
+        int: 表示サイズ以上で最小のタイルの段階(元画像より大きく表示する場合はmax_level)
+    """
+    return min(max(math.ceil(math.log2(max(size, 1) / TILE)), 0), max_level)
+
+
+class MapImageCache:
+    """
+    マップ画像のデコード・リサイズ結果のキャッシュ
+
+    縮小済みの画像を (マップ画像, mtime, 表示サイズ) ごとにメモリ上でLRU管理し、
+    cache/maps/ には段階的に縮小したマップ画像を保存しておく
+
+    拡大表示用に、一辺がTILE * 2**zのマップをTILE四方に分割したタイルを
+    cache/maps/tiles/<マップ名>_<mtime>/<z>/<x>_<y>.jpg に保存する
+    (zごとに初めて使うときに作成、表示中はbuild_asyncでバックグラウンドで作成する)
+
+    起動後にバックグラウンドで読み込んでおけるよう、複数のスレッドから使える
+    """
+
+    def __init__(self, root: Path, budget: int=256 * 1024 * 1024) -> None:
+        """
+        Args:
+            root (Path): 縮小版マップの保存用ディレクトリ
+            budget (int): メモリ上に保持する画像の合計バイト数の上限
+        """
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.budget = budget
+        self.used = 0
+        self.opened = 0  # 開いた画像ファイルの数(計測用)
+        self._images: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()  # _images・usedの読み書き
+        self._pyramid_lock = threading.Lock()  # 縮小版の作成
+        self._tiles_lock = threading.Lock()  # タイルの作成
+        self._building = set()  # バックグラウンドで作成中の (マップ画像, mtime, z)
+        self._failed = set()  # 作成に失敗した (マップ画像, mtime, z)
+
+    def get(self, path: Path, size: Tuple[int, int]) -> Image.Image:
+        """
+        指定サイズにリサイズしたマップ画像を返す
+
+        Args:
+            path (Path): マップ画像のパス
+            size (Tuple[int, int]): 表示サイズ(幅, 高さ)
+
+        Returns:
+            Image.Image: リサイズ済みのマップ画像
+        """
+        key = (str(path), path.stat().st_mtime_ns, size)
+        img = self._lookup(key)
+        if img is not None:
+            return img
+
+        img = self._open_scaled(path, key[1], max(size)).resize(size)
+        img.load()
+        self._put(key, img)
+        return img
+
+    def max_level(self, path: Path) -> int:
+        """
+        Args:
+            path (Path): マップ画像のパス
+
+        Returns:
+            int: 元画像の解像度を超えない最大のタイルの段階
+        """
+        self.opened += 1
+        with Image.open(path) as img:
+            return max(0, math.ceil(math.log2(max(img.size) / TILE)))
+
+    def tile(self, path: Path, z: int, x: int, y: int) -> Image.Image:
+        """
+        Args:
+            path (Path): マップ画像のパス
+            z (int): 段階(マップの一辺がTILE * 2**z)
+            x (int): 左から何番目のタイルか
+            y (int): 上から何番目のタイルか
+
+        Returns:
+            Image.Image: TILE四方のタイル
+        """
+        mtime_ns = path.stat().st_mtime_ns
+        key = (str(path), mtime_ns, z, x, y)
+        img = self._lookup(key)
+        if img is not None:
+            return img
+
+        tile_path = self._tile_dir(path, mtime_ns) / str(z) / f'{x}_{y}.jpg'
+        if not tile_path.exists():
+            self.build_tiles(path, z)
+        self.opened += 1
+        img = Image.open(tile_path)
+        img.load()
+        self._put(key, img)
+        return img
+
+    def ready(self, path: Path, z: int) -> bool:
+        """
+        Args:
+            path (Path): マップ画像のパス
+            z (int): 段階
+
+        Returns:
+            bool: z段階のタイルが作成済みか
+        """
+        return (self._tile_dir(path, path.stat().st_mtime_ns) / str(z)).is_dir()
+
+    def build_async(self, path: Path, z: int) -> bool:
+        """
+        z段階のタイルをバックグラウンドで作成する(作成中の場合は何もしない)
+
+        Args:
+            path (Path): マップ画像のパス
+            z (int): 段階
+
+        Returns:
+            bool: 作成中か(作成に失敗していた場合はFalse)
+        """
+        key = (str(path), path.stat().st_mtime_ns, z)
+        with self._lock:
+            if key in self._failed:
+                return False
+            if key not in self._building:
+                self._building.add(key)
+                threading.Thread(target=self._build_in_background, args=(path, z, key), daemon=True).start()
+        return True
+
+    def warm(self, path: Path, side: int) -> None:
+        """
+        拡大率1で表示するときのタイルを読み込んでおく(なければ作成する)
+
+        Args:
+            path (Path): マップ画像のパス
+            side (int): 拡大率1のときのマップの一辺
+        """
+        z = tile_level(side, self.max_level(path))
+        for y in range(2 ** z):
+            for x in range(2 ** z):
+                self.tile(path, z, x, y)
+
+    def build_tiles(self, path: Path, z: int) -> None:
+        """
+        1段階分のタイルをまとめて作成する
+
+        Args:
+            path (Path): マップ画像のパス
+            z (int): 段階
+        """
+        mtime_ns = path.stat().st_mtime_ns
+        directory = self._tile_dir(path, mtime_ns) / str(z)
+        with self._tiles_lock:
+            # 他のスレッドが作成済み
+            if directory.is_dir():
+                return
+            # 古いmtimeのタイルを削除
+            for old in (self.root / 'tiles').glob(f'{path.stem}_*'):
+                if old != self._tile_dir(path, mtime_ns):
+                    shutil.rmtree(old, ignore_errors=True)
+
+            # 一時ディレクトリに作成し、揃ってから置き換える(途中で止まっても作りかけのタイルを使わない)
+            side = TILE * 2 ** z
+            tmp = directory.with_name(f'{z}.tmp')
+            shutil.rmtree(tmp, ignore_errors=True)
+            tmp.mkdir(parents=True)
+            img = self._open_scaled(path, mtime_ns, side).convert('RGB').resize((side, side))
+            for y in range(2 ** z):
+                for x in range(2 ** z):
+                    img.crop((x * TILE, y * TILE, (x + 1) * TILE, (y + 1) * TILE)).save(tmp / f'{x}_{y}.jpg', quality=90)
+            tmp.rename(directory)
+
+    def build_pyramid(self, path: Path) -> None:
+        """
+        マップ画像の縮小版をまとめて作成する
+
+        Args:
+            path (Path): マップ画像のパス
+        """
+        mtime_ns = path.stat().st_mtime_ns
+        with self._pyramid_lock:
+            if all(self._level_path(path, mtime_ns, level).exists() for level in PYRAMID_LEVELS):
+                return
+
+            # 古いmtimeの縮小版を削除
+            for old in self.root.glob(f'{path.stem}_*_*.jpg'):
+                old.unlink()
+
+            with Image.open(path) as full:
+                full = full.convert('RGB')
+                for level in sorted(PYRAMID_LEVELS, reverse=True):
+                    if level < max(full.size):
+                        full.thumbnail((level, level))
+                    full.save(self._level_path(path, mtime_ns, level), quality=95)
+
+    def _open_scaled(self, path: Path, mtime_ns: int, target: int) -> Image.Image:
+        """
+        目標サイズ以上で最小の縮小版マップを開く
+        """
+        self.build_pyramid(path)
+        self.opened += 1
+        for level in PYRAMID_LEVELS:
+            if level >= target:
+                return Image.open(self._level_path(path, mtime_ns, level))
+        # 縮小版より大きく表示する場合は元画像から
+        img = Image.open(path)
+        img.draft('RGB', (target, target))
+        return img
+
+    def _build_in_background(self, path: Path, z: int, key: tuple) -> None:
+        try:
+            self.build_tiles(path, z)
+        except Exception:
+            with self._lock:
+                self._failed.add(key)
+        finally:
+            with self._lock:
+                self._building.discard(key)
+
+    def _lookup(self, key: tuple) -> Image.Image:
+        with self._lock:
+            img = self._images.get(key)
+            if img is not None:
+                self._images.move_to_end(key)
+            return img
+
+    def _put(self, key: tuple, img: Image.Image) -> None:
+        with self._lock:
+            old = self._images.pop(key, None)
+            if old is not None:
+                self.used -= self._nbytes(old)
+            self._images[key] = img
+            self.used += self._nbytes(img)
+            # 古いものから捨てる(直近の1枚は残す)
+            while self.used > self.budget and len(self._images) > 1:
+                _, old = self._images.popitem(last=False)
+                self.used -= self._nbytes(old)
+
+    def _tile_dir(self, path: Path, mtime_ns: int) -> Path:
+        return self.root / 'tiles' / f'{path.stem}_{mtime_ns}'
+
+    def _level_path(self, path: Path, mtime_ns: int, level: int) -> Path:
+        return self.root / f'{path.stem}_{mtime_ns}_{level}.jpg'
+
+    @staticmethod
+    def _nbytes(img: Image.Image) -> int:
+        return img.width * img.height * len(img.getbands())
\ No newline at end of file
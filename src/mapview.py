@@ -0,0 +1,283 @@
+import tkinter as tk
+from pathlib import Path
+from typing import Dict, Tuple
+
+from PIL import Image, ImageTk
+
+from mapcache import MapImageCache, tile_level
+
+# 拡大率の上限
+MAX_ZOOM = 8.0
+# マウスホイール1目盛りあたりの拡大率
+ZOOM_STEP = 1.25
+# 移動を止めてから見えている範囲を描き直すまでの時間(ミリ秒)
+RENDER_DELAY = 50
+# タイルの作成を待つ間、作成済みか確かめる間隔(ミリ秒)
+TILE_POLL = 100
+
+
+class MapView:
+    """
+    マップを拡大・縮小・移動して表示するCanvas
+
+    マップはタイル(MapImageCache.tile)で描き、見えている範囲のタイルだけを読み込む。
+    表示サイズに合う段階のタイルがなければバックグラウンドで作成し、できるまでは作成済みの粗い段階を拡大して描く。
+    点などの図形は画像座標(拡大率1のときのマップ上のピクセル)で描き、
+    拡大・移動の際はCanvas上で座標変換するだけで描き直さない
+
+    操作:
+        マウスホイール: カーソル位置を中心に拡大・縮小
+        右(中)ボタンでドラッグ: 移動
+        右(中)ボタンでダブルクリック: 元の表示に戻す
+    """
+
+    def __init__(self, master: tk.Widget, cache: MapImageCache, width: int, height: int) -> None:
+        """
+        Args:
+            master (tk.Widget): 親ウィジェット
+            cache (MapImageCache): マップ画像のキャッシュ
+            width (int): 表示幅
+            height (int): 表示高さ
+        """
+        self.canvas = tk.Canvas(master, width=width, height=height)
+        self.cache = cache
+        self.width = width
+        self.height = height
+        self.path: Path = None
+        self.side = 0  # 拡大率1のときのマップの一辺
+        self.zoom = 1.0
+        self.ox = 0.0  # Canvas座標 = 画像座標 * zoom + (ox, oy)
+        self.oy = 0.0
+        self.created = 0  # 作成したCanvasの項目数(計測用)
+        self._max_level = 0
+        self._tiles: Dict[tuple, tuple] = {}  # (z, x, y) -> (PhotoImage, Canvasの項目, 表示サイズ)
+        self._overlay: Image.Image = None
+        self._overlay_photo = None
+        self._drag = None
+        self._render_job = None
+        self._tile_job = None
+
+        self.canvas.bind('<MouseWheel>', lambda e: self.zoom_at(e.x, e.y, ZOOM_STEP if e.delta > 0 else 1 / ZOOM_STEP))
+        self.canvas.bind('<Button-4>', lambda e: self.zoom_at(e.x, e.y, ZOOM_STEP))
+        self.canvas.bind('<Button-5>', lambda e: self.zoom_at(e.x, e.y, 1 / ZOOM_STEP))
+        for button in (2, 3):
+            self.canvas.bind(f'<ButtonPress-{button}>', self._start_drag)
+            self.canvas.bind(f'<B{button}-Motion>', self._drag_to)
+            self.canvas.bind(f'<Double-Button-{button}>', lambda e: self.reset())
+
+    def pack(self, **kwargs) -> None:
+        self.canvas.pack(**kwargs)
+
+    def bind(self, sequence: str, func, add: str=None) -> None:
+        self.canvas.bind(sequence, func, add)
+
+    def set_map(self, path: Path, side: int) -> None:
+        """
+        表示するマップを変える(拡大率1のときの大きさが変わる場合は図形を消して元の表示に戻す)
+
+        Args:
+            path (Path): マップ画像のパス
+            side (int): 拡大率1のときのマップの一辺
+        """
+        if side != self.side:
+            self.clear()
+            self.side = side
+            self.zoom, self.ox, self.oy = 1.0, 0.0, 0.0
+        if path != self.path:
+            self.path = path
+            self._max_level = self.cache.max_level(path)
+            for _, item, _ in self._tiles.values():
+                self.canvas.delete(item)
+            self._tiles = {}
+        self.render()
+
+    def clear(self) -> None:
+        """
+        マップ以外の表示を消す
+        """
+        self.canvas.delete('overlay')
+        self.canvas.delete('overlay_img')
+        self._overlay = None
+        self._overlay_photo = None
+
+    def set_overlay(self, img: Image.Image) -> None:
+        """
+        マップに重ねる画像を表示する
+
+        Args:
+            img (Image.Image): 拡大率1のときのマップと同じ大きさのRGBA画像
+        """
+        self._overlay = img
+        self._render_overlay()
+
+    def to_image(self, x: float, y: float) -> Tuple[float, float]:
+        """
+        Args:
+            x (float): Canvas上のx座標
+            y (float): Canvas上のy座標
+
+        Returns:
+            Tuple[float, float]: 画像座標
+        """
+        return (x - self.ox) / self.zoom, (y - self.oy) / self.zoom
+
+    def create_oval(self, x: float, y: float, r: float, tags: tuple=(), **kwargs) -> int:
+        """
+        Args:
+            x (float): 中心のx座標(画像座標)
+            y (float): 中心のy座標(画像座標)
+            r (float): 半径(画像座標)
+            tags (tuple): Canvasのタグ
+
+        Returns:
+            int: Canvasの項目
+        """
+        cx, cy, cr = x * self.zoom + self.ox, y * self.zoom + self.oy, r * self.zoom
+        self.created += 1
+        return self.canvas.create_oval(cx - cr, cy - cr, cx + cr, cy + cr, tags=('overlay',) + tuple(tags), **kwargs)
+
+    def create_text(self, x: float, y: float, tags: tuple=(), **kwargs) -> int:
+        """
+        Args:
+            x (float): x座標(画像座標)
+            y (float): y座標(画像座標)
+            tags (tuple): Canvasのタグ
+
+        Returns:
+            int: Canvasの項目
+        """
+        self.created += 1
+        return self.canvas.create_text(x * self.zoom + self.ox, y * self.zoom + self.oy,
+                                       tags=('overlay',) + tuple(tags), **kwargs)
+
+    def zoom_at(self, x: float, y: float, factor: float) -> None:
+        """
+        Canvas上の(x, y)の位置を動かさずに拡大・縮小する
+
+        Args:
+            x (float): Canvas上のx座標
+            y (float): Canvas上のy座標
+            factor (float): 拡大率の倍率
+        """
+        zoom = min(max(self.zoom * factor, 1.0), MAX_ZOOM)
+        f = zoom / self.zoom
+        self._set_view(zoom, x - (x - self.ox) * f, y - (y - self.oy) * f)
+
+    def reset(self) -> None:
+        """
+        元の表示に戻す
+        """
+        self._set_view(1.0, 0.0, 0.0)
+
+    def render(self) -> None:
+        """
+        見えている範囲のタイルと重ねる画像を描く
+        """
+        self._render_job = None
+        size = self.side * self.zoom
+        if self.path is None or size < 1:
+            return
+        # 表示サイズ以上で最小の段階(元画像より大きく表示する場合は拡大する)
+        z = tile_level(size, self._max_level)
+        if not self.cache.ready(self.path, z):
+            if self.cache.build_async(self.path, z) and self._tile_job is None:
+                self._tile_job = self.canvas.after(TILE_POLL, self._wait_tiles)
+            # 作成済みの段階のうち最も細かいもので描く(なければできるまで描かない)
+            z = next((lower for lower in range(z - 1, -1, -1) if self.cache.ready(self.path, lower)), None)
+            if z is None:
+                self._render_overlay()
+                return
+        n = 2 ** z
+        d = size / n
+        x0 = max(int(-self.ox // d), 0)
+        x1 = min(int((self.width - self.ox) // d), n - 1)
+        y0 = max(int(-self.oy // d), 0)
+        y1 = min(int((self.height - self.oy) // d), n - 1)
+
+        needed = set()
+        for ty in range(y0, y1 + 1):
+            for tx in range(x0, x1 + 1):
+                key = (z, tx, ty)
+                left, top = round(self.ox + tx * d), round(self.oy + ty * d)
+                tile_size = (round(self.ox + (tx + 1) * d) - left, round(self.oy + (ty + 1) * d) - top)
+                entry = self._tiles.get(key)
+                if entry is not None and entry[2] == tile_size:
+                    self.canvas.coords(entry[1], left, top)
+                else:
+                    if entry is not None:
+                        self.canvas.delete(entry[1])
+                    img = self.cache.tile(self.path, z, tx, ty)
+                    if img.size != tile_size:
+                        img = img.resize(tile_size)
+                    photo = ImageTk.PhotoImage(image=img)
+                    item = self.canvas.create_image(left, top, image=photo, anchor=tk.NW, tags='tile')
+                    self.created += 1
+                    self._tiles[key] = (photo, item, tile_size)
+                needed.add(key)
+        for key in self._tiles.keys() - needed:
+            self.canvas.delete(self._tiles.pop(key)[1])
+        self._render_overlay()
+
+    def _wait_tiles(self) -> None:
+        """
+        タイルの作成を待って描き直す(まだであればrenderが再び待つ)
+        """
+        self._tile_job = None
+        if self.canvas.winfo_exists():
+            self.render()
+
+    def _render_overlay(self) -> None:
+        """
+        重ねる画像のうち見えている範囲だけを表示サイズに合わせて描く
+        """
+        self.canvas.delete('overlay_img')
+        self._overlay_photo = None
+        if self._overlay is not None:
+            # 見えている範囲(画像座標)
+            left, top = self.to_image(0, 0)
+            right, bottom = self.to_image(self.width, self.height)
+            left, top = max(left, 0), max(top, 0)
+            right, bottom = min(right, self.side), min(bottom, self.side)
+            if left < right and top < bottom:
+                scale = self._overlay.width / self.side
+                size = (max(round((right - left) * self.zoom), 1), max(round((bottom - top) * self.zoom), 1))
+                img = self._overlay.resize(size, box=(left * scale, top * scale, right * scale, bottom * scale))
+                self._overlay_photo = ImageTk.PhotoImage(image=img)
+                self.canvas.create_image(left * self.zoom + self.ox, top * self.zoom + self.oy,
+                                         image=self._overlay_photo, anchor=tk.NW, tags='overlay_img')
+                self.created += 1
+        self.canvas.tag_lower('overlay_img')
+        self.canvas.tag_lower('tile')
+
+    def _set_view(self, zoom: float, ox: float, oy: float) -> None:
+        # マップが表示領域から出ていかないようにする
+        size = self.side * zoom
+        ox = min(max(ox, min(0, self.width - size)), max(0, self.width - size))
+        oy = min(max(oy, min(0, self.height - size)), max(0, self.height - size))
+        f = zoom / self.zoom
+        if f == 1 and ox == self.ox and oy == self.oy:
+            return
+        # 図形は座標変換するだけ
+        self.canvas.scale('overlay', 0, 0, f, f)
+        self.canvas.move('overlay', ox - self.ox * f, oy - self.oy * f)
+        if f == 1:
+            # 移動だけならタイルもずらしておき、止まってから描き直す
+            self.canvas.move('tile', ox - self.ox, oy - self.oy)
+            self.canvas.move('overlay_img', ox - self.ox, oy - self.oy)
+            self.zoom, self.ox, self.oy = zoom, ox, oy
+            if self._render_job is not None:
+                self.canvas.after_cancel(self._render_job)
+            self._render_job = self.canvas.after(RENDER_DELAY, self.render)
+        else:
+            self.zoom, self.ox, self.oy = zoom, ox, oy
+            self.render()
+
+    def _start_drag(self, event: tk.Event) -> None:
+        self._drag = (event.x, event.y)
+
+    def _drag_to(self, event: tk.Event) -> None:
+        if self._drag is None:
+            return
+        dx, dy = event.x - self._drag[0], event.y - self._drag[1]
+        self._drag = (event.x, event.y)
+        self._set_view(self.zoom, self.ox + dx, self.oy + dy)
\ No newline at end of file
@@ -1,6 +1,10 @@
 from typing import List, Dict
 import datetime
 
+# チーム名等に含められない文字
+NGCHARAS = ["_", ".", "/", "\\", '"', "'"]
+
+
 class Match:
     def __init__(self, 
                 team: str, 
@@ -16,7 +20,8 @@ class Match:
             map_name (str): マップ名
             date (datetime.date): 試合の日付
             rcount (int): ラウンド数
-            pts (List[Dict[str, float]]): 降下地点のリスト [{x:x座標, y:y座標}, ]
+            pts (List[Dict[str, float]]): 降下地点のリスト [{x:x座標, y:y座標, w:マップの幅, h:マップの高さ}, ]
+                (記録画面ではピクセルと表示サイズ、保存した試合ファイルから読んだものはメートルとマップの一辺)
         """
         self.team = team
         self.match_name = match_name
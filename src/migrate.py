@@ -0,0 +1,99 @@
+"""
+旧形式(pickle)の試合データをまとめて新形式(.lmk)に変換し、
+古い版の.lmk(ピクセル座標)を最新の版(ゲーム内の座標)に書き直す
+
+使い方:
+    python src/migrate.py [--keep]
+"""
+import shutil
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from cachestore import cli_parser, replace_file
+from recordio import EXT, VERSION, load_legacy_match, load_match, read_version, write_matches
+
+LEGACY_EXT = '.pkl'
+
+
+def find_legacy(dirs: Iterable[Path]) -> Iterator[Path]:
+    """
+    Args:
+        dirs (Iterable[Path]): 探すディレクトリ一覧
+
+    Yields:
+        Path: 旧形式の試合ファイル
+    """
+    for d in dirs:
+        if d.is_dir():
+            yield from d.glob(f'**/*{LEGACY_EXT}')
+
+
+def migrate(dirs: Iterable[Path], keep: bool=False, progress: Callable[[Path], None]=None) -> int:
+    """
+    旧形式の試合ファイルを新形式に変換する
+
+    Args:
+        dirs (Iterable[Path]): 変換するディレクトリ一覧
+        keep (bool): Trueの場合は変換元のファイルを残す
+        progress (Callable[[Path], None]): 1ファイル変換するごとに変換元のパスで呼ばれる
+
+    Returns:
+        int: 変換したファイル数
+    """
+    n = 0
+    for path in list(find_legacy(dirs)):
+        out = path.with_suffix(EXT)
+        # 途中で止まっても壊れたファイルが残らないよう一時ファイルに書いてから置き換える
+        with replace_file(out) as f:
+            write_matches(f, [load_legacy_match(path)])
+        if not keep:
+            path.unlink()
+        n += 1
+        if progress is not None:
+            progress(path)
+    return n
+
+
+def upgrade(dirs: Iterable[Path], progress: Callable[[Path], None]=None) -> int:
+    """
+    古い版の.lmkファイルを最新の版に書き直す
+
+    Args:
+        dirs (Iterable[Path]): 変換するディレクトリ一覧
+        progress (Callable[[Path], None]): 1ファイル変換するごとにそのパスで呼ばれる
+
+    Returns:
+        int: 変換したファイル数
+    """
+    n = 0
+    for d in dirs:
+        if not d.is_dir():
+            continue
+        for path in list(d.glob(f'**/*{EXT}')):
+            if not 0 < read_version(path) < VERSION:
+                continue
+            match = load_match(path)
+            with replace_file(path) as f:
+                write_matches(f, [match])
+            n += 1
+            if progress is not None:
+                progress(path)
+    return n
+
+
+def main() -> None:
+    parser = cli_parser('旧形式(pickle)の試合データを新形式に変換')
+    parser.add_argument('--tmp', type=Path, default=Path('tmp'), help='仮記録データ保存用ディレクトリ')
+    parser.add_argument('--keep', action='store_true', help='変換元のファイルを残す')
+    args = parser.parse_args()
+
+    n = migrate([args.teams_dir, args.tmp], args.keep, progress=lambda path: print(path))
+    n += upgrade([args.teams_dir], progress=lambda path: print(path))
+    # ファイル名・mtimeが変わるので列データは作り直す
+    if n and (args.cache / 'points').is_dir():
+        shutil.rmtree(args.cache / 'points')
+    print(f'{n}件変換しました')
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,30 @@
+from typing import Dict, Sequence, Tuple
+
+from PIL import Image, ImageColor, ImageDraw
+
+
+def render_points(points: Sequence[Tuple[float, float, int]],
+                  size: Tuple[int, int],
+                  team_colors: Dict[int, str],
+                  r: int=5) -> Image.Image:
+    """
+    降下地点を1枚の半透明画像に描画
+
+    Canvasに点を1つずつ追加する代わりに、この画像をマップに重ねて1枚の画像として表示する
+
+    Args:
+        points (Sequence[Tuple[float, float, int]]): 表示座標とチームID(x, y, チームID)の一覧
+        size (Tuple[int, int]): 表示サイズ(幅, 高さ)
+        team_colors (Dict[int, str]): チームID -> 色名
+        r (int): 点の半径
+
+    Returns:
+        Image.Image: マップに重ねる画像(RGBAモード)
+    """
+    overlay = Image.new('RGBA', size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    fills = {team_id: ImageColor.getrgb(color) for team_id, color in team_colors.items()}
+    # Canvasのcreate_ovalと同じく黒枠付きの円
+    for x, y, team_id in points:
+        draw.ellipse((x-r, y-r, x+r, y+r), fill=fills[team_id], outline=(0, 0, 0))
+    return overlay
\ No newline at end of file
@@ -0,0 +1,369 @@
+import logging
+import mmap
+from array import array
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Set, Tuple
+
+from cachestore import read_json, shared_lock, write_json
+from catalog import MatchRecord
+from recordio import RecordFormatError, load_match
+
+# 列名と型(arrayの型コード)
+COLUMNS = (
+    ('x', 'f'),  # 正規化したx座標(0~1)
+    ('y', 'f'),  # 正規化したy座標(0~1)
+    ('team', 'i'),  # チームID
+    ('match', 'i'),  # 試合名ID
+    ('file', 'i'),  # 試合ファイルID
+    ('date', 'i'),  # 日付(datetime.date.toordinal)
+    ('rcount', 'b'),  # ラウンド数
+)
+
+logger = logging.getLogger(__name__)
+
+
+class MapPoints:
+    """
+    1マップ分の降下地点の列データ(メモリマップで読み込む)
+    """
+
+    def __init__(self, directory: Path, meta: dict) -> None:
+        """
+        Args:
+            directory (Path): 列データのディレクトリ
+            meta (dict): 列データのメタ情報
+        """
+        self.teams: List[str] = meta['teams']  # チームID -> チーム名
+        self.matches: List[str] = meta['matches']  # 試合名ID -> 試合名
+        self.files: List[str] = meta['files']  # 試合ファイルID -> パス
+        self.mtimes: List[int] = meta['mtimes']  # 試合ファイルID -> 読み込んだ時点の更新日時(ns)
+        self.rows: int = meta['rows']
+        self.generation: int = meta.get('generation', 0)  # 既存の行を書き直すごとに増える
+
+        self._mmaps = []
+        self._views = []
+        for name, code in COLUMNS:
+            setattr(self, name, self._load(directory / f'{name}.{code}', code))
+        # 試合ファイルID -> [開始行, 行数](1試合分の行は続けて並ぶ。以前の版のmeta.jsonにはないので求める)
+        self.ranges: List[List[int]] = meta.get('ranges') or file_ranges(self.file, self.rows, len(self.files))
+        self._file_ids = None
+
+    def _load(self, path: Path, code: str) -> memoryview:
+        size = self.rows * array(code).itemsize
+        if size == 0:
+            view = memoryview(array(code))
+        else:
+            with open(path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            self._mmaps.append(mm)
+            view = memoryview(mm).cast(code)
+        self._views.append(view)
+        return view
+
+    def row_ranges(self, paths: Iterable[Path]) -> List[Tuple[int, int]]:
+        """
+        Args:
+            paths (Iterable[Path]): 試合ファイル一覧
+
+        Returns:
+            List[Tuple[int, int]]: 試合ファイルの行の範囲(開始行, 終了行)一覧(行順、列データにない試合ファイルは除く)
+        """
+        if self._file_ids is None:
+            self._file_ids = {f: i for i, f in enumerate(self.files)}
+        ranges = []
+        for path in paths:
+            file_id = self._file_ids.get(str(path))
+            if file_id is not None and self.ranges[file_id][1]:
+                start, count = self.ranges[file_id]
+                ranges.append((start, start + count))
+        return sorted(ranges)
+
+    def take(self, name: str, ranges: Iterable[Tuple[int, int]]) -> array:
+        """
+        Args:
+            name (str): 列名
+            ranges (Iterable[Tuple[int, int]]): 行の範囲(開始行, 終了行)一覧
+
+        Returns:
+            array: 範囲内の値を順につなげたもの
+        """
+        column = getattr(self, name)
+        values = array(column.format)
+        for start, end in ranges:
+            values.frombytes(column[start:end].cast('B'))
+        return values
+
+    def where(self,
+              teams: Iterable[str]=None,
+              match_names: Iterable[str]=None,
+              paths: Iterable[Path]=None,
+              start: int=None,
+              end: int=None,
+              rcount: int=None) -> List[int]:
+        """
+        条件に一致する行番号を返す(Noneの条件は絞り込まない)
+
+        Args:
+            teams (Iterable[str]): チーム名一覧
+            match_names (Iterable[str]): 試合名一覧
+            paths (Iterable[Path]): 試合ファイル一覧
+            start (int): 開始日(序数)
+            end (int): 終了日(序数)
+            rcount (int): ラウンド数
+
+        Returns:
+            List[int]: 行番号一覧
+        """
+        if paths is None:
+            rows = range(self.rows)
+        else:
+            # 試合ファイルの行の範囲だけを見る
+            rows = [i for start, end in self.row_ranges(paths) for i in range(start, end)]
+        for column, names, values in ((self.team, self.teams, teams),
+                                      (self.match, self.matches, match_names)):
+            if values is not None:
+                values = set(values)
+                ids = {i for i, name in enumerate(names) if name in values}
+                rows = [i for i in rows if column[i] in ids]
+        if start is not None:
+            rows = [i for i in rows if self.date[i] >= start]
+        if end is not None:
+            rows = [i for i in rows if self.date[i] <= end]
+        if rcount is not None:
+            rows = [i for i in rows if self.rcount[i] == rcount]
+        return list(rows)
+
+    def close(self) -> None:
+        for view in self._views:
+            view.release()
+        for mm in self._mmaps:
+            mm.close()
+        self._views = []
+        self._mmaps = []
+
+
+def file_ranges(file: Iterable[int], rows: int, files: int) -> List[List[int]]:
+    """
+    Args:
+        file (Iterable[int]): 行ごとの試合ファイルID
+        rows (int): 行数
+        files (int): 試合ファイル数
+
+    Returns:
+        List[List[int]]: 試合ファイルID -> [開始行, 行数]
+    """
+    ranges = [[0, 0] for _ in range(files)]
+    for i, file_id in zip(range(rows), file):
+        if not ranges[file_id][1]:
+            ranges[file_id][0] = i
+        ranges[file_id][1] += 1
+    return ranges
+
+
+class PointStore:
+    """
+    マップごとの降下地点の列データ保存先
+
+    cache/points/<マップ名>/ 以下に列ごとのファイルとmeta.jsonを置く
+    """
+
+    def __init__(self, root: Path, chunk: int=200) -> None:
+        """
+        Args:
+            root (Path): 列データ保存用ディレクトリ
+            chunk (int): updateでロックを取ったまま読み込む試合ファイルの数
+        """
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.chunk = chunk
+        self._opened: Dict[str, MapPoints] = {}
+        # 列データの書き込み中に他のスレッドが書き込んだり読んだりしないためのロック
+        # (同じディレクトリを使うPointStore同士で共有する。読む側は開いてから閉じるまで持ち、
+        # 書く側はchunk件ごとに取り直す)
+        self.lock = shared_lock(root)
+
+    def open(self, map_name: str) -> MapPoints:
+        """
+        Args:
+            map_name (str): マップ名(拡張子なし)
+
+        Returns:
+            MapPoints: マップの列データ
+        """
+        meta_path = self.root / map_name / 'meta.json'
+        mtime_ns = meta_path.stat().st_mtime_ns if meta_path.exists() else None
+        # 別のPointStore(他のスレッド等)が追記していれば開き直す
+        if map_name in self._opened and self._opened[map_name].mtime_ns != mtime_ns:
+            self._close(map_name)
+        if map_name not in self._opened:
+            self._opened[map_name] = MapPoints(self.root / map_name, self._read_meta(map_name))
+            self._opened[map_name].mtime_ns = mtime_ns
+        return self._opened[map_name]
+
+    def update(self,
+               map_name: str,
+               records: Iterable[MatchRecord],
+               progress: Callable[[int, int], bool]=None) -> List[Path]:
+        """
+        未登録または更新された試合ファイルを読み込んで列データに追加する
+
+        読み込めない試合ファイル(壊れている等)は点のない試合として登録し、更新されるまで読み込み直さない。
+        ロックはchunk件読み込むごとに手放すので、読み込みの途中でも他のスレッドが列データを使える
+
+        Args:
+            map_name (str): マップ名(拡張子なし)
+            records (Iterable[MatchRecord]): 列データに含めたい試合一覧
+            progress (Callable[[int, int], bool]): 1ファイル読み込むごとに(読み込んだ数, 全体の数)で呼ばれる。
+                Falseを返した場合はそこで読み込みを打ち切り、読み込んだ分だけ保存する
+
+        Returns:
+            List[Path]: 読み込めなかった試合ファイル一覧
+        """
+        records = list(records)
+        with self.lock:
+            new, _, unreadable = self._scan(self._read_meta(map_name), records)
+        cancelled = False
+        for start in range(0, len(new), self.chunk):
+            def step(n: int, total: int) -> bool:
+                nonlocal cancelled
+                cancelled = progress is not None and not progress(start + n, len(new))
+                return not cancelled
+
+            with self.lock:
+                # 手放している間に他のスレッドが読み込んだ試合は読み込み直さない
+                unreadable += self._update(map_name, [record for record, _ in new[start:start + self.chunk]], step)
+            if cancelled:
+                break
+        return unreadable
+
+    def close(self) -> None:
+        for map_name in list(self._opened):
+            self._close(map_name)
+
+    def _update(self,
+                map_name: str,
+                records: Iterable[MatchRecord],
+                progress: Callable[[int, int], bool]=None) -> List[Path]:
+        meta = self._read_meta(map_name)
+        file_ids = {f: i for i, f in enumerate(meta['files'])}
+        new, stale, unreadable = self._scan(meta, records)
+        if not new:
+            return unreadable
+
+        self._close(map_name)
+        directory = self.root / map_name
+        directory.mkdir(exist_ok=True)
+        if stale:
+            # 上書きされた試合ファイルの行を取り除いて書き直す
+            columns = self._read_columns(directory, meta)
+            keep = [i for i in range(meta['rows']) if columns['file'][i] not in stale]
+            for name, code in COLUMNS:
+                columns[name] = array(code, (columns[name][i] for i in keep))
+            meta['ranges'] = file_ranges(columns['file'], len(keep), len(meta['files']))
+            base = 0
+        else:
+            # 追記分のみ
+            columns = {name: array(code) for name, code in COLUMNS}
+            if 'ranges' not in meta:
+                meta['ranges'] = file_ranges(self._read_columns(directory, meta)['file'], meta['rows'], len(meta['files']))
+            base = meta['rows']
+
+        for n, (record, mtime_ns) in enumerate(new):
+            if progress is not None and not progress(n, len(new)):
+                break
+            try:
+                pts = load_match(record.path).pts
+            except (RecordFormatError, OSError) as e:
+                logger.warning('%s: %s', record.path, e)
+                unreadable.append(record.path)
+                pts = []
+            key = str(record.path)
+            if key in file_ids:
+                file_id = file_ids[key]
+                meta['mtimes'][file_id] = mtime_ns
+            else:
+                file_id = file_ids[key] = len(meta['files'])
+                meta['files'].append(key)
+                meta['mtimes'].append(mtime_ns)
+                meta['ranges'].append([0, 0])
+            meta['ranges'][file_id] = [base + len(columns['x']), len(pts)]
+            team_id = self._intern(meta['teams'], record.team)
+            match_id = self._intern(meta['matches'], record.match_name)
+            for pt in pts:
+                columns['x'].append(pt['x'] / pt['w'])
+                columns['y'].append(pt['y'] / pt['h'])
+                columns['team'].append(team_id)
+                columns['match'].append(match_id)
+                columns['file'].append(file_id)
+                columns['date'].append(record.date.toordinal())
+                columns['rcount'].append(record.rcount)
+
+        for name, code in COLUMNS:
+            path = directory / f'{name}.{code}'
+            if stale or not path.exists():
+                with open(path, 'wb') as f:
+                    columns[name].tofile(f)
+            else:
+                with open(path, 'r+b') as f:
+                    # meta.jsonに反映されなかった書きかけの行は捨てる
+                    f.truncate(meta['rows'] * columns[name].itemsize)
+                    f.seek(0, 2)
+                    columns[name].tofile(f)
+        if stale:
+            meta['rows'] = len(columns['x'])
+            meta['generation'] = meta.get('generation', 0) + 1
+        else:
+            meta['rows'] += len(columns['x'])
+        write_json(directory / 'meta.json', meta)
+        return unreadable
+
+    @staticmethod
+    def _scan(meta: dict, records: Iterable[MatchRecord]) -> Tuple[List[Tuple[MatchRecord, int]], Set[int], List[Path]]:
+        """
+        Returns:
+            Tuple[List[Tuple[MatchRecord, int]], Set[int], List[Path]]:
+                (読み込む試合と更新日時(ns)の一覧, 上書きされた試合ファイルID, 見つからない試合ファイル一覧)
+        """
+        file_ids = {f: i for i, f in enumerate(meta['files'])}
+        stale = set()
+        new = []
+        missing = []
+        for record in records:
+            try:
+                mtime_ns = record.path.stat().st_mtime_ns
+            except OSError as e:
+                # 索引の更新後に消された試合ファイル
+                logger.warning('%s: %s', record.path, e)
+                missing.append(record.path)
+                continue
+            file_id = file_ids.get(str(record.path))
+            if file_id is None:
+                new.append((record, mtime_ns))
+            elif meta['mtimes'][file_id] != mtime_ns:
+                stale.add(file_id)
+                new.append((record, mtime_ns))
+        return new, stale, missing
+
+    def _close(self, map_name: str) -> None:
+        points = self._opened.pop(map_name, None)
+        if points is not None:
+            points.close()
+
+    def _read_meta(self, map_name: str) -> dict:
+        return read_json(self.root / map_name / 'meta.json',
+                         {'teams': [], 'matches': [], 'files': [], 'mtimes': [], 'ranges': [], 'rows': 0})
+
+    def _read_columns(self, directory: Path, meta: dict) -> Dict[str, array]:
+        columns = {}
+        for name, code in COLUMNS:
+            columns[name] = array(code)
+            if meta['rows']:
+                with open(directory / f'{name}.{code}', 'rb') as f:
+                    columns[name].fromfile(f, meta['rows'])
+        return columns
+
+    @staticmethod
+    def _intern(names: List[str], name: str) -> int:
+        if name not in names:
+            names.append(name)
+        return names.index(name)
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""
+画面操作ごとの処理時間の計測(環境変数LMK_PROFILE=1で有効)
+
+操作ごとに段階別の処理時間と、開いたファイル数・作成したCanvasの項目数等を記録し、
+cache/profile.log(ローテーションあり)に1操作1行のJSONで書き出す
+"""
+import datetime
+import json
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+# 計測を有効にする環境変数
+PROFILE_ENV = 'LMK_PROFILE'
+
+
+class Action:
+    """
+    1操作分の計測結果
+    """
+
+    def __init__(self, name: str, start: float=None) -> None:
+        """
+        Args:
+            name (str): 操作名
+            start (float): 開始時刻(time.perf_counter()、Noneの場合は今)
+        """
+        self.name = name
+        self.time = datetime.datetime.now()
+        self.start = time.perf_counter() if start is None else start
+        self.total = None
+        self.phases: Dict[str, float] = {}  # 段階名 -> 秒
+        self.counts: Dict[str, int] = {}  # 項目名 -> 数
+        self._last = self.start
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        withで囲んだ処理の時間を段階nameに加算する
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def lap(self, name: str) -> None:
+        """
+        前回のlap(または開始)からの時間を段階nameに加算する
+        """
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self._last
+        self._last = now
+
+    def count(self, name: str, n: int=1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def to_dict(self) -> dict:
+        return {'action': self.name,
+                'time': self.time.isoformat(timespec='seconds'),
+                'total': self.total,
+                'phases': self.phases,
+                'counts': self.counts}
+
+
+class NullAction(Action):
+    """
+    計測が無効な場合の何もしないAction
+    """
+
+    def __init__(self) -> None:
+        super().__init__('')
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        yield
+
+    def lap(self, name: str) -> None:
+        pass
+
+    def count(self, name: str, n: int=1) -> None:
+        pass
+
+
+class Profiler:
+    """
+    操作ごとの計測結果の記録先
+    """
+
+    def __init__(self, log_path: Path, enabled: bool=None, keep: int=100) -> None:
+        """
+        Args:
+            log_path (Path): ログファイルのパス
+            enabled (bool): 計測するか(Noneの場合は環境変数LMK_PROFILEで決める)
+            keep (int): 画面に表示するためにメモリ上に残す件数
+        """
+        if enabled is None:
+            enabled = os.environ.get(PROFILE_ENV, '') not in ('', '0')
+        self.enabled = enabled
+        self.recent: deque = deque(maxlen=keep)
+        self._null = NullAction()
+        self._logger = None
+        if enabled:
+            # 起動を遅くしないよう、計測する場合だけ読み込む
+            import logging
+            from logging.handlers import RotatingFileHandler
+            self._logger = logging.getLogger(f'landmark.profile.{log_path}')
+            self._logger.setLevel(logging.INFO)
+            self._logger.propagate = False
+            if not self._logger.handlers:
+                handler = RotatingFileHandler(log_path, maxBytes=1024 * 1024, backupCount=3, encoding='utf-8')
+                self._logger.addHandler(handler)
+
+    def begin(self, name: str, start: float=None) -> Action:
+        """
+        Args:
+            name (str): 操作名
+            start (float): 開始時刻(time.perf_counter()、Noneの場合は今)
+
+        Returns:
+            Action: 計測結果(無効な場合は何もしないAction)
+        """
+        if not self.enabled:
+            return self._null
+        return Action(name, start)
+
+    def end(self, action: Action) -> None:
+        """
+        計測を終えて記録する
+
+        Args:
+            action (Action): beginで始めた計測結果
+        """
+        if not self.enabled or action is self._null or action.total is not None:
+            return
+        action.total = time.perf_counter() - action.start
+        self.recent.append(action)
+        self._logger.info(json.dumps(action.to_dict(), ensure_ascii=False))
+
+    def summary(self) -> List[dict]:
+        """
+        Returns:
+            List[dict]: 新しい順の計測結果一覧
+        """
+        return [action.to_dict() for action in reversed(self.recent)]
\ No newline at end of file
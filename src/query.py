@@ -0,0 +1,303 @@
+import argparse
+import datetime
+import heapq
+import threading
+from array import array
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Literal, Optional, Tuple
+
+from catalog import Catalog, MatchRecord
+from pointstore import PointStore
+from profiler import Action, NullAction
+from spatial import PointIndex
+
+
+class QueryResult:
+    """
+    検索結果(選択された試合と、その降下地点の列データ)
+    """
+
+    def __init__(self,
+                 records: List[MatchRecord],
+                 teams: List[str],
+                 files: List[str],
+                 mtimes: List[int],
+                 x: array,
+                 y: array,
+                 team: array,
+                 file: array) -> None:
+        """
+        Args:
+            records (List[MatchRecord]): 選択された試合一覧
+            teams (List[str]): チームID -> チーム名
+            files (List[str]): 試合ファイルID -> パス
+            mtimes (List[int]): 試合ファイルID -> 読み込んだ時点の更新日時(ns)
+            x (array): 正規化したx座標(0~1)
+            y (array): 正規化したy座標(0~1)
+            team (array): チームID
+            file (array): 試合ファイルID
+        """
+        self.records = records
+        self.teams = teams
+        self.files = files
+        self.mtimes = mtimes
+        self.x = x
+        self.y = y
+        self.team = team
+        self.file = file
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def pixels(self, w: int, h: int) -> List[Tuple[float, float, int]]:
+        """
+        座標を表示サイズに変換する
+
+        Args:
+            w (int): 表示幅
+            h (int): 表示高さ
+
+        Returns:
+            List[Tuple[float, float, int]]: (x, y, チームID)の一覧
+        """
+        return [(x * w, y * h, team) for x, y, team in zip(self.x, self.y, self.team)]
+
+    def team_names(self) -> List[str]:
+        """
+        Returns:
+            List[str]: 選択された試合のチーム名一覧(初出順)
+        """
+        return list(dict.fromkeys(record.team for record in self.records))
+
+
+def latest_per_team(records: Iterable[MatchRecord],
+                    num: int=None,
+                    mode: Literal['last', 'window', 'round']='last') -> List[MatchRecord]:
+    """
+    各チームの最新の試合のみを返す
+
+    試合一覧を一度だけ走査し、チーム(modeが'round'の場合はチームとラウンド)ごとに
+    最新の試合をヒープで保持する
+
+    Args:
+        records (Iterable[MatchRecord]): 対象の試合一覧
+        num (int): 'last'・'round'の場合は試合数、'window'の場合は日数(Noneの場合は全試合)
+        mode (Literal['last', 'window', 'round']): 'last'はチームごとの最新num試合、
+            'window'はチームごとの最新の試合日からnum日間、'round'はチーム・ラウンドごとの最新num試合
+
+    Returns:
+        List[MatchRecord]: グループごとに新しい順に並べた試合一覧
+    """
+    if num is not None and num < 1:
+        return []
+
+    heaps: Dict[tuple, list] = {}
+    latest: Dict[tuple, datetime.date] = {}
+    for i, record in enumerate(records):
+        group = (record.team, record.rcount) if mode == 'round' else (record.team,)
+        heap = heaps.setdefault(group, [])
+        # 古い順に取り出せるよう(日付, ラウンド, 出現順)をキーにする
+        item = (record.date, record.rcount, i, record)
+        if num is None:
+            heap.append(item)
+        elif mode == 'window':
+            if group not in latest or record.date > latest[group]:
+                latest[group] = record.date
+            oldest = latest[group] - datetime.timedelta(days=num - 1)
+            if record.date >= oldest:
+                heapq.heappush(heap, item)
+            # 期間外になった試合を捨てる
+            while heap and heap[0][0] < oldest:
+                heapq.heappop(heap)
+        elif len(heap) < num:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+
+    selected = []
+    for heap in heaps.values():
+        selected.extend(item[3] for item in sorted(heap, reverse=True))
+    return selected
+
+
+class QueryEngine:
+    """
+    画面を使わずに降下地点を検索する
+
+    閲覧画面の絞り込み(マップ・試合名・チーム・期間・ラウンド・最新N試合)と同じ処理を行う
+    """
+
+    def __init__(self, catalog: Catalog, points: PointStore) -> None:
+        """
+        Args:
+            catalog (Catalog): 試合ファイルの索引
+            points (PointStore): マップごとの降下地点の列データ
+        """
+        self.catalog = catalog
+        self.points = points
+
+    @classmethod
+    def open(cls, teams: Path=Path('teams'), cache: Path=Path('cache')) -> 'QueryEngine':
+        """
+        アプリと同じディレクトリ構成で検索エンジンを作成する
+
+        Args:
+            teams (Path): チームデータ保存用ディレクトリ
+            cache (Path): 索引等の生成データ保存用ディレクトリ
+
+        Returns:
+            QueryEngine: 検索エンジン
+        """
+        cache.mkdir(parents=True, exist_ok=True)
+        return cls(Catalog(teams, cache / 'catalog.sqlite3'), PointStore(cache / 'points'))
+
+    def run(self,
+            map_name: str,
+            match_names: List[str]=None,
+            teams: List[str]=None,
+            start: datetime.date=None,
+            end: datetime.date=None,
+            rcount: int=None,
+            mode: Literal['all', 'last', 'window', 'round']='all',
+            num: int=None,
+            progress: Callable[[int, int], bool]=None,
+            action: Action=None,
+            cancel: threading.Event=None) -> Optional[QueryResult]:
+        """
+        条件に一致する試合と降下地点を返す(Noneの条件は絞り込まない)
+
+        Args:
+            map_name (str): マップ名(拡張子の有無は問わない)
+            match_names (List[str]): 試合名一覧
+            teams (List[str]): チーム名一覧
+            start (datetime.date): 開始日
+            end (datetime.date): 終了日
+            rcount (int): ラウンド数
+            mode (Literal['all', 'last', 'window', 'round']): 'all'以外の場合は最新の試合のみ(latest_per_team参照)
+            num (int): 試合数または日数
+            progress (Callable[[int, int], bool]): 未登録の試合ファイルの読み込み状況の通知先(PointStore.update参照)
+            action (Action): 段階別の処理時間と読み込んだ試合ファイル数の記録先
+            cancel (threading.Event): 検索の取り消し(セットされていれば列データを選び出さない)
+
+        Returns:
+            Optional[QueryResult]: 検索結果(取り消された場合はNone)
+        """
+        if action is None:
+            action = NullAction()
+        map_name = Path(map_name).stem
+        with action.phase('catalog'):
+            self.catalog.sync()
+            records = self.catalog.find(map_name, match_names, teams, start, end, rcount)
+
+        def loaded(done: int, total: int) -> bool:
+            if progress is not None and not progress(done, total):
+                return False
+            action.count('files_opened')
+            return True
+
+        # 未登録の試合だけ列データに取り込む(ロックは少しずつ取るので、その間も他のスレッドが列データを使える)
+        with action.phase('load'):
+            self.points.update(map_name, records, loaded)
+        if cancel is not None and cancel.is_set():
+            return None
+
+        # 選び出し終えるまで他のスレッドに列データを書き換えさせない
+        with self.points.lock:
+            with action.phase('select'):
+                if mode != 'all':
+                    records = latest_per_team(records, num, mode)
+
+                points = self.points.open(map_name)
+                try:
+                    # 選ばれた試合ファイルの行の範囲をまとめて切り出す
+                    ranges = points.row_ranges(record.path for record in records)
+                    result = QueryResult(records,
+                                         list(points.teams),
+                                         list(points.files),
+                                         list(points.mtimes),
+                                         points.take('x', ranges),
+                                         points.take('y', ranges),
+                                         points.take('team', ranges),
+                                         points.take('file', ranges))
+                finally:
+                    # 他のスレッドが列データを書き直せるよう開いたままにしない
+                    self.points.close()
+        action.count('points', len(result))
+        return result
+
+    def inspect(self,
+                map_name: str,
+                x: float,
+                y: float,
+                r: float,
+                indexes: Dict[str, PointIndex]=None,
+                progress: Callable[[int, int], bool]=None,
+                cancel: threading.Event=None) -> Optional[List[Tuple[int, int, str, str]]]:
+        """
+        (x, y)の近くに降りた試合を、絞り込みに関係なくマップの全記録から探す
+
+        Args:
+            map_name (str): マップ名(拡張子の有無は問わない)
+            x (float): x座標(正規化座標)
+            y (float): y座標(正規化座標)
+            r (float): 半径(正規化座標)
+            indexes (Dict[str, PointIndex]): マップ名 -> 索引(読み込んだ索引を入れておき、次回から使い回す)
+            progress (Callable[[int, int], bool]): 未登録の試合ファイルの読み込み状況の通知先(PointStore.update参照)
+            cancel (threading.Event): 検索の取り消し(セットされていれば索引を引かない)
+
+        Returns:
+            Optional[List[Tuple[int, int, str, str]]]: 試合ごとの(日付(序数), ラウンド数, チーム名, 試合名)一覧(新しい順、
+                取り消された場合はNone)
+        """
+        if indexes is None:
+            indexes = {}
+        map_name = Path(map_name).stem
+        self.catalog.sync()
+        records = self.catalog.find(map_name)
+        # 閲覧画面の検索で読み込んでいない試合も列データに取り込む(ロックは少しずつ取る)
+        self.points.update(map_name, records, progress)
+        if cancel is not None and cancel.is_set():
+            return None
+        with self.points.lock:
+            points = self.points.open(map_name)
+            try:
+                index = indexes.get(map_name)
+                if index is None or not index.is_current(points):
+                    index = indexes[map_name] = PointIndex.load(self.points.root / map_name, points)
+                # 試合ファイルごとに1行
+                found = {}
+                for i in index.near(points, x, y, r):
+                    found[points.file[i]] = (points.date[i], points.rcount[i], points.teams[points.team[i]], points.matches[points.match[i]])
+            finally:
+                # 他のスレッドが列データを書き直せるよう開いたままにしない
+                self.points.close()
+        return sorted(found.values(), reverse=True)
+
+    def close(self) -> None:
+        self.points.close()
+        self.catalog.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='降下地点の検索')
+    parser.add_argument('map_name', help='マップ名')
+    parser.add_argument('--matches', nargs='+', help='試合名')
+    parser.add_argument('--teams', nargs='+', help='チーム名')
+    parser.add_argument('--start', type=datetime.date.fromisoformat, help='開始日(YYYY-MM-DD)')
+    parser.add_argument('--end', type=datetime.date.fromisoformat, help='終了日(YYYY-MM-DD)')
+    parser.add_argument('--round', type=int, dest='rcount', help='ラウンド数')
+    parser.add_argument('--mode', choices=['all', 'last', 'window', 'round'], default='all',
+                        help='last: 各チームの最新N試合, window: 各チームの最新N日間, round: 各チーム・ラウンドの最新N試合')
+    parser.add_argument('-n', '--num', type=int, help='試合数または日数')
+    args = parser.parse_args()
+
+    engine = QueryEngine.open()
+    result = engine.run(args.map_name, args.matches, args.teams, args.start, args.end, args.rcount,
+                        mode=args.mode, num=args.num)
+    for x, y, team in zip(result.x, result.y, result.team):
+        print(f'{result.teams[team]}\t{x:.4f}\t{y:.4f}')
+    engine.close()
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
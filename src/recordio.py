@@ -0,0 +1,169 @@
+import datetime
+import pickle
+import struct
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator
+
+from calibration import world_size
+from match import Match
+
+# 試合データファイルの形式
+# version 1: 点は表示サイズ(w, h)とその上のピクセル座標
+# version 2: 点はゲーム内の座標(メートル)、記録ごとにマップの一辺(メートル)を持つ
+MAGIC = b'LMK'
+VERSION = 2
+EXT = '.lmk'
+
+_HEADER = struct.Struct('<3sB')  # MAGIC, VERSION
+_STR = struct.Struct('<H')  # 文字列のバイト数(続けてUTF-8の文字列)
+_RECORD = struct.Struct('<iBB')  # 日付(序数), ラウンド数, 点の数
+_POINT = struct.Struct('<ffHH')  # x, y, w, h
+_RECORD_V2 = struct.Struct('<iBBf')  # 日付(序数), ラウンド数, 点の数, マップの一辺(メートル)
+_POINT_V2 = struct.Struct('<ff')  # x, y(メートル)
+
+
+class RecordFormatError(ValueError):
+    """
+    試合データファイルの形式が不正
+    """
+
+
+def write_matches(f: BinaryIO, matches: Iterable[Match]) -> int:
+    """
+    試合データを順に書き込む(点はマップの縮尺(calibration参照)でゲーム内の座標に変換する)
+
+    Args:
+        f (BinaryIO): 書き込み先
+        matches (Iterable[Match]): 試合データ一覧
+
+    Returns:
+        int: 書き込んだ試合数
+    """
+    f.write(_HEADER.pack(MAGIC, VERSION))
+    n = 0
+    for m in matches:
+        buf = bytearray()
+        for s in (m.team, m.match_name, m.map_name):
+            b = s.encode('utf-8')
+            buf += _STR.pack(len(b)) + b
+        size = world_size(m.map_name)
+        buf += _RECORD_V2.pack(m.date.toordinal(), m.rcount, len(m.pts), size)
+        for pt in m.pts:
+            buf += _POINT_V2.pack(pt['x'] / pt['w'] * size, pt['y'] / pt['h'] * size)
+        f.write(buf)
+        n += 1
+    return n
+
+
+def read_matches(f: BinaryIO) -> Iterator[Match]:
+    """
+    試合データを順に読み込む
+
+    version 2の点は{x, y: メートル, w, h: マップの一辺(メートル)}で返すので、
+    どちらの形式でもx / w, y / hが正規化座標(0~1)になる
+
+    Args:
+        f (BinaryIO): 読み込み元
+
+    Yields:
+        Match: 試合データ
+    """
+    header = f.read(_HEADER.size)
+    if len(header) != _HEADER.size:
+        raise RecordFormatError('ヘッダーがありません')
+    magic, version = _HEADER.unpack(header)
+    if magic != MAGIC:
+        raise RecordFormatError('試合データファイルではありません')
+    if version not in (1, VERSION):
+        raise RecordFormatError(f'未対応の形式です(version {version})')
+
+    def read(n: int) -> bytes:
+        b = f.read(n)
+        if len(b) != n:
+            raise RecordFormatError('ファイルが途中で切れています')
+        return b
+
+    def read_str(head: bytes) -> str:
+        return read(_STR.unpack(head)[0]).decode('utf-8')
+
+    while True:
+        head = f.read(_STR.size)
+        if not head:
+            return
+        if len(head) != _STR.size:
+            raise RecordFormatError('ファイルが途中で切れています')
+        team = read_str(head)
+        match_name = read_str(read(_STR.size))
+        map_name = read_str(read(_STR.size))
+        if version == 1:
+            ordinal, rcount, n = _RECORD.unpack(read(_RECORD.size))
+            body = read(_POINT.size * n)
+            pts = [{'x': x, 'y': y, 'w': w, 'h': h} for x, y, w, h in _POINT.iter_unpack(body)]
+        else:
+            ordinal, rcount, n, size = _RECORD_V2.unpack(read(_RECORD_V2.size))
+            body = read(_POINT_V2.size * n)
+            pts = [{'x': x, 'y': y, 'w': size, 'h': size} for x, y in _POINT_V2.iter_unpack(body)]
+        yield Match(team, match_name, map_name, datetime.date.fromordinal(ordinal), rcount, pts)
+
+
+def save_match(path: Path, match: Match, fsync: bool=True) -> None:
+    """
+    1試合分のデータを保存する(一時ファイルに書いてから置き換え、途中で止まっても書きかけのファイルを残さない)
+
+    Args:
+        path (Path): 保存先
+        match (Match): 試合データ
+        fsync (bool): Trueの場合は置き換える前にディスクに書き込む
+    """
+    # cachestoreは索引(catalog)を通してこのモジュールを読み込むので、使うときに読み込む
+    from cachestore import replace_file
+    with replace_file(path, fsync=fsync) as f:
+        write_matches(f, [match])
+
+
+def read_version(path: Path) -> int:
+    """
+    Args:
+        path (Path): 試合ファイルのパス
+
+    Returns:
+        int: 試合データファイルの形式(試合データファイルでない場合は0)
+    """
+    with open(path, 'rb') as f:
+        header = f.read(_HEADER.size)
+    if len(header) != _HEADER.size:
+        return 0
+    magic, version = _HEADER.unpack(header)
+    return version if magic == MAGIC else 0
+
+
+def load_match(path: Path) -> Match:
+    """
+    保存された試合データを読み込む
+
+    Args:
+        path (Path): 試合ファイルのパス
+
+    Returns:
+        Match: 試合データ
+    """
+    with open(path, 'rb') as f:
+        for m in read_matches(f):
+            return m
+    raise RecordFormatError(f'{path}に試合データがありません')
+
+
+def load_legacy_match(path: Path) -> Match:
+    """
+    旧形式(pickle)の試合データを読み込む
+
+    pickleは読み込むだけで任意のコードを実行できるため、自分で記録したファイルの変換にだけ使う
+
+    Args:
+        path (Path): 試合ファイル(.pkl)のパス
+
+    Returns:
+        Match: 試合データ
+    """
+    with open(path, 'rb') as f:
+        return pickle.load(f)
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""
+チーム・マップごとの区画別の集計(どの区画に何試合降りたか)
+
+区画はランドマーク名と同じ縦横NAME_GRID分割(A1~)で、全期間・月別・ラウンド別に
+「その区画に1点以上降りた試合数」を数える。集計は cache/stats/<マップ名>/<チーム名>.json に置き、
+試合を記録するごとに差分だけ更新する(試合ごとの内訳は<チーム名>.files.jsonに持つ)
+
+使い方:
+    python src/regionstats.py Miramar [--teams チームA] [--month 2023-10] [--round 3]
+    python src/regionstats.py --rebuild
+"""
+import argparse
+from typing import List, Tuple
+
+from cachestore import TeamMapStore, cli_parser
+from catalog import MatchRecord
+from landmarks import NAME_GRID, landmark_name
+from recordio import load_match
+
+# 保存形式(変わった場合は作り直す)
+STATS_VERSION = 2
+
+
+def cell_name(cell: int) -> str:
+    """
+    Args:
+        cell (int): 区画番号(行 * NAME_GRID + 列)
+
+    Returns:
+        str: 区画名(例: 'C4')
+    """
+    row, col = divmod(cell, NAME_GRID)
+    return landmark_name((col + 0.5) / NAME_GRID, (row + 0.5) / NAME_GRID)
+
+
+class RegionStats:
+    """
+    1チーム・1マップ分の区画別の集計
+    """
+
+    def __init__(self, data: dict) -> None:
+        """
+        Args:
+            data (dict): 集計({'total': {'matches': 試合数, 'cells': {区画番号: 試合数}}, 'months': {...}, 'rounds': {...}})
+        """
+        self.data = data
+
+    def _bucket(self, month: str=None, rcount: int=None) -> dict:
+        if month is not None and rcount is not None:
+            raise ValueError('月とラウンドは同時に指定できません')
+        if month is not None:
+            return self.data['months'].get(month, {'matches': 0, 'cells': {}})
+        if rcount is not None:
+            return self.data['rounds'].get(str(rcount), {'matches': 0, 'cells': {}})
+        return self.data['total']
+
+    def matches(self, month: str=None, rcount: int=None) -> int:
+        """
+        Args:
+            month (str): 月(YYYY-MM、Noneの場合は全期間)
+            rcount (int): ラウンド数(Noneの場合は全ラウンド)
+
+        Returns:
+            int: 試合数
+        """
+        return self._bucket(month, rcount)['matches']
+
+    def share(self, cell: int, month: str=None, rcount: int=None) -> float:
+        """
+        Args:
+            cell (int): 区画番号
+            month (str): 月(YYYY-MM、Noneの場合は全期間)
+            rcount (int): ラウンド数(Noneの場合は全ラウンド)
+
+        Returns:
+            float: その区画に降りた試合の割合(0~1)
+        """
+        bucket = self._bucket(month, rcount)
+        if not bucket['matches']:
+            return 0.0
+        return bucket['cells'].get(str(cell), 0) / bucket['matches']
+
+    def top(self, n: int=5, month: str=None, rcount: int=None) -> List[Tuple[str, int, float]]:
+        """
+        Args:
+            n (int): 件数
+            month (str): 月(YYYY-MM、Noneの場合は全期間)
+            rcount (int): ラウンド数(Noneの場合は全ラウンド)
+
+        Returns:
+            List[Tuple[str, int, float]]: 降りた試合が多い順の(区画名, 試合数, 割合)一覧
+        """
+        bucket = self._bucket(month, rcount)
+        cells = sorted(bucket['cells'].items(), key=lambda item: -item[1])[:n]
+        return [(cell_name(int(cell)), count, count / bucket['matches']) for cell, count in cells]
+
+
+class RegionStatsStore(TeamMapStore):
+    """
+    チーム・マップごとの区画別の集計の保存先
+    """
+    VERSION = STATS_VERSION
+    result = RegionStats
+
+    def _empty(self) -> dict:
+        return {'version': STATS_VERSION, 'total': {'matches': 0, 'cells': {}}, 'months': {}, 'rounds': {}}
+
+    @staticmethod
+    def _entry(record: MatchRecord) -> list:
+        """
+        試合ごとの内訳([mtime, 月, ラウンド数, 降りた区画一覧])
+        """
+        m = load_match(record.path)
+        cells = set()
+        for pt in m.pts:
+            col = min(max(int(pt['x'] / pt['w'] * NAME_GRID), 0), NAME_GRID - 1)
+            row = min(max(int(pt['y'] / pt['h'] * NAME_GRID), 0), NAME_GRID - 1)
+            cells.add(row * NAME_GRID + col)
+        return [record.path.stat().st_mtime_ns, record.date.strftime('%Y-%m'), record.rcount, sorted(cells)]
+
+    @staticmethod
+    def _apply(data: dict, entry: list, sign: int) -> None:
+        _, month, rcount, cells = entry
+        for bucket in (data['total'],
+                       data['months'].setdefault(month, {'matches': 0, 'cells': {}}),
+                       data['rounds'].setdefault(str(rcount), {'matches': 0, 'cells': {}})):
+            bucket['matches'] += sign
+            for cell in cells:
+                count = bucket['cells'].get(str(cell), 0) + sign
+                if count:
+                    bucket['cells'][str(cell)] = count
+                else:
+                    bucket['cells'].pop(str(cell), None)
+
+
+def show(stats: RegionStats, team: str, args: argparse.Namespace) -> None:
+    if not stats.matches(args.month, args.rcount):
+        return
+    regions = ' '.join(f'{name}:{share:.0%}' for name, _, share in stats.top(args.num, args.month, args.rcount))
+    print(f'{team}\t{stats.matches(args.month, args.rcount)}試合\t{regions}')
+
+
+def main() -> None:
+    parser = cli_parser('チーム・マップごとの区画別の集計')
+    parser.add_argument('--month', help='月(YYYY-MM)')
+    parser.add_argument('--round', type=int, dest='rcount', help='ラウンド数')
+    parser.add_argument('-n', '--num', type=int, default=5, help='表示する区画数')
+    RegionStatsStore.main(parser, 'stats', show)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
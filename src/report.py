@@ -0,0 +1,310 @@
+"""
+チーム×マップごとの偵察シート(降下地点・ヒートマップ・よく降りる場所)を画面なしでまとめて書き出す
+
+試合の絞り込みと点の取り出しはこのプロセスで行い、描画とPNGへの書き出しはプロセスプールで並列に行う。
+各プロセスはマップ画像のデコード・縮小結果を使い回し(縮小版はcache/maps/に共有)、
+同じマップのシートが同じプロセスに続けて割り当たるようマップ順に並べて渡す
+
+使い方:
+    python src/report.py --teams チームA チームB --maps Erangel Miramar --start 2023-10-01 --end 2023-10-31 --out report [--pdf report.pdf]
+"""
+import argparse
+import datetime
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+from calibration import map_images
+from catalog import Catalog
+from colors import get_colors
+from heatmap import render_heatmap
+from landmarks import Landmark, LandmarkStore
+from mapcache import MapImageCache
+from overlay import render_points
+from pointstore import PointStore
+from query import latest_per_team
+from regionstats import RegionStatsStore
+
+# マップ部分の一辺
+SIZE = 900
+# 右側の文字の欄の幅
+PANEL = 420
+# 日本語を表示できるフォント(見つかった最初のもの)
+FONTS = ('meiryo.ttc', 'msgothic.ttc', 'YuGothM.ttc', 'NotoSansCJK-Regular.ttc', 'ipaexg.ttf',
+         '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc', 'DejaVuSans.ttf')
+
+# プロセスごとのマップ画像のキャッシュ(_init_workerで作る)
+_map_cache: MapImageCache = None
+
+
+class Sheet:
+    """
+    1チーム・1マップ分の偵察シートの内容(プロセス間で受け渡す)
+    """
+
+    def __init__(self,
+                 team: str,
+                 map_path: Path,
+                 period: str,
+                 matches: int,
+                 xs: List[float],
+                 ys: List[float],
+                 color: str,
+                 landmarks: List[Landmark],
+                 regions: List[Tuple[str, int, float]],
+                 out: Path) -> None:
+        """
+        Args:
+            team (str): チーム名
+            map_path (Path): マップ画像のパス
+            period (str): 期間の表示
+            matches (int): 試合数
+            xs (List[float]): 正規化したx座標(0~1)
+            ys (List[float]): 正規化したy座標(0~1)
+            color (str): 点の色
+            landmarks (List[Landmark]): よく降りる場所(全期間)
+            regions (List[Tuple[str, int, float]]): よく降りる区画(全期間、RegionStats.top参照)
+            out (Path): 書き出し先のPNG
+        """
+        self.team = team
+        self.map_path = map_path
+        self.period = period
+        self.matches = matches
+        self.xs = xs
+        self.ys = ys
+        self.color = color
+        self.landmarks = landmarks
+        self.regions = regions
+        self.out = out
+
+
+def load_font(size: int, path: str=None) -> ImageFont.ImageFont:
+    """
+    Args:
+        size (int): 文字の大きさ
+        path (str): フォントファイル(Noneの場合はFONTSから探す)
+
+    Returns:
+        ImageFont.ImageFont: フォント(見つからない場合は既定のビットマップフォント)
+    """
+    for candidate in ([path] if path else FONTS):
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+def render_sheet(sheet: Sheet, cache: MapImageCache, font: str=None, size: int=SIZE) -> Image.Image:
+    """
+    Args:
+        sheet (Sheet): シートの内容
+        cache (MapImageCache): マップ画像のキャッシュ
+        font (str): フォントファイル(Noneの場合はFONTSから探す)
+        size (int): マップ部分の一辺
+
+    Returns:
+        Image.Image: 偵察シート(RGB)
+    """
+    img = Image.new('RGB', (size + PANEL, size), 'white')
+    img.paste(cache.get(sheet.map_path, (size, size)).convert('RGB'), (0, 0))
+
+    pixels = [(x * size, y * size, 0) for x, y in zip(sheet.xs, sheet.ys)]
+    if pixels:
+        heat = render_heatmap(pixels, (size, size))
+        img.paste(heat, (0, 0), heat)
+        points = render_points(pixels, (size, size), {0: sheet.color})
+        img.paste(points, (0, 0), points)
+
+    draw = ImageDraw.Draw(img)
+    small = load_font(14, font)
+    rgb = ImageColor.getrgb(sheet.color)
+    for lm in sheet.landmarks:
+        x, y, r = lm.x * size, lm.y * size, max(lm.spread * size, 10)
+        draw.ellipse((x - r, y - r, x + r, y + r), outline=rgb, width=3)
+        draw.text((x + r + 2, y - 8), f'{lm.name} {lm.matches}試合', fill=rgb, font=small, stroke_width=2, stroke_fill='white')
+
+    # 右側の文字の欄
+    large, normal = load_font(28, font), load_font(18, font)
+    left = size + 20
+    lines = [(sheet.team, large),
+             (f'{sheet.map_path.stem}  {sheet.period}', normal),
+             (f'{sheet.matches}試合 / {len(pixels)}点', normal),
+             ('', normal),
+             ('よく降りる場所(全期間)', normal)]
+    lines += [(f'  {lm.name}  {lm.matches}試合  最終 {lm.last}', normal) for lm in sheet.landmarks] or [('  なし', normal)]
+    lines += [('', normal), ('よく降りる区画(全期間)', normal)]
+    lines += [(f'  {name}  {count}試合 ({share:.0%})', normal) for name, count, share in sheet.regions] or [('  なし', normal)]
+    y = 20
+    for text, f in lines:
+        draw.text((left, y), text, fill='black', font=f)
+        y += 44 if f is large else 28
+    return img
+
+
+def _init_worker(cache: Path) -> None:
+    global _map_cache
+    _map_cache = MapImageCache(cache)
+
+
+def _render_to_file(sheet: Sheet, font: str, size: int) -> Path:
+    """
+    プロセスプールで実行する描画(書き出したPNGのパスを返す)
+    """
+    sheet.out.parent.mkdir(parents=True, exist_ok=True)
+    # 圧縮率より書き出しの速さを優先する
+    render_sheet(sheet, _map_cache, font, size).save(sheet.out, compress_level=3)
+    return sheet.out
+
+
+def collect_sheets(teams_dir: Path,
+                   cache: Path,
+                   maps_dir: Path,
+                   out: Path,
+                   teams: Optional[List[str]],
+                   maps: List[str],
+                   start: datetime.date=None,
+                   end: datetime.date=None,
+                   last: int=None,
+                   num_landmarks: int=5) -> List[Sheet]:
+    """
+    シートの内容を集める(列データ・ランドマーク・区画統計の更新もここで行う)
+
+    Args:
+        teams_dir (Path): チームデータ保存用ディレクトリ
+        cache (Path): 索引等の生成データ保存用ディレクトリ
+        maps_dir (Path): マップ画像ディレクトリ
+        out (Path): 書き出し先ディレクトリ
+        teams (Optional[List[str]]): チーム名一覧(Noneの場合は全チーム)
+        maps (List[str]): マップ名一覧(拡張子の有無は問わない)
+        start (datetime.date): 開始日
+        end (datetime.date): 終了日
+        last (int): チームごとの最新の試合数(Noneの場合は期間内の全試合)
+        num_landmarks (int): 表示するランドマーク・区画の数
+
+    Returns:
+        List[Sheet]: マップ順・チーム順のシート一覧(試合がない組み合わせは除く)
+    """
+    catalog = Catalog(teams_dir, cache / 'catalog.sqlite3')
+    catalog.sync()
+    if teams is None:
+        teams = catalog.team_names()
+    points = PointStore(cache / 'points')
+    landmarks = LandmarkStore(cache / 'landmarks', points)
+    region_stats = RegionStatsStore(cache / 'stats')
+    map_files = {m.stem: m for m in map_images(maps_dir)}
+    period = f'{start or ""}~{end or ""}' if start or end else '全期間'
+    if last is not None:
+        period += f' 最新{last}試合'
+
+    sheets = []
+    try:
+        for map_name in maps:
+            map_name = Path(map_name).stem
+            if map_name not in map_files:
+                raise FileNotFoundError(f'{maps_dir}に{map_name}の画像がありません')
+            # よく降りる場所・区画は全期間の記録から求める
+            history = catalog.find(map_name, teams=teams)
+            points.update(map_name, history)
+            region_stats.add(history)
+            team_landmarks = landmarks.update(map_name, teams)
+            records = catalog.find(map_name, teams=teams, start=start, end=end)
+            if last is not None:
+                records = latest_per_team(records, last, 'last')
+            map_points = points.open(map_name)
+            for i, team in enumerate(teams):
+                team_records = [record for record in records if record.team == team]
+                if not team_records:
+                    continue
+                rows = map_points.where(paths=[record.path for record in team_records])
+                sheets.append(Sheet(team,
+                                    map_files[map_name],
+                                    period,
+                                    len(team_records),
+                                    [map_points.x[r] for r in rows],
+                                    [map_points.y[r] for r in rows],
+                                    get_colors()[i % len(get_colors())],
+                                    team_landmarks.get(team, [])[:num_landmarks],
+                                    region_stats.get(map_name, team).top(num_landmarks),
+                                    out / map_name / f'{team}.png'))
+    finally:
+        points.close()
+        catalog.close()
+    return sheets
+
+
+def render_all(sheets: List[Sheet], cache: Path, jobs: int=None, font: str=None, size: int=SIZE) -> List[Path]:
+    """
+    シートをプロセスプールで描画してPNGに書き出す
+
+    Args:
+        sheets (List[Sheet]): シート一覧
+        cache (Path): 索引等の生成データ保存用ディレクトリ
+        jobs (int): プロセス数(Noneの場合はCPU数)
+        font (str): フォントファイル
+        size (int): マップ部分の一辺
+
+    Returns:
+        List[Path]: 書き出したPNG一覧(sheetsと同じ順)
+    """
+    map_cache = MapImageCache(cache / 'maps')
+    # 縮小版マップは各プロセスが同時に作らないよう先に作っておく
+    for map_path in dict.fromkeys(sheet.map_path for sheet in sheets):
+        map_cache.build_pyramid(map_path)
+    if jobs == 1:
+        _init_worker(cache / 'maps')
+        return [_render_to_file(sheet, font, size) for sheet in sheets]
+
+    jobs = jobs or os.cpu_count() or 1
+    # 同じマップのシートがなるべく同じプロセスに続けて渡るようにまとめて渡す
+    chunksize = max(1, len(sheets) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(cache / 'maps',)) as pool:
+        return list(pool.map(_render_to_file, sheets, [font] * len(sheets), [size] * len(sheets), chunksize=chunksize))
+
+
+def write_pdf(paths: List[Path], pdf: Path) -> None:
+    """
+    Args:
+        paths (List[Path]): PNG一覧(1枚1ページ)
+        pdf (Path): 書き出し先のPDF
+    """
+    pages = [Image.open(path).convert('RGB') for path in paths]
+    pages[0].save(pdf, save_all=True, append_images=pages[1:])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='チーム×マップごとの偵察シートの書き出し')
+    parser.add_argument('--teams', nargs='+', help='チーム名(省略した場合は全チーム)')
+    parser.add_argument('--maps', nargs='+', required=True, help='マップ名')
+    parser.add_argument('--start', type=datetime.date.fromisoformat, help='開始日(YYYY-MM-DD)')
+    parser.add_argument('--end', type=datetime.date.fromisoformat, help='終了日(YYYY-MM-DD)')
+    parser.add_argument('--last', type=int, help='チームごとの最新の試合数')
+    parser.add_argument('--out', type=Path, default=Path('report'), help='PNGの書き出し先ディレクトリ')
+    parser.add_argument('--pdf', type=Path, help='全シートをまとめたPDFの書き出し先')
+    parser.add_argument('--jobs', type=int, help='プロセス数(省略した場合はCPU数)')
+    parser.add_argument('--size', type=int, default=SIZE, help='マップ部分の一辺')
+    parser.add_argument('--font', help='日本語を表示できるフォントファイル')
+    parser.add_argument('--teams-dir', type=Path, default=Path('teams'), help='チームデータ保存用ディレクトリ')
+    parser.add_argument('--maps-dir', type=Path, default=Path('maps'), help='マップ画像ディレクトリ')
+    parser.add_argument('--cache', type=Path, default=Path('cache'), help='索引等の生成データ保存用ディレクトリ')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    args.cache.mkdir(exist_ok=True)
+    sheets = collect_sheets(args.teams_dir, args.cache, args.maps_dir, args.out,
+                            args.teams, args.maps, args.start, args.end, args.last)
+    if not sheets:
+        print('表示できる試合がありません')
+        return
+    paths = render_all(sheets, args.cache, args.jobs, args.font, args.size)
+    if args.pdf is not None:
+        write_pdf(paths, args.pdf)
+    print(f'{len(paths)}枚書き出しました({time.perf_counter() - started:.1f}秒)')
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,137 @@
+from array import array
+from pathlib import Path
+from typing import List
+
+from cachestore import read_json, replace_file, write_json
+from pointstore import MapPoints
+
+# 索引の一辺の区画数
+GRID = 256
+# 索引の作成後に追記された行がこれより多ければ作り直す
+REBUILD_MIN = 5000
+
+
+class PointIndex:
+    """
+    1マップ分の降下地点の一様グリッド索引
+
+    行番号を区画順に並べたもの(order)と区画ごとの開始位置(starts)を持ち、
+    索引の作成後に追記された行は検索時に順に調べる
+    """
+
+    def __init__(self, rows: int, generation: int, grid: int, starts: array, order: array) -> None:
+        """
+        Args:
+            rows (int): 索引に含まれる行数
+            generation (int): 索引を作成した時点の列データの世代(MapPoints.generation)
+            grid (int): 一辺の区画数
+            starts (array): 区画ごとの開始位置(区画数+1個)
+            order (array): 区画順に並べた行番号
+        """
+        self.rows = rows
+        self.generation = generation
+        self.grid = grid
+        self.starts = starts
+        self.order = order
+
+    @classmethod
+    def build(cls, points: MapPoints, grid: int=GRID) -> 'PointIndex':
+        """
+        Args:
+            points (MapPoints): マップの列データ
+            grid (int): 一辺の区画数
+
+        Returns:
+            PointIndex: 列データ全体の索引
+        """
+        cells = array('i', (cls._cell(points.x[i], points.y[i], grid) for i in range(points.rows)))
+        # 区画ごとの数え上げソート
+        starts = array('i', bytes(array('i').itemsize * (grid * grid + 1)))
+        for cell in cells:
+            starts[cell + 1] += 1
+        for cell in range(grid * grid):
+            starts[cell + 1] += starts[cell]
+        fill = array('i', starts)
+        order = array('i', bytes(array('i').itemsize * points.rows))
+        for i, cell in enumerate(cells):
+            order[fill[cell]] = i
+            fill[cell] += 1
+        return cls(points.rows, points.generation, grid, starts, order)
+
+    @classmethod
+    def load(cls, directory: Path, points: MapPoints) -> 'PointIndex':
+        """
+        保存済みの索引を読み込む(ない場合や古い場合は作り直して保存する)
+
+        Args:
+            directory (Path): 列データのディレクトリ
+            points (MapPoints): マップの列データ
+
+        Returns:
+            PointIndex: 索引
+        """
+        meta_path = directory / 'index.json'
+        meta = read_json(meta_path)
+        if meta is not None:
+            starts = array('i')
+            order = array('i')
+            with open(directory / 'index_starts.i', 'rb') as f:
+                starts.fromfile(f, meta['grid'] * meta['grid'] + 1)
+            with open(directory / 'index_order.i', 'rb') as f:
+                order.fromfile(f, meta['rows'])
+            index = cls(meta['rows'], meta['generation'], meta['grid'], starts, order)
+            if index.is_current(points):
+                return index
+
+        index = cls.build(points)
+        if directory.is_dir():
+            # 途中で止まった場合に古いindex.jsonで新しい配列を読まないよう、先に消して最後に書く
+            meta_path.unlink(missing_ok=True)
+            with replace_file(directory / 'index_starts.i') as f:
+                index.starts.tofile(f)
+            with replace_file(directory / 'index_order.i') as f:
+                index.order.tofile(f)
+            write_json(meta_path, {'rows': index.rows, 'generation': index.generation, 'grid': index.grid})
+        return index
+
+    def is_current(self, points: MapPoints) -> bool:
+        """
+        Args:
+            points (MapPoints): マップの列データ
+
+        Returns:
+            bool: この索引で検索できるか(既存の行が書き直されておらず、追記された行が多すぎない)
+        """
+        return (self.generation == points.generation
+                and self.rows <= points.rows
+                and points.rows - self.rows <= max(REBUILD_MIN, self.rows // 8))
+
+    def near(self, points: MapPoints, x: float, y: float, r: float) -> List[int]:
+        """
+        Args:
+            points (MapPoints): マップの列データ
+            x (float): x座標(正規化座標)
+            y (float): y座標(正規化座標)
+            r (float): 半径(正規化座標)
+
+        Returns:
+            List[int]: (x, y)から半径r以内にある点の行番号一覧
+        """
+        g = self.grid
+        x0 = min(max(int((x - r) * g), 0), g - 1)
+        x1 = min(max(int((x + r) * g), 0), g - 1)
+        y0 = min(max(int((y - r) * g), 0), g - 1)
+        y1 = min(max(int((y + r) * g), 0), g - 1)
+        candidates = []
+        for cy in range(y0, y1 + 1):
+            # 同じ行の区画は連続しているのでまとめて取り出す
+            candidates.extend(self.order[self.starts[cy * g + x0]:self.starts[cy * g + x1 + 1]])
+        candidates.extend(range(self.rows, points.rows))
+        r2 = r * r
+        return [i for i in candidates if (points.x[i] - x) ** 2 + (points.y[i] - y) ** 2 <= r2]
+
+    @staticmethod
+    def _cell(x: float, y: float, grid: int) -> int:
+        cx = min(max(int(x * grid), 0), grid - 1)
+        cy = min(max(int(y * grid), 0), grid - 1)
+        return cy * grid + cx
\ No newline at end of file
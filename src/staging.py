@@ -0,0 +1,246 @@
+"""
+仮記録の置き場所
+
+仮記録はメモリ上に持って画面にすぐ反映し、追加・削除はバックグラウンドのスレッドで
+tmp/staging.journal に追記していく(まとめて書いて1度だけfsyncする)。
+起動時にジャーナルを読み直して復元し(書きかけで止まった末尾は捨てる)、
+取り消された操作が溜まっていれば残っている仮記録だけに詰め直す
+"""
+import io
+import os
+import queue
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from cachestore import replace_file
+from match import Match
+from recordio import EXT, VERSION, RecordFormatError, load_match, read_matches, write_matches
+
+MAGIC = b'LMKS'
+_OP = struct.Struct('<BHI')  # 操作, 名前のバイト数, 中身のバイト数(続けてそれぞれの中身)
+PUT = 1
+DELETE = 2
+# 取り消された操作がこれより多ければ起動時に詰め直す
+COMPACT_MIN = 256
+
+
+class StagingArea:
+    """
+    仮記録(仮記録のファイル名 -> 試合データ)の一覧
+    """
+
+    def __init__(self, root: Path) -> None:
+        """
+        Args:
+            root (Path): ランドマークデータ一時保存用ディレクトリ
+        """
+        self.root = root
+        self.path = root / 'staging.journal'
+        self._records: Dict[str, bytes] = {}  # 仮記録のファイル名 -> 1試合分の.lmkの中身
+        ops = self._replay() if self.path.exists() else None
+
+        # 以前の形式(1試合1ファイル)の仮記録を取り込む
+        legacy = []
+        for path in sorted(root.glob(f'*{EXT}')):
+            try:
+                load_match(path)
+            except RecordFormatError:
+                continue
+            self._records[path.name] = path.read_bytes()
+            legacy.append(path)
+        # 古い版(ピクセル座標)の仮記録は最新の版に書き直す(.lmkの4バイト目が版)
+        old = [name for name, body in self._records.items() if body[3] != VERSION]
+        for name in old:
+            self._records[name] = self._encode(self.get(name))
+        if ops is None or legacy or old or ops - len(self._records) > COMPACT_MIN:
+            self._compact()
+        for path in legacy:
+            path.unlink()
+
+        self._file = open(self.path, 'ab')
+        self._error: Optional[Exception] = None  # バックグラウンドのスレッドで書き込めなかったときの例外
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def names(self) -> List[str]:
+        """
+        Returns:
+            List[str]: 仮記録のファイル名一覧(古い順)
+        """
+        return list(self._records)
+
+    def get(self, name: str) -> Match:
+        """
+        Args:
+            name (str): 仮記録のファイル名
+
+        Returns:
+            Match: 試合データ
+        """
+        return next(read_matches(io.BytesIO(self._records[name])))
+
+    def body(self, name: str) -> bytes:
+        """
+        Args:
+            name (str): 仮記録のファイル名
+
+        Returns:
+            bytes: teamsディレクトリに保存する試合ファイルの中身
+        """
+        return self._records[name]
+
+    def put(self, name: str, match: Match) -> None:
+        """
+        仮記録を追加する(同じ名前があれば置き換える)
+
+        Args:
+            name (str): 仮記録のファイル名
+            match (Match): 試合データ
+        """
+        body = self._encode(match)
+        # 並び順を追加順にするため、置き換える場合も一度取り除く
+        self._records.pop(name, None)
+        self._records[name] = body
+        self._queue.put(self._op(PUT, name, body))
+
+    def remove(self, names: Iterable[str]) -> None:
+        """
+        仮記録を取り除く(ないものは無視する)
+
+        Args:
+            names (Iterable[str]): 仮記録のファイル名一覧
+        """
+        ops = []
+        for name in names:
+            if self._records.pop(name, None) is not None:
+                ops.append(self._op(DELETE, name, b''))
+        if ops:
+            self._queue.put(b''.join(ops))
+
+    def flush(self) -> None:
+        """
+        ここまでの変更がジャーナルに書き込まれるまで待つ
+
+        Raises:
+            OSError: ジャーナルに書き込めなかった変更があり、詰め直しても書き込めなかった
+        """
+        self._queue.join()
+        self._recover()
+
+    def close(self) -> None:
+        """
+        Raises:
+            OSError: ジャーナルに書き込めなかった変更があり、詰め直しても書き込めなかった
+        """
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            self._recover()
+        finally:
+            self._file.close()
+
+    def _recover(self) -> None:
+        """
+        書き込めなかった変更があれば、メモリ上の仮記録からジャーナルを詰め直す(書き込み用のスレッドが待機中に呼ぶ)
+        """
+        error, self._error = self._error, None
+        if error is None:
+            return
+        try:
+            self._file.close()
+        except OSError:
+            # 書き込めなかった分はメモリ上の仮記録から書き直す
+            pass
+        try:
+            self._compact()
+        except OSError as e:
+            # 次のflush・closeでもう一度詰め直す
+            self._error = e
+            raise
+        finally:
+            self._file = open(self.path, 'ab')
+
+    def _write(self) -> None:
+        """
+        変更をジャーナルに追記する(バックグラウンドのスレッド)
+        """
+        while True:
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            data = b''.join(item for item in items if item is not None)
+            try:
+                # 書き込めなかった後は詰め直すまで追記しない(書きかけの操作の後ろに続けると読み直せない)
+                if data and self._error is None:
+                    self._file.write(data)
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+            except (OSError, ValueError) as e:
+                # 途中まで書けた末尾は次回起動時に捨てられる。flush・closeで詰め直す
+                if self._error is None:
+                    self._error = e
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+            if None in items:
+                return
+
+    def _replay(self) -> int:
+        """
+        ジャーナルから仮記録を復元し、読んだ操作の数を返す
+        """
+        data = self.path.read_bytes()
+        if data[:len(MAGIC)] != MAGIC:
+            raise RecordFormatError(f'{self.path}は仮記録のジャーナルではありません')
+        pos = len(MAGIC)
+        n = 0
+        while pos + _OP.size <= len(data):
+            op, name_len, body_len = _OP.unpack_from(data, pos)
+            end = pos + _OP.size + name_len + body_len
+            if end > len(data):
+                break
+            name = data[pos+_OP.size:pos+_OP.size+name_len].decode('utf-8')
+            if op == PUT:
+                self._records.pop(name, None)
+                self._records[name] = data[end-body_len:end]
+            else:
+                self._records.pop(name, None)
+            pos = end
+            n += 1
+        if pos != len(data):
+            # 書きかけで止まった末尾を捨てる
+            with open(self.path, 'r+b') as f:
+                f.truncate(pos)
+        return n
+
+    def _compact(self) -> None:
+        """
+        残っている仮記録だけのジャーナルに書き直す
+        """
+        with replace_file(self.path, fsync=True) as f:
+            f.write(MAGIC)
+            for name, body in self._records.items():
+                f.write(self._op(PUT, name, body))
+
+    @staticmethod
+    def _encode(match: Match) -> bytes:
+        buf = io.BytesIO()
+        write_matches(buf, [match])
+        return buf.getvalue()
+
+    @staticmethod
+    def _op(op: int, name: str, body: bytes) -> bytes:
+        b = name.encode('utf-8')
+        return _OP.pack(op, len(b), len(body)) + b + body
\ No newline at end of file
@@ -0,0 +1,59 @@
+import datetime
+import sys
+from pathlib import Path
+from typing import Iterable, Tuple
+
+import pytest
+
+# src/のモジュールを読み込めるようにする(アプリと同じくフラットに置いてある)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from catalog import Catalog, MatchRecord, parse_match_path
+from match import Match
+from pointstore import PointStore
+from recordio import EXT, save_match
+
+
+def save_match_file(teams: Path, team: str='A', map_name: str='Erangel', day: int=1, rcount: int=1,
+                    pts: Iterable[Tuple[float, float]]=((0.5, 0.5),), match_name: str='scrim') -> MatchRecord:
+    """
+    正規化座標の点を持つ試合ファイルを保存する
+
+    Args:
+        teams (Path): チームデータ保存用ディレクトリ
+        team (str): チーム名
+        map_name (str): マップ名
+        day (int): 2024年1月1日を1日目とした試合日
+        rcount (int): ラウンド数
+        pts (Iterable[Tuple[float, float]]): 降下地点(x, y)の一覧
+        match_name (str): スクリム名
+
+    Returns:
+        MatchRecord: 保存した試合ファイル
+    """
+    date = datetime.date(2024, 1, 1) + datetime.timedelta(days=day - 1)
+    path = teams / team / f'{team}_{match_name}_{map_name}_{date}_R{rcount}{EXT}'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    save_match(path, Match(team, match_name, map_name, date, rcount, [{'x': x, 'y': y, 'w': 1, 'h': 1} for x, y in pts]))
+    return parse_match_path(path)
+
+
+@pytest.fixture
+def teams(tmp_path) -> Path:
+    teams = tmp_path / 'teams'
+    teams.mkdir()
+    return teams
+
+
+@pytest.fixture
+def catalog(tmp_path, teams):
+    catalog = Catalog(teams, tmp_path / 'catalog.sqlite3')
+    yield catalog
+    catalog.close()
+
+
+@pytest.fixture
+def points(tmp_path):
+    points = PointStore(tmp_path / 'points')
+    yield points
+    points.close()
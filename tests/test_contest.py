@@ -0,0 +1,41 @@
+import pytest
+
+from calibration import CALIBRATION_FILE, map_images
+from conftest import save_match_file
+from contest import build_contests, load_contests
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    # maps/calibration.jsonのない作業ディレクトリ(縮尺は既定値)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / 'contests'
+
+
+@pytest.mark.parametrize('map_name, contested', [('Erangel', 0), ('Karakin', 1)])
+def test_threshold_in_metres(teams, catalog, points, root, map_name, contested):
+    # 正規化座標で0.05離れた2チーム(Erangelでは400m、Karakinでは100m)
+    save_match_file(teams, 'A', map_name, pts=[(0.3, 0.5)])
+    save_match_file(teams, 'B', map_name, pts=[(0.35, 0.5)])
+    catalog.sync()
+    result = build_contests(catalog, points, root, map_name, threshold=250)
+    assert result['teams'] == ['A', 'B']
+    assert result['contested'][0][1] == contested
+    assert result['together'][0][1] == 1
+    assert load_contests(root, map_name) == result
+
+
+def test_cancelled_load_does_not_save(teams, catalog, points, root):
+    save_match_file(teams, 'A', 'Erangel', pts=[(0.3, 0.5)])
+    save_match_file(teams, 'B', 'Erangel', pts=[(0.31, 0.5)])
+    catalog.sync()
+    assert build_contests(catalog, points, root, 'Erangel', progress=lambda done, total: False) is None
+    assert load_contests(root, 'Erangel') is None
+    assert build_contests(catalog, points, root, 'Erangel')['contested'][0][1] == 1
+
+
+def test_map_images_skip_calibration(tmp_path):
+    (tmp_path / 'Erangel.png').write_bytes(b'')
+    (tmp_path / 'Miramar.JPG').write_bytes(b'')
+    (tmp_path / CALIBRATION_FILE).write_text('{"Erangel": 8160}')
+    assert sorted(m.name for m in map_images(tmp_path)) == ['Erangel.png', 'Miramar.JPG']
@@ -0,0 +1,101 @@
+import datetime
+import json
+import random
+
+import pytest
+
+from conftest import save_match_file
+from drift import Drift, DriftStore
+
+BASE = datetime.date(2024, 1, 1)
+
+
+def entry(day: int, pts: list) -> list:
+    xs = [x for x, _ in pts]
+    ys = [y for _, y in pts]
+    return [0, (BASE + datetime.timedelta(days=day)).toordinal(), len(pts),
+            sum(xs), sum(ys), sum(x * x for x in xs), sum(y * y for y in ys)]
+
+
+def make_drift(tmp_path, spots: list, seed: int=0, jitter: float=0.01) -> Drift:
+    """
+    spots[day]の周りに1日1試合4点降りた記録
+    """
+    rng = random.Random(seed)
+    store = DriftStore(tmp_path / 'drift')
+    data = store._empty()
+    for day, (x, y) in enumerate(spots):
+        pts = [(x + rng.uniform(-jitter, jitter), y + rng.uniform(-jitter, jitter)) for _ in range(4)]
+        store._apply(data, entry(day, pts), 1)
+    return Drift(data)
+
+
+def test_trend_window(tmp_path):
+    drift = make_drift(tmp_path, [(0.01 * day, 0.5) for day in range(20)], jitter=0)
+    trend = drift.trend(window=14)
+    assert [p.date for p in trend] == [BASE + datetime.timedelta(days=day) for day in range(20)]
+    # 最終日までの14日間(6~19日目)
+    last = trend[-1]
+    assert (last.matches, last.points) == (14, 56)
+    assert last.x == pytest.approx(0.01 * sum(range(6, 20)) / 14)
+    assert last.y == pytest.approx(0.5)
+    assert trend[0].spread == pytest.approx(0)
+
+
+def test_no_shift_control(tmp_path):
+    drift = make_drift(tmp_path, [(0.3, 0.3)] * 60)
+    assert drift.shifts(window=14) == []
+
+
+def test_known_shift(tmp_path):
+    drift = make_drift(tmp_path, [(0.2, 0.2)] * 15 + [(0.7, 0.7)] * 15)
+    shifts = drift.shifts(window=14)
+    # 続けて見つかる時期は最も離れているもの(前後の期間が入れ替わりの前後に一致するもの)にまとめる
+    assert len(shifts) == 1
+    shift = shifts[0]
+    assert shift.date == BASE + datetime.timedelta(days=15)
+    assert shift.before == pytest.approx((0.2, 0.2), abs=0.01)
+    assert shift.after == pytest.approx((0.7, 0.7), abs=0.01)
+    assert shift.distance == pytest.approx(0.5 * 2 ** 0.5, abs=0.01)
+
+
+def test_separate_shifts(tmp_path):
+    drift = make_drift(tmp_path, [(0.2, 0.2)] * 20 + [(0.7, 0.7)] * 30 + [(0.2, 0.8)] * 20)
+    assert [s.date for s in drift.shifts(window=14)] == [BASE + datetime.timedelta(days=20), BASE + datetime.timedelta(days=50)]
+
+
+def test_shift_thresholds(tmp_path):
+    spots = [(0.2, 0.2)] * 15 + [(0.23, 0.2)] * 15
+    # 中心の距離がmin_shiftより小さい
+    assert make_drift(tmp_path, spots, jitter=0.001).shifts(window=14) == []
+    assert len(make_drift(tmp_path, spots, jitter=0.001).shifts(window=14, min_shift=0.02)) == 1
+    # ばらつきに対して離れていない
+    assert make_drift(tmp_path, spots, jitter=0.2).shifts(window=14, min_shift=0.02) == []
+    # 試合数が足りない
+    assert make_drift(tmp_path, [(0.2, 0.2)] * 4 + [(0.7, 0.7)] * 4).shifts(window=14) == []
+
+
+def test_store_matches_entries(tmp_path, teams, catalog):
+    store = DriftStore(tmp_path / 'drift')
+    records = [save_match_file(teams, map_name='Miramar', day=day, pts=[(0.1 * day, 0.5)]) for day in (1, 2, 3)]
+    catalog.sync()
+    store.ensure(catalog, 'Miramar', ['A'])
+    # 上書きされた試合は差し替え、点のない試合は数えない
+    save_match_file(teams, map_name='Miramar', day=3, pts=[])
+    store.add(records)
+    summary = json.loads((store.root / 'Miramar' / 'A.json').read_text(encoding='utf-8'))
+    assert 'files' not in summary
+    trend = store.get('Miramar', 'A').trend()
+    assert [(p.date.day, p.matches) for p in trend] == [(1, 1), (2, 2)]
+    assert trend[-1].x == pytest.approx(0.15)
+
+
+def test_add_before_first_view(tmp_path, teams, catalog):
+    store = DriftStore(tmp_path / 'drift')
+    records = [save_match_file(teams, map_name='Miramar', day=day) for day in (1, 4, 7, 10)]
+    # 推移を初めて表示する前に記録した試合だけで集計を作らない
+    store.add(records[-1:])
+    catalog.sync()
+    store.ensure(catalog, 'Miramar', ['A'])
+    assert [p.date for p in store.get('Miramar', 'A').trend()] == [record.date for record in records]
+
@@ -0,0 +1,73 @@
+import datetime
+
+import pytest
+
+import recordio
+from drift import DriftStore
+from importer import MAX_POINTS, Importer, RowError, parse_row
+from match import Match
+from recordio import EXT, load_match, save_match
+from regionstats import RegionStatsStore
+
+
+def row(team: str, rcount: int, x: float) -> dict:
+    return {'team': team, 'match': 'scrim', 'map': 'Erangel', 'date': '2024-01-01', 'round': rcount, 'x': x, 'y': 0.5}
+
+
+@pytest.fixture
+def importer(tmp_path, teams, catalog, points):
+    return Importer(teams, catalog, points, RegionStatsStore(tmp_path / 'stats'), DriftStore(tmp_path / 'drift'), batch=1)
+
+
+def run(importer: Importer, rows: list) -> None:
+    located = [(f'rows:{n}', r) for n, r in enumerate(rows, 1)]
+    importer.count(located)
+    importer.feed(located)
+    importer.flush()
+
+
+def test_match_spanning_batches(teams, importer):
+    # batch=1なので試合が切り替わるたびに保存する
+    run(importer, [row('A', 1, 0.1), row('B', 1, 0.2), row('A', 1, 0.3)])
+    m = load_match(teams / 'A' / f'A_scrim_Erangel_2024-01-01_R1{EXT}')
+    assert [round(pt['x'] / pt['w'], 5) for pt in m.pts] == [0.1, 0.3]
+    assert importer.stats == {'matches': 2, 'points': 3, 'skipped': 0, 'errors': 0}
+
+
+def test_reject_oversized_match_before_first_batch(teams, importer):
+    # 最初のまとまりの時点では上限以下でも、後のまとまりで超える試合は1度も保存しない
+    rows = [row('A', 1, 0.1)] + [row('B', 1, 0.2)] + [row('A', 1, 0.1 + 0.01 * k) for k in range(MAX_POINTS)]
+    run(importer, rows)
+    assert not (teams / 'A').exists()
+    assert (teams / 'B' / f'B_scrim_Erangel_2024-01-01_R1{EXT}').exists()
+    assert importer.rejected == {('A', 'scrim', 'Erangel', datetime.date(2024, 1, 1), 1)}
+    assert importer.stats['errors'] == 1
+    assert [r.team for r in importer.catalog.find('Erangel')] == ['B']
+
+
+@pytest.mark.parametrize('pts', [5, None, 'xy', [5], [None], ['12']])
+def test_invalid_pts(pts):
+    with pytest.raises(RowError):
+        parse_row({**row('A', 1, 0.1), 'pts': pts})
+
+
+def test_pts_pairs_and_dicts():
+    _, pts = parse_row({**row('A', 1, 0.1), 'pts': [[0.1, 0.2], (0.3, 0.4), {'x': 5, 'y': 6, 'w': 8, 'h': 8}]})
+    assert pts == [{'x': 0.1, 'y': 0.2, 'w': 1, 'h': 1}, {'x': 0.3, 'y': 0.4, 'w': 1, 'h': 1}, {'x': 5.0, 'y': 6.0, 'w': 8, 'h': 8}]
+
+
+def test_save_match_keeps_old_file_on_failure(tmp_path, monkeypatch):
+    path = tmp_path / f'A_scrim_Erangel_2024-01-01_R1{EXT}'
+    old = Match('A', 'scrim', 'Erangel', datetime.date(2024, 1, 1), 1, [{'x': 1.0, 'y': 2.0, 'w': 8, 'h': 8}])
+    save_match(path, old)
+
+    def fail(f, matches):
+        f.write(b'LMK')
+        raise OSError('disk full')
+
+    monkeypatch.setattr(recordio, 'write_matches', fail)
+    with pytest.raises(OSError):
+        save_match(path, Match('A', 'scrim', 'Erangel', datetime.date(2024, 1, 1), 1, []))
+    # 書きかけのファイルで置き換えず、一時ファイルも残さない
+    assert len(load_match(path).pts) == 1
+    assert [p.name for p in tmp_path.iterdir()] == [path.name]
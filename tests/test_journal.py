@@ -0,0 +1,140 @@
+import datetime
+
+import pytest
+
+import journal
+from journal import BatchCommit
+from match import Match
+from recordio import EXT, load_match
+from staging import StagingArea
+
+
+class Crash(Exception):
+    """
+    確定保存の途中で止まったことにする
+    """
+
+
+def make_match(team: str, rcount: int) -> Match:
+    pts = [{'x': 10.0 * rcount, 'y': 20.0, 'w': 800, 'h': 800}]
+    return Match(team, 'scrim', 'Erangel', datetime.date(2024, 1, 1), rcount, pts)
+
+
+@pytest.fixture
+def env(tmp_path, teams):
+    (tmp_path / 'cache').mkdir()
+    (tmp_path / 'tmp').mkdir()
+    area = StagingArea(tmp_path / 'tmp')
+    names = []
+    for team, rcount in (('A', 1), ('A', 2), ('B', 1)):
+        name = f'{team}_scrim_Erangel_2024-01-01_R{rcount}{EXT}'
+        area.put(name, make_match(team, rcount))
+        names.append(name)
+    yield teams, tmp_path / 'cache' / 'commit.journal', area, names
+    area.close()
+
+
+def saved(teams) -> list:
+    return sorted(path.name for path in teams.glob(f'*/*{EXT}'))
+
+
+def reopen(area: StagingArea) -> StagingArea:
+    """
+    アプリを起動し直したときの仮記録
+    """
+    area.close()
+    return StagingArea(area.root)
+
+
+def test_commit(env):
+    teams, path, area, names = env
+    committer = BatchCommit(teams, path, area)
+    staged = committer.stage(names)
+    assert committer.conflicts(staged) == []
+    indexed = []
+    assert committer.commit(staged, indexed.extend) == [teams / name.split('_')[0] / name for name in names]
+    assert indexed == [teams / name.split('_')[0] / name for name in names]
+    assert saved(teams) == sorted(names)
+    assert load_match(teams / 'B' / names[2]).team == 'B'
+    assert len(area) == 0
+    assert not path.exists()
+    # 保存済みの試合を確定し直すと上書きになる
+    assert committer.conflicts(staged) == [dest for _, dest, _ in staged]
+
+
+def test_recover_after_index_crash(env):
+    teams, path, area, names = env
+
+    def crash(paths):
+        raise Crash
+
+    with pytest.raises(Crash):
+        BatchCommit(teams, path, area).commit(BatchCommit(teams, path, area).stage(names), crash)
+    # 索引に反映する前に止まったので、ジャーナルと仮記録は残っている
+    assert path.exists()
+    area = reopen(area)
+    assert len(area) == 3
+
+    indexed = []
+    assert len(BatchCommit(teams, path, area).recover(indexed.extend)) == 3
+    assert sorted(p.name for p in indexed) == sorted(names)
+    assert saved(teams) == sorted(names)
+    assert len(reopen(area)) == 0
+    assert not path.exists()
+
+
+def test_recover_after_partial_write(env, monkeypatch):
+    teams, path, area, names = env
+    real = journal.replace_file
+    calls = []
+
+    def crash_second(dest, fsync=False):
+        calls.append(dest)
+        if len(calls) == 2:
+            raise Crash
+        return real(dest, fsync)
+
+    monkeypatch.setattr(journal, 'replace_file', crash_second)
+    committer = BatchCommit(teams, path, area)
+    with pytest.raises(Crash):
+        committer.commit(committer.stage(names))
+    monkeypatch.undo()
+    assert saved(teams) == [names[0]]
+
+    area = reopen(area)
+    assert len(BatchCommit(teams, path, area).recover()) == 3
+    assert saved(teams) == sorted(names)
+    assert not list(teams.glob('*/*.tmp'))
+    assert len(reopen(area)) == 0
+
+
+def test_torn_journal(env, monkeypatch):
+    teams, path, area, names = env
+
+    def crash(self, entries, index):
+        raise Crash
+
+    committer = BatchCommit(teams, path, area)
+    monkeypatch.setattr(BatchCommit, '_apply', crash)
+    with pytest.raises(Crash):
+        committer.commit(committer.stage(names))
+    monkeypatch.undo()
+    data = path.read_bytes()
+
+    for end in range(len(data)):
+        # ジャーナルを書き終える前に止まった場合は何も保存せず、仮記録を残す
+        path.write_bytes(data[:end])
+        assert BatchCommit(teams, path, area).recover() == []
+        assert not path.exists()
+        assert saved(teams) == []
+        assert len(area) == 3
+
+    path.write_bytes(data)
+    assert len(BatchCommit(teams, path, area).recover()) == 3
+    assert saved(teams) == sorted(names)
+
+
+def test_recover_without_journal(env):
+    teams, path, area, _ = env
+    assert BatchCommit(teams, path, area).recover() == []
+    assert len(area) == 3
\ No newline at end of file
@@ -0,0 +1,137 @@
+import random
+import time
+
+import pytest
+
+from conftest import save_match_file
+from landmarks import NOISE, Grid, LandmarkStore, cluster
+from loader import LandmarkWorker
+
+EPS = 0.02
+MIN_PTS = 3
+
+
+def random_points(rng: random.Random, n: int) -> list:
+    """
+    いくつかの塊とまばらな点(追加するごとに塊がつながったり増えたりする)
+    """
+    centers = [(0.2, 0.2), (0.25, 0.22), (0.6, 0.7), (0.8, 0.3)]
+    pts = []
+    for _ in range(n):
+        if rng.random() < 0.2:
+            pts.append((rng.random(), rng.random()))
+        else:
+            cx, cy = rng.choice(centers)
+            pts.append((min(max(rng.gauss(cx, 0.02), 0), 1), min(max(rng.gauss(cy, 0.02), 0), 1)))
+    return pts
+
+
+def check_clusters(xs: list, ys: list, labels: list) -> None:
+    """
+    labelsが全点を一度にクラスタリングした結果と同じか確かめる
+
+    境界点(コア点でない点)はどのクラスタに入るかが走査順で変わるので、
+    コア点の分け方とノイズの点が同じで、境界点は近くのコア点と同じクラスタに入っていることを確かめる
+    """
+    grid = Grid(xs, ys, EPS)
+    expected = [NOISE] * len(xs)
+    cluster(grid, expected, range(len(xs)), 0, MIN_PTS)
+
+    core = [len(list(grid.near(xs[i], ys[i], EPS))) >= MIN_PTS for i in range(len(xs))]
+
+    def partition(values):
+        groups = {}
+        for i, label in enumerate(values):
+            if core[i]:
+                groups.setdefault(label, set()).add(i)
+        return sorted(sorted(group) for group in groups.values())
+
+    assert NOISE not in (labels[i] for i in range(len(xs)) if core[i])
+    assert partition(labels) == partition(expected)
+    assert {i for i, label in enumerate(labels) if label == NOISE} == {i for i, label in enumerate(expected) if label == NOISE}
+    for i, label in enumerate(labels):
+        if label != NOISE and not core[i]:
+            assert any(core[j] and labels[j] == label for j in grid.near(xs[i], ys[i], EPS))
+
+
+@pytest.fixture
+def store(tmp_path, points):
+    return LandmarkStore(tmp_path / 'landmarks', points, EPS, MIN_PTS)
+
+
+def save_matches(teams, rng: random.Random, first: int, n: int) -> list:
+    """
+    1試合4点の試合をn試合保存する
+    """
+    pts = random_points(rng, 4 * n)
+    return [save_match_file(teams, day=first + k + 1, pts=pts[4 * k:4 * k + 4]) for k in range(n)]
+
+
+def check_state(store: LandmarkStore) -> None:
+    state = store._read(store.root / 'Erangel' / 'A.json')
+    check_clusters(state['x'], state['y'], state['labels'])
+    # ランドマークの集計は今のラベルと一致している
+    members = {}
+    for i, label in enumerate(state['labels']):
+        if label != NOISE:
+            members.setdefault(str(label), []).append(i)
+    assert set(state['landmarks']) == set(members)
+    for label, idx in members.items():
+        assert state['landmarks'][label] == pytest.approx(store._summarize(state, idx))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_incremental_matches_full(teams, points, store, seed):
+    rng = random.Random(seed)
+    first = 0
+    for n in (10, 1, 5, 20, 3):
+        records = save_matches(teams, rng, first, n)
+        first += n
+        points.update('Erangel', records)
+        landmarks = store.update('Erangel')['A']
+        check_state(store)
+        assert sum(lm.count for lm in landmarks) == sum(label != NOISE for label in store._read(store.root / 'Erangel' / 'A.json')['labels'])
+
+
+def test_overwritten_match(teams, points, store):
+    rng = random.Random(0)
+    records = save_matches(teams, rng, 0, 20)
+    points.update('Erangel', records)
+    store.update('Erangel')
+    # 上書きされた試合があれば求め直す
+    save_match_file(teams, day=1, pts=[(0.9, 0.9)])
+    points.update('Erangel', records)
+    store.update('Erangel')
+    check_state(store)
+    state = store._read(store.root / 'Erangel' / 'A.json')
+    assert len(state['x']) == 4 * 19 + 1
+
+
+def test_cluster_region_keeps_outside_labels():
+    xs = [0.1, 0.105, 0.11, 0.5, 0.505, 0.51, 0.9]
+    ys = [0.1, 0.1, 0.1, 0.5, 0.5, 0.5, 0.9]
+    grid = Grid(xs, ys, EPS)
+    labels = [NOISE] * len(xs)
+    assert cluster(grid, labels, range(len(xs)), 0, MIN_PTS) == 2
+    assert labels[:3] == [labels[0]] * 3 and labels[3:6] == [labels[3]] * 3
+    assert labels[0] != labels[3] and labels[6] == NOISE
+    before = list(labels)
+    # region外の点のラベルは変えない
+    assert cluster(grid, labels, [3, 4, 5], 5, MIN_PTS) == 6
+    assert labels[:3] == before[:3] and labels[3:6] == [5] * 3
+
+
+def test_worker_loads_full_history(tmp_path, teams, points, store):
+    save_matches(teams, random.Random(0), 0, 20)
+    worker = LandmarkWorker(teams, tmp_path)
+    worker.start(map_name='Erangel', teams=['A'])
+    deadline = time.monotonic() + 10
+    message = None
+    while (message is None or message[0] == 'progress') and time.monotonic() < deadline:
+        time.sleep(0.01)
+        message = worker.poll() or message
+    # 列データに取り込んでいなかった試合も読み込んで求める
+    assert message[0] == 'landmarks'
+    assert message[1]['A'] == store.get('Erangel', 'A')
+    assert points.open('Erangel').rows == 80
+
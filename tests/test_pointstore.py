@@ -0,0 +1,163 @@
+import datetime
+import json
+from array import array
+
+import pytest
+
+from conftest import save_match_file
+from pointstore import COLUMNS, PointStore, file_ranges
+from recordio import load_match
+
+
+def line(n: int, x: float=0.1) -> list:
+    """
+    xから0.01ずつずらしたn点
+    """
+    return [(x + 0.01 * k, 0.5) for k in range(n)]
+
+
+def rows_of(records) -> list:
+    """
+    試合一覧を順に読み込んだときの(x, チーム名, 試合ファイル, 日付, ラウンド数)一覧
+    """
+    rows = []
+    for record in records:
+        for pt in load_match(record.path).pts:
+            rows.append((round(pt['x'] / pt['w'], 5), record.team, str(record.path), record.date.toordinal(), record.rcount))
+    return rows
+
+
+def stored(points) -> list:
+    return [(round(points.x[i], 5), points.teams[points.team[i]], points.files[points.file[i]],
+             points.date[i], points.rcount[i]) for i in range(points.rows)]
+
+
+def check(store: PointStore, expected: list) -> None:
+    points = store.open('Erangel')
+    assert stored(points) == expected
+    # 点のない試合の開始行は使わない
+    assert [r if r[1] else [0, 0] for r in points.ranges] == file_ranges(points.file, points.rows, len(points.files))
+    store.close()
+
+
+def test_append(teams, points):
+    first = [save_match_file(teams, 'A', day=1, pts=line(3)), save_match_file(teams, 'B', day=2, pts=line(2))]
+    points.update('Erangel', first)
+    check(points, rows_of(first))
+    second = [save_match_file(teams, 'A', day=3, rcount=2, pts=line(4)), save_match_file(teams, 'C', day=4, pts=line(0))]
+    # 反映済みの試合を含めても追記分だけ読み込む
+    points.update('Erangel', first + second)
+    check(points, rows_of(first + second))
+    assert points.open('Erangel').generation == 0
+
+
+def test_overwrite(teams, points):
+    records = [save_match_file(teams, 'A', day=day, pts=line(3)) for day in (1, 2, 3)]
+    points.update('Erangel', records)
+    save_match_file(teams, 'A', day=2, pts=line(1, 0.7))
+    points.update('Erangel', records)
+    # 上書きされた試合の行は取り除いて末尾に読み込み直す
+    check(points, rows_of([records[0], records[2], records[1]]))
+    assert points.open('Erangel').generation == 1
+
+
+def test_truncate_unfinished_rows(teams, points):
+    first = [save_match_file(teams, 'A', day=1, pts=line(3))]
+    points.update('Erangel', first)
+    # 列ファイルに書いた後、meta.jsonを書く前に止まった状態にする
+    directory = points.root / 'Erangel'
+    for name, code in COLUMNS:
+        with open(directory / f'{name}.{code}', 'ab') as f:
+            f.write(b'\xff' * 37)
+    second = [save_match_file(teams, 'B', day=2, pts=line(2))]
+    points.update('Erangel', second)
+    check(points, rows_of(first + second))
+    for name, code in COLUMNS:
+        assert (directory / f'{name}.{code}').stat().st_size == 5 * array(code).itemsize
+
+
+def test_progress_cancel(teams, points):
+    records = [save_match_file(teams, 'A', day=day, pts=line(2)) for day in (1, 2, 3, 4)]
+    points.update('Erangel', records, progress=lambda n, total: n < 2)
+    check(points, rows_of(records[:2]))
+    points.update('Erangel', records)
+    check(points, rows_of(records))
+
+
+def test_legacy_meta_without_ranges(teams, points):
+    records = [save_match_file(teams, 'A', day=1, pts=line(3)), save_match_file(teams, 'B', day=2, pts=line(2))]
+    points.update('Erangel', records)
+    meta_path = points.root / 'Erangel' / 'meta.json'
+    meta = json.loads(meta_path.read_text(encoding='utf-8'))
+    del meta['ranges']
+    meta_path.write_text(json.dumps(meta), encoding='utf-8')
+    check(points, rows_of(records))
+    more = [save_match_file(teams, 'C', day=3, pts=line(1))]
+    points.update('Erangel', records + more)
+    check(points, rows_of(records + more))
+
+
+def test_where(teams, points):
+    records = [save_match_file(teams, 'A', day=1, pts=line(2), match_name='final'),
+               save_match_file(teams, 'B', day=2, rcount=2, pts=line(3)),
+               save_match_file(teams, 'A', day=3, rcount=2, pts=line(1), match_name='final'),
+               save_match_file(teams, 'B', day=4, pts=line(0))]
+    points.update('Erangel', records)
+    opened = points.open('Erangel')
+    assert opened.where() == list(range(6))
+    assert opened.where(teams=['A']) == [0, 1, 5]
+    assert opened.where(match_names=['final'], rcount=2) == [5]
+    assert opened.where(start=datetime.date(2024, 1, 2).toordinal(), end=datetime.date(2024, 1, 2).toordinal()) == [2, 3, 4]
+    # 試合ファイルの指定は順序によらず行順で返し、点のない試合・列データにない試合は除く
+    paths = [records[2].path, records[0].path, records[3].path, teams / 'missing.lmk']
+    assert opened.where(paths=paths) == [0, 1, 5]
+    assert opened.where(paths=paths, teams=['B']) == []
+    ranges = opened.row_ranges(paths)
+    assert ranges == [(0, 2), (5, 6)]
+    assert list(opened.take('rcount', ranges)) == [1, 1, 2]
+    assert opened.take('x', ranges).tolist() == pytest.approx([0.1, 0.11, 0.1])
+
+
+def test_shared_lock(tmp_path):
+    assert PointStore(tmp_path / 'points').lock is PointStore(tmp_path / 'points' / '..' / 'points').lock
+    assert PointStore(tmp_path / 'points').lock is not PointStore(tmp_path / 'other').lock
+
+
+def test_skip_unreadable(teams, points):
+    records = [save_match_file(teams, 'A', day=day, pts=line(2)) for day in (1, 2, 3)]
+    # 書きかけで止まった試合ファイル
+    body = records[1].path.read_bytes()
+    records[1].path.write_bytes(body[:-3])
+    assert points.update('Erangel', records) == [records[1].path]
+    check(points, rows_of([records[0], records[2]]))
+    # 更新されるまで読み込み直さない
+    assert points.update('Erangel', records) == []
+    records[1].path.write_bytes(body)
+    assert points.update('Erangel', records) == []
+    check(points, rows_of([records[0], records[2], records[1]]))
+
+
+def test_skip_missing(teams, points):
+    records = [save_match_file(teams, 'A', day=1, pts=line(2)), save_match_file(teams, 'B', day=2, pts=line(1))]
+    records[0].path.unlink()
+    assert points.update('Erangel', records) == [records[0].path]
+    check(points, rows_of(records[1:]))
+
+
+def test_update_in_chunks(tmp_path, teams):
+    store = PointStore(tmp_path / 'points', chunk=2)
+    records = [save_match_file(teams, 'A', day=day, pts=line(1)) for day in (1, 2, 3, 4, 5)]
+    meta_path = store.root / 'Erangel' / 'meta.json'
+    saved_rows = []
+
+    def progress(n: int, total: int) -> bool:
+        assert total == 5
+        # chunk件ごとにmeta.jsonまで書いてからロックを手放す
+        saved_rows.append(json.loads(meta_path.read_text(encoding='utf-8'))['rows'] if meta_path.exists() else 0)
+        return n < 4
+
+    store.update('Erangel', records, progress)
+    assert saved_rows == [0, 0, 2, 2, 4]
+    check(store, rows_of(records[:4]))
+    store.update('Erangel', records)
+    check(store, rows_of(records))
@@ -0,0 +1,111 @@
+import datetime
+import random
+import threading
+from pathlib import Path
+
+import pytest
+
+from catalog import MatchRecord
+from conftest import save_match_file
+from pointstore import PointStore
+from query import QueryEngine, latest_per_team
+from recordio import EXT
+
+
+def make_records(n: int, seed: int=0) -> list:
+    """
+    チーム・日付・ラウンドがばらばらの試合一覧(同じ日付・ラウンドの試合も含む)
+    """
+    rng = random.Random(seed)
+    base = datetime.date(2024, 1, 1)
+    records = []
+    for i in range(n):
+        team = f'team{rng.randrange(4)}'
+        date = base + datetime.timedelta(days=rng.randrange(30))
+        rcount = rng.randrange(1, 4)
+        records.append(MatchRecord(team, f'scrim{i}', 'Erangel', date, rcount, Path(f'{i}.lmk')))
+    return records
+
+
+def expected(records: list, num: int, mode: str) -> list:
+    """
+    グループごとに全試合を並べ替えて選ぶ(latest_per_teamと同じ結果になるはずのもの)
+    """
+    groups = {}
+    for i, record in enumerate(records):
+        group = (record.team, record.rcount) if mode == 'round' else (record.team,)
+        groups.setdefault(group, []).append((record.date, record.rcount, i, record))
+    selected = []
+    for items in groups.values():
+        items.sort(reverse=True)
+        if num is not None and mode == 'window':
+            oldest = items[0][0] - datetime.timedelta(days=num - 1)
+            items = [item for item in items if item[0] >= oldest]
+        elif num is not None:
+            items = items[:num]
+        selected.extend(item[3] for item in items)
+    return selected
+
+
+@pytest.mark.parametrize('mode', ['last', 'window', 'round'])
+@pytest.mark.parametrize('num', [None, 1, 3, 10])
+def test_latest_per_team(mode, num):
+    records = make_records(200)
+    assert latest_per_team(records, num, mode) == expected(records, num, mode)
+
+
+@pytest.mark.parametrize('mode', ['last', 'window', 'round'])
+def test_latest_per_team_empty(mode):
+    assert latest_per_team([], 3, mode) == []
+    assert latest_per_team(make_records(10), 0, mode) == []
+
+
+def test_latest_per_team_window_days():
+    team = [MatchRecord('a', f's{d}', 'Erangel', datetime.date(2024, 1, d), 1, Path(f'{d}.lmk')) for d in (1, 5, 6, 7)]
+    # 最新の試合日(7日)から3日間
+    assert [record.date.day for record in latest_per_team(team, 3, 'window')] == [7, 6, 5]
+
+
+def test_latest_per_team_same_day_orders_by_round():
+    records = [MatchRecord('a', 's', 'Erangel', datetime.date(2024, 1, 1), r, Path(f'{r}.lmk')) for r in (2, 3, 1)]
+    assert [record.rcount for record in latest_per_team(records, 2, 'last')] == [3, 2]
+
+@pytest.fixture
+def engine(tmp_path, teams, catalog):
+    for day in range(1, 6):
+        save_match_file(teams, day=day, pts=[(0.1 * day, 0.5)])
+    engine = QueryEngine(catalog, PointStore(tmp_path / 'points', chunk=2))
+    yield engine
+    engine.close()
+
+
+def test_inspect(engine):
+    found = engine.inspect('Erangel.jpg', 0.3, 0.5, 0.01)
+    assert found == [(datetime.date(2024, 1, 3).toordinal(), 1, 'A', 'scrim')]
+
+
+def test_inspect_cancel(engine):
+    cancel = threading.Event()
+
+    def progress(done: int, total: int) -> bool:
+        if done == 2:
+            cancel.set()
+        return not cancel.is_set()
+
+    assert engine.inspect('Erangel', 0.3, 0.5, 0.01, progress=progress, cancel=cancel) is None
+    # 取り消す前に読み込んだまとまりは保存してある
+    assert engine.points.open('Erangel').rows == 2
+    assert len(engine.inspect('Erangel', 0.3, 0.5, 0.01)) == 1
+
+
+def test_run_reports_mtime_of_overwritten_file(engine):
+    first = engine.run('Erangel')
+    path = engine.catalog.teams / 'A' / f'A_scrim_Erangel_2024-01-03_R1{EXT}'
+    file_id = first.files.index(str(path))
+    assert first.mtimes[file_id] == path.stat().st_mtime_ns
+    save_match_file(engine.catalog.teams, day=3, pts=[(0.9, 0.5)])
+    second = engine.run('Erangel')
+    # 上書きされた試合ファイルはIDが同じまま更新日時が変わる(閲覧画面はこれで描き直す)
+    assert second.files.index(str(path)) == file_id
+    assert second.mtimes[file_id] == path.stat().st_mtime_ns != first.mtimes[file_id]
+
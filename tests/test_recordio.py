@@ -0,0 +1,127 @@
+import datetime
+import io
+import pickle
+
+import pytest
+
+from match import Match
+from migrate import migrate, upgrade
+from recordio import (_HEADER, _POINT, _RECORD, _STR, EXT, MAGIC, VERSION, RecordFormatError,
+                      load_match, read_matches, read_version, save_match, write_matches)
+
+
+def make_match(team: str='チームA', rcount: int=3) -> Match:
+    pts = [{'x': 100.0, 'y': 250.0, 'w': 800, 'h': 800}, {'x': 799.5, 'y': 0.0, 'w': 800, 'h': 800}]
+    return Match(team, 'scrim1', 'Erangel', datetime.date(2024, 5, 6), rcount, pts)
+
+
+def write_v1(f, matches) -> None:
+    """
+    version 1(表示サイズとピクセル座標)の形式で書き込む
+    """
+    f.write(_HEADER.pack(MAGIC, 1))
+    for m in matches:
+        for s in (m.team, m.match_name, m.map_name):
+            b = s.encode('utf-8')
+            f.write(_STR.pack(len(b)) + b)
+        f.write(_RECORD.pack(m.date.toordinal(), m.rcount, len(m.pts)))
+        for pt in m.pts:
+            f.write(_POINT.pack(pt['x'], pt['y'], pt['w'], pt['h']))
+
+
+def normalized(m: Match) -> list:
+    return [(pt['x'] / pt['w'], pt['y'] / pt['h']) for pt in m.pts]
+
+
+def assert_same(a: Match, b: Match) -> None:
+    assert (a.team, a.match_name, a.map_name, a.date, a.rcount) == (b.team, b.match_name, b.map_name, b.date, b.rcount)
+    assert normalized(a) == pytest.approx(normalized(b), abs=1e-6)
+
+
+def test_v2_round_trip():
+    matches = [make_match(rcount=r) for r in (1, 2)] + [Match('B', 's', 'Miramar', datetime.date(2024, 1, 1), 1, [])]
+    f = io.BytesIO()
+    assert write_matches(f, matches) == 3
+    assert f.getvalue()[:4] == _HEADER.pack(MAGIC, VERSION)
+    f.seek(0)
+    loaded = list(read_matches(f))
+    assert len(loaded) == 3
+    for a, b in zip(matches, loaded):
+        assert_same(a, b)
+
+
+def test_v1_read():
+    m = make_match()
+    f = io.BytesIO()
+    write_v1(f, [m])
+    f.seek(0)
+    loaded, = read_matches(f)
+    # version 1は表示サイズとピクセル座標のまま読み込む
+    assert loaded.pts == m.pts
+    assert_same(m, loaded)
+
+
+@pytest.mark.parametrize('data, message', [
+    (b'', 'ヘッダー'),
+    (b'XYZ\x02', '試合データファイルではありません'),
+    (_HEADER.pack(MAGIC, 9), '未対応'),
+])
+def test_bad_header(data, message):
+    with pytest.raises(RecordFormatError, match=message):
+        list(read_matches(io.BytesIO(data)))
+
+
+def test_truncated():
+    f = io.BytesIO()
+    write_matches(f, [make_match()])
+    data = f.getvalue()
+    for end in range(_HEADER.size + 1, len(data)):
+        with pytest.raises(RecordFormatError):
+            list(read_matches(io.BytesIO(data[:end])))
+
+
+def test_save_and_load(tmp_path):
+    path = tmp_path / f'A_scrim1_Erangel_2024-05-06_R3{EXT}'
+    save_match(path, make_match())
+    assert read_version(path) == VERSION
+    assert_same(make_match(), load_match(path))
+
+
+def test_migrate(tmp_path):
+    team = tmp_path / 'teams' / 'A'
+    team.mkdir(parents=True)
+    for name, m in (('a', make_match()), ('b', make_match(rcount=5))):
+        with open(team / f'{name}.pkl', 'wb') as f:
+            pickle.dump(m, f)
+
+    done = []
+    assert migrate([tmp_path / 'teams', tmp_path / 'missing'], progress=done.append) == 2
+    assert len(done) == 2
+    assert not list(team.glob('*.pkl'))
+    assert_same(make_match(), load_match(team / f'a{EXT}'))
+    assert_same(make_match(rcount=5), load_match(team / f'b{EXT}'))
+    assert not list(team.glob('*.tmp'))
+
+
+def test_migrate_keep(tmp_path):
+    with open(tmp_path / 'a.pkl', 'wb') as f:
+        pickle.dump(make_match(), f)
+    assert migrate([tmp_path], keep=True) == 1
+    assert (tmp_path / 'a.pkl').exists()
+    assert read_version(tmp_path / f'a{EXT}') == VERSION
+
+
+def test_upgrade(tmp_path):
+    old = tmp_path / f'old{EXT}'
+    with open(old, 'wb') as f:
+        write_v1(f, [make_match()])
+    save_match(tmp_path / f'new{EXT}', make_match('B'))
+    new_mtime = (tmp_path / f'new{EXT}').stat().st_mtime_ns
+
+    assert read_version(old) == 1
+    assert upgrade([tmp_path]) == 1
+    assert read_version(old) == VERSION
+    assert_same(make_match(), load_match(old))
+    # 最新の版のファイルは書き直さない
+    assert (tmp_path / f'new{EXT}').stat().st_mtime_ns == new_mtime
+    assert upgrade([tmp_path]) == 0
\ No newline at end of file
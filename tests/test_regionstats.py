@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from catalog import Catalog
+from conftest import save_match_file
+from regionstats import RegionStatsStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return RegionStatsStore(tmp_path / 'stats')
+
+
+def build(catalog: Catalog, store: RegionStatsStore) -> None:
+    """
+    初めて区画統計を表示したときと同じく、記録済みの試合から集計を作る
+    """
+    catalog.sync()
+    store.ensure(catalog, 'Erangel', ['A'])
+
+
+def summary(store: RegionStatsStore) -> dict:
+    return json.loads((store.root / 'Erangel' / 'A.json').read_text(encoding='utf-8'))
+
+
+def test_files_kept_out_of_summary(teams, catalog, store):
+    records = [save_match_file(teams, day=day, pts=[(0.05, 0.05)]) for day in (1, 2, 3)]
+    build(catalog, store)
+    # 表示時に読む集計には試合ごとの内訳を含めない
+    assert 'files' not in summary(store)
+    files = json.loads((store.root / 'Erangel' / 'A.files.json').read_text(encoding='utf-8'))
+    assert set(files) == {str(record.path) for record in records}
+    assert store.get('Erangel', 'A').top() == [('A1', 3, 1.0)]
+    # 上書きされた試合は差し替える
+    save_match_file(teams, day=2, pts=[(0.95, 0.05)])
+    store.add(records)
+    assert store.get('Erangel', 'A').top() == [('A1', 2, 2 / 3), ('H1', 1, 1 / 3)]
+
+
+def test_ensure_moves_legacy_files(teams, catalog, store):
+    records = [save_match_file(teams, day=day, pts=[(0.05, 0.05)]) for day in (1, 2)]
+    build(catalog, store)
+    # 以前の版は内訳を集計と同じファイルに持っていた
+    files_path = store.root / 'Erangel' / 'A.files.json'
+    legacy = dict(summary(store), files=json.loads(files_path.read_text(encoding='utf-8')))
+    (store.root / 'Erangel' / 'A.json').write_text(json.dumps(legacy), encoding='utf-8')
+    files_path.unlink()
+    catalog.sync()
+    store.ensure(catalog, 'Erangel', ['A'])
+    assert 'files' not in summary(store)
+    assert files_path.exists()
+    store.add(records + [save_match_file(teams, day=3, pts=[(0.05, 0.05)])])
+    assert store.get('Erangel', 'A').matches() == 3
+
+
+def test_ensure_rebuilds_after_interrupted_write(teams, catalog, store):
+    records = [save_match_file(teams, day=day, pts=[(0.05, 0.05)]) for day in (1, 2)]
+    build(catalog, store)
+    # 内訳を書いた後、集計を書く前に止まった状態
+    (store.root / 'Erangel' / 'A.json').unlink()
+    catalog.sync()
+    store.ensure(catalog, 'Erangel', ['A'])
+    assert store.get('Erangel', 'A').matches() == 2
+
+
+def test_skip_unreadable(teams, catalog, store):
+    records = [save_match_file(teams, day=day, pts=[(0.05, 0.05)]) for day in (1, 2)]
+    records[1].path.write_bytes(b'LMK')
+    build(catalog, store)
+    assert store.get('Erangel', 'A').matches() == 1
+    save_match_file(teams, day=2, pts=[(0.05, 0.05)])
+    store.add(records)
+    assert store.get('Erangel', 'A').matches() == 2
+
+
+def test_add_before_first_view(teams, catalog, store):
+    records = [save_match_file(teams, day=day, pts=[(0.05, 0.05)]) for day in range(1, 6)]
+    # 集計を作る前に記録した試合だけで集計を作らない
+    store.add([save_match_file(teams, day=6, pts=[(0.05, 0.05)])])
+    assert not (store.root / 'Erangel' / 'A.json').exists()
+    build(catalog, store)
+    assert store.get('Erangel', 'A').matches() == 6
+    store.add(records + [save_match_file(teams, day=7, pts=[(0.05, 0.05)])])
+    assert store.get('Erangel', 'A').matches() == 7
+
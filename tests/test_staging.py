@@ -0,0 +1,113 @@
+import datetime
+
+import pytest
+
+import staging
+from match import Match
+from recordio import EXT, save_match
+from staging import COMPACT_MIN, MAGIC, StagingArea
+
+
+def make_match(rcount: int) -> Match:
+    pts = [{'x': 10.0 * rcount, 'y': 20.0, 'w': 800, 'h': 800}]
+    return Match('A', 'scrim', 'Erangel', datetime.date(2024, 1, 1), rcount, pts)
+
+
+def name(rcount: int) -> str:
+    return f'A_scrim_Erangel_2024-01-01_R{rcount}{EXT}'
+
+
+def rcounts(area: StagingArea) -> list:
+    return [area.get(n).rcount for n in area.names()]
+
+
+def test_reopen(tmp_path):
+    area = StagingArea(tmp_path)
+    for r in (1, 2, 3):
+        area.put(name(r), make_match(r))
+    area.remove([name(2), 'missing'])
+    area.put(name(1), make_match(1))
+    area.close()
+
+    area = StagingArea(tmp_path)
+    # 置き換えた仮記録は後ろに並ぶ
+    assert rcounts(area) == [3, 1]
+    area.close()
+
+
+def test_torn_tail(tmp_path):
+    area = StagingArea(tmp_path)
+    for r in (1, 2):
+        area.put(name(r), make_match(r))
+    area.flush()
+    size = area.path.stat().st_size
+    area.put(name(3), make_match(3))
+    area.close()
+    data = area.path.read_bytes()
+
+    for end in range(size, len(data)):
+        # 最後の操作を書きかけで止まった状態にする
+        area.path.write_bytes(data[:end])
+        area = StagingArea(tmp_path)
+        assert rcounts(area) == [1, 2]
+        assert area.path.stat().st_size == size
+        # 捨てた末尾の後ろではなく、読めたところから追記する
+        area.put(name(4), make_match(4))
+        area.close()
+        area = StagingArea(tmp_path)
+        assert rcounts(area) == [1, 2, 4]
+        area.close()
+
+
+def test_not_journal(tmp_path):
+    (tmp_path / 'staging.journal').write_bytes(b'XXXX')
+    with pytest.raises(ValueError):
+        StagingArea(tmp_path)
+
+
+def test_compact(tmp_path):
+    area = StagingArea(tmp_path)
+    for _ in range(COMPACT_MIN + 2):
+        area.put(name(1), make_match(1))
+    area.close()
+    size = area.path.stat().st_size
+
+    area = StagingArea(tmp_path)
+    assert rcounts(area) == [1]
+    assert area.path.stat().st_size < size
+    area.close()
+    assert rcounts(StagingArea(tmp_path)) == [1]
+
+
+def test_legacy_files(tmp_path):
+    save_match(tmp_path / name(1), make_match(1))
+    (tmp_path / f'broken{EXT}').write_bytes(b'not a match')
+    area = StagingArea(tmp_path)
+    assert rcounts(area) == [1]
+    assert not (tmp_path / name(1)).exists()
+    area.close()
+    assert rcounts(StagingArea(tmp_path)) == [1]
+
+
+def test_write_error(tmp_path, monkeypatch):
+    area = StagingArea(tmp_path)
+    area.put(name(1), make_match(1))
+    area.flush()
+
+    def fail(fd):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(staging.os, 'fsync', fail)
+    area.put(name(2), make_match(2))
+    # 詰め直しにも失敗すれば呼び出し元に伝える
+    with pytest.raises(OSError):
+        area.flush()
+    monkeypatch.undo()
+    # 書き込めるようになればメモリ上の仮記録から詰め直す
+    area.put(name(3), make_match(3))
+    area.close()
+
+    area = StagingArea(tmp_path)
+    assert rcounts(area) == [1, 2, 3]
+    assert area.path.read_bytes()[:len(MAGIC)] == MAGIC
+    area.close()
\ No newline at end of file